@@ -31,8 +31,10 @@ class Category:
         try:
             self.category_info = getCategoryInfo(filename)
             self.category_info.sort(rankcmp)
+            self._compileRules()
         except:
             self.category_info = []
+            self._compileRules()
             if DEBUG:
                 print_exc()
 
@@ -207,7 +209,29 @@ class Category:
         # torrent_dict is the  dict of 
         # a torrent file
         # return value: list of category the torrent belongs to
+        files_list, tracker, comment = self._getTorrentInfo(torrent_dict)
+        return self.calculateCategoryNonDict(files_list, display_name, tracker, comment)
 
+    # calculate the categories of many torrents at once
+    # torrents is a list of (torrent_dict, display_name) tuples
+    # return value: list with the category list of each torrent
+    def calculateCategories(self, torrents):
+        # file names that occur in several torrents, such as sample.avi or
+        # readme.txt, are judged once
+        file_cache = {}
+        categories = []
+        for torrent_dict, display_name in torrents:
+            # a malformed torrent must not take the rest of the batch with it
+            try:
+                files_list, tracker, comment = self._getTorrentInfo(torrent_dict)
+                categories.append(self._calculateCategory(files_list, display_name, tracker, comment, file_cache))
+            except:
+                print >> sys.stderr, 'Category: Exception while categorizing torrent: %s' % repr(display_name)
+                print_exc()
+                categories.append(['other'])
+        return categories
+
+    def _getTorrentInfo(self, torrent_dict):
         files_list = []
         try:                                
             # the multi-files mode
@@ -222,10 +246,13 @@ class Category:
             tracker = torrent_dict.get('announce-list',[['']])[0][0]
             
         comment = torrent_dict.get('comment')
-        return self.calculateCategoryNonDict(files_list, display_name, tracker, comment)
+        return files_list, tracker, comment
 
 
     def calculateCategoryNonDict(self, files_list, display_name, tracker, comment):
+        return self._calculateCategory(files_list, display_name, tracker, comment, {})
+
+    def _calculateCategory(self, files_list, display_name, tracker, comment, file_cache):
         # Check xxx
         try:
             
@@ -238,10 +265,9 @@ class Category:
         torrent_category = None
         # filename_list ready
         strongest_cat = 0.0
-        for category in self.category_info:    # for each category
-            (decision, strength) = self.judge(category, files_list, display_name)
+        for index, (decision, strength) in enumerate(self._judgeAll(files_list, display_name, file_cache)):
             if decision and (strength > strongest_cat):
-                torrent_category = [category['name']]
+                torrent_category = [self.category_info[index]['name']]
                 strongest_cat = strength
         
         if torrent_category == None:
@@ -249,6 +275,100 @@ class Category:
         
         return torrent_category
 
+    # compile category_info into lookup tables, _judgeAll uses these to judge
+    # a torrent for all categories in a single pass over its files
+    def _compileRules(self):
+        self._keyword_rules = {}    # keyword: [(category index, weight)]
+        self._suffix_rules = {}     # suffix: [category index]
+        self._size_rules = []       # (minfilesize, maxfilesize) per category
+        self._match_rules = []      # (matchpercentage, strength or None) per category
+        
+        for index, category in enumerate(self.category_info):
+            for keyword, weight in category['keywords'].iteritems():
+                self._keyword_rules.setdefault(keyword, []).append((index, weight))
+            for suffix in category['suffix']:
+                if index not in self._suffix_rules.get(suffix, []):
+                    self._suffix_rules.setdefault(suffix, []).append(index)
+            self._size_rules.append((category['minfilesize'], category['maxfilesize']))
+            self._match_rules.append((category['matchpercentage'], category.get('strength')))
+        
+        # the lengths of the suffixes, longest first, a file name matches a
+        # suffix when its last length characters are in _suffix_rules
+        self._suffix_lengths = sorted(set(len(suffix) for suffix in self._suffix_rules), reverse = True)
+    
+    # returns {category index: factor} for the categories with keywords in words,
+    # the factor is the product of 1 - weight of these keywords
+    def _keywordFactors(self, words):
+        factors = {}
+        for word in set(words):
+            for index, weight in self._keyword_rules.get(word, ()):
+                factors[index] = factors.get(index, 1.0) * (1 - weight)
+        return factors
+    
+    # returns the (suffix matches, keyword factors) of a file name
+    def _judgeFile(self, name):
+        name = name.lower()
+        matches = set()
+        for length in self._suffix_lengths:
+            matches.update(self._suffix_rules.get(length and name[-length:] or '', ()))
+        return matches, self._keywordFactors(self._getWords(name))
+    
+    # judge a torrent for all categories at once, gives the same results as
+    # judge for each category in category_info. file_cache maps file names to
+    # the result of _judgeFile
+    # return list of (bool, strength)
+    def _judgeAll(self, files_list, display_name, file_cache):
+        results = [(False, 0)] * len(self.category_info)
+        
+        # judge display name keywords
+        undecided = []
+        factors = self._keywordFactors(self._getWords(display_name.lower()))
+        for index, (matchpercentage, strength) in enumerate(self._match_rules):
+            factor = factors.get(index, 1.0)
+            if (1 - factor) > 0.5:
+                if strength is not None:
+                    results[index] = (True, strength)
+                else:
+                    results[index] = (True, (1 - factor))
+            else:
+                undecided.append(index)
+        
+        if not undecided:
+            return results
+        
+        # judge each file
+        matchSizes = dict.fromkeys(undecided, 0)
+        totalSize = 1e-19
+        for name, length in files_list:
+            totalSize += length
+            
+            judged = file_cache.get(name)
+            if judged is None:
+                judged = file_cache[name] = self._judgeFile(name)
+            matches, factors = judged
+            
+            for index in undecided:
+                # judge file size
+                minfilesize, maxfilesize = self._size_rules[index]
+                if ( length < minfilesize ) or \
+                    (maxfilesize > 0 and length > maxfilesize ):
+                    continue
+                
+                # judge file suffix and keywords
+                if index in matches or factors.get(index, 1.0) < 0.5:
+                    matchSizes[index] += length
+        
+        # match file
+        for index in undecided:
+            matchpercentage, strength = self._match_rules[index]
+            if (matchSizes[index] / totalSize) >= matchpercentage:
+                if strength is not None:
+                    results[index] = (True, strength)
+                else:
+                    results[index] = (True, (matchSizes[index] / totalSize))
+        
+        return results
+
     # judge whether a torrent file belongs to a certain category
     # return bool
     def judge(self, category, files_list, display_name = ''):
@@ -416,9 +416,9 @@ class TriblerLaunchMany(Thread):
 
         if sys.argv[0].endswith("dispersy-channel-booster.py"):
             dispersy_cls = __import__("Tribler.Main.dispersy-channel-booster", fromlist=["BoosterDispersy"]).BoosterDispersy
-            self.dispersy = dispersy_cls.get_instance(self.dispersy_thread, sqlite_db_path, singleton_placeholder=Dispersy)
+            self.dispersy = dispersy_cls.get_instance(self.dispersy_thread, sqlite_db_path, config['dispersy_verifier_processes'], singleton_placeholder=Dispersy)
         else:
-            self.dispersy = Dispersy.get_instance(self.dispersy_thread, sqlite_db_path)
+            self.dispersy = Dispersy.get_instance(self.dispersy_thread, sqlite_db_path, config['dispersy_verifier_processes'])
 
         self.dispersy.socket = DispersySocket(self.rawserver, self.dispersy, config['dispersy_port'])
 
@@ -791,6 +791,8 @@ class TriblerLaunchMany(Thread):
             self.udppuncture_handler.shutdown()
         if self.dispersy_thread:
             self.dispersy_thread.stop(timeout=2.0)
+        if self.dispersy:
+            self.dispersy.stop()
         # SWIFTPROC
         if self.spm is not None:
             self.spm.early_shutdown()
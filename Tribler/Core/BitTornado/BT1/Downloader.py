@@ -296,9 +296,7 @@ class SingleDownload():
         self.last2 = clock()
         self.measure.update_rate(length)
         # Update statistic gatherer
-        status = get_status_holder("LivingLab")
-        s_download = status.get_or_create_status_element("downloaded",0)
-        s_download.inc(length)
+        self.downloader.download_counter.inc(length)
         
         self.short_term_measure.update_rate(length)
         self.downloader.measurefunc(length)
@@ -731,6 +729,7 @@ class Downloader:
         # from Tribler.Core.Statistics.StatusReporter import get_reporter_instance
         # self._event_reporter = get_reporter_instance()
         self._event_reporter = get_status_holder("LivingLab")
+        self.download_counter = self._event_reporter.get_counter("downloaded")
 
         # check periodicaly
         self.scheduler(self.dlr_periodic_check, 1)
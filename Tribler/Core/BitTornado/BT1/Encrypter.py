@@ -4,7 +4,6 @@
 
 import sys
 from base64 import b64encode
-from cStringIO import StringIO
 from binascii import b2a_hex
 from socket import error as socketerror
 from urllib import quote
@@ -129,7 +128,9 @@ class Connection:
         self.complete = False
         self.keepalive = lambda: None
         self.closed = False
-        self.buffer = StringIO()
+        # chunks of a partially received message and their total length
+        self.buffer = []
+        self.buffer_len = 0
 # overlay        
         self.dns = dns
         self.support_extend_messages = False
@@ -370,19 +371,39 @@ class Connection:
             self.connection.write(message)    # SingleSocket
 
     def data_came_in(self, connection, s):
+        """ Split the received data into the pieces announced by next_len.
+
+        Each piece is sliced out of s exactly once, using an offset
+        instead of re-slicing the remainder, so a read containing many
+        messages is handled in linear time. Only a message that spans
+        several reads is buffered, and it is joined once it is complete.
+        """
         self.Encoder.measurefunc(len(s))
+        pos = 0
+        end = len(s)
         while 1:
             if self.closed:
                 return
-            i = self.next_len - self.buffer.tell()
-            if i > len(s):
-                self.buffer.write(s)
-                return
-            self.buffer.write(s[:i])
-            s = s[i:]
-            m = self.buffer.getvalue()
-            self.buffer.reset()
-            self.buffer.truncate()
+            if self.buffer_len:
+                i = self.next_len - self.buffer_len
+                if i > end - pos:
+                    self.buffer.append(s[pos:])
+                    self.buffer_len += end - pos
+                    return
+                self.buffer.append(s[pos:pos + i])
+                pos += i
+                m = "".join(self.buffer)
+                self.buffer = []
+                self.buffer_len = 0
+            else:
+                i = self.next_len
+                if i > end - pos:
+                    if pos < end:
+                        self.buffer.append(s[pos:])
+                        self.buffer_len = end - pos
+                    return
+                m = s[pos:pos + i]
+                pos += i
             try:
                 x = self.next_func(m)
             except:
@@ -0,0 +1,136 @@
+# see LICENSE.txt for license information
+
+import sys
+from threading import Thread, Lock, Event
+from Queue import Queue, Empty
+from traceback import print_exc
+
+from Tribler.Core.Utilities.Crypto import sha
+
+try:
+    True
+except:
+    True = 1
+    False = 0
+
+DEBUG = False
+
+class HashChecker:
+    """ Reads and hashes the pieces that StorageWrapper wants to check on
+    worker threads, so the network thread only has to process the results.
+
+    Consecutive pieces are read in runs of up to readsize bytes, giving
+    large sequential reads. Storage serializes the reads, but the hashing
+    runs in parallel because sha releases the GIL for large inputs.
+
+    Results are handed out in the order of the pieces passed in, as
+    (piece, digest, lastlen_digest, error) tuples. lastlen_digest is the
+    hash of the first lastlen bytes of the piece, which StorageWrapper
+    needs to find a misplaced last piece.
+    """
+    def __init__(self, storage, pieces, piece_size, piecelen, lastlen,
+                 numthreads = 2, readsize = 4 * 1048576, flag = None):
+        self.storage = storage
+        self.piece_size = piece_size
+        self.piecelen = piecelen
+        self.lastlen = lastlen
+        self.flag = flag
+        self.stopped = Event()
+
+        # split the pieces in runs of consecutive pieces
+        self.order = list(pieces)
+        self.runs = Queue()
+        run = []
+        runlength = 0
+        for piece in self.order:
+            length = piecelen(piece)
+            if run and (run[-1] + 1 != piece or runlength + length > readsize):
+                self.runs.put(run)
+                run = []
+                runlength = 0
+            run.append(piece)
+            runlength += length
+        if run:
+            self.runs.put(run)
+
+        self.lock = Lock()
+        self.ready = Event()
+        self.results = {}
+        self.cursor = 0
+
+        self.threads = []
+        for i in xrange(max(1, numthreads)):
+            t = Thread(target = self._run, name = "HashChecker-%d" % i)
+            t.setDaemon(True)
+            self.threads.append(t)
+        for t in self.threads:
+            t.start()
+
+    def _is_stopped(self):
+        return self.stopped.isSet() or (self.flag is not None and self.flag.isSet())
+
+    def _run(self):
+        while not self._is_stopped():
+            try:
+                run = self.runs.get_nowait()
+            except Empty:
+                return
+            results = []
+            try:
+                first = run[0]
+                length = sum([self.piecelen(piece) for piece in run])
+                data = self.storage.read(self.piece_size * first, length)
+                try:
+                    array = data[:]
+                    offset = 0
+                    for piece in run:
+                        piecelen = self.piecelen(piece)
+                        sh = sha(buffer(array, offset, self.lastlen))
+                        sp = sh.digest()
+                        sh.update(buffer(array, offset + self.lastlen, piecelen - self.lastlen))
+                        results.append((piece, sh.digest(), sp, None))
+                        offset += piecelen
+                finally:
+                    data.release()
+            except Exception, e:
+                if DEBUG:
+                    print_exc()
+                results = [(piece, None, None, e) for piece in run]
+            self.lock.acquire()
+            try:
+                for result in results:
+                    self.results[result[0]] = result
+            finally:
+                self.lock.release()
+            self.ready.set()
+
+    def wait(self, timeout):
+        """ Wait at most timeout seconds for the next result in piece
+        order to become available. """
+        if self.done():
+            return
+        self.lock.acquire()
+        available = self.order[self.cursor] in self.results
+        if not available:
+            self.ready.clear()
+        self.lock.release()
+        if not available:
+            self.ready.wait(timeout)
+
+    def get_results(self):
+        """ Returns the results that are available, in piece order. """
+        ready = []
+        self.lock.acquire()
+        try:
+            while self.cursor < len(self.order) and self.order[self.cursor] in self.results:
+                ready.append(self.results.pop(self.order[self.cursor]))
+                self.cursor += 1
+        finally:
+            self.lock.release()
+        return ready
+
+    def done(self):
+        return self.cursor == len(self.order)
+
+    def stop(self):
+        self.stopped.set()
@@ -118,6 +118,7 @@ class Statistics:
         s.storage_numcomplete = self.storage.stat_numfound + numdownloaded
         s.storage_numflunked = self.storage.stat_numflunked
         s.storage_isendgame = self.downloader.endgamemode
+        s.write_cache = self.storage.get_write_cache_stats()
 
         s.peers_kicked = self.downloader.kicked.items()
         s.peers_banned = self.downloader.banned.items()
@@ -1,7 +1,7 @@
 # Written by Bram Cohen
 # see LICENSE.txt for license information
 
-from Tribler.Core.BitTornado.piecebuffer import BufferPool
+from Tribler.Core.BitTornado.piecebuffer import BufferPool, MMapBuffer
 from threading import Lock
 from time import strftime, localtime
 import os
@@ -13,6 +13,10 @@ except ImportError:
     fsync = lambda x: None
 from bisect import bisect
 import sys
+try:
+    from mmap import mmap, ACCESS_READ
+except ImportError:
+    mmap = None
     
 try:
     True
@@ -62,6 +66,9 @@ class Storage:
             self.lock_file, self.unlock_file = lambda x1, x2: None, lambda x1, x2: None
         self.lock_while_reading = config.get('lock_while_reading', False)
         self.lock = Lock()
+        # {file: mmap} of files that are not open for writing, used by read_view
+        self.mmap_reads = config.get('mmap_reads', False) and mmap is not None
+        self.mmaps = {}
 
         if not disabled_files:
             disabled_files = [False] * len(files)
@@ -224,6 +231,9 @@ class Storage:
         
 
     def _get_file_handle(self, file, for_write):
+        if for_write and self.mmaps:
+            # the mapping may go stale when the file is written
+            self._drop_mmap(file)
         if self.handles.has_key(file):
             if for_write and not self.whandles.has_key(file):
                 self._close(file)
@@ -314,6 +324,55 @@ class Storage:
                 raise IOError('error reading data from '+ file)
         return r
 
+    def read_view(self, pos, amount):
+        """ Returns an MMapBuffer on the data at pos, or None when it can 
+        not be memory mapped, in which case read() must be used. Only files 
+        that are not open for writing are mapped, so the view never misses
+        data that is still buffered in a write handle. """
+        if not self.mmap_reads:
+            return None
+        segments = []
+        self.lock.acquire()
+        try:
+            for file, begin, end in self._intervals(pos, amount):
+                if self.whandles.has_key(file):
+                    return None
+                m = self._get_mmap(file, end)
+                if m is None:
+                    return None
+                segments.append((m, begin, end))
+        finally:
+            self.lock.release()
+        return MMapBuffer(segments)
+
+    def _get_mmap(self, file, end):
+        m = self.mmaps.get(file)
+        if m is not None and len(m) >= end:
+            return m
+        try:
+            h = self._open(file, 'rb')
+            try:
+                if os.fstat(h.fileno()).st_size < end:
+                    return None
+                m = mmap(h.fileno(), 0, access = ACCESS_READ)
+            finally:
+                h.close()
+        except (EnvironmentError, ValueError, OverflowError):
+            # e.g. out of address space, fall back to read()
+            if DEBUG:
+                print_exc()
+            return None
+        if self.max_files_open > 0 and len(self.mmaps) >= self.max_files_open:
+            self._drop_mmap(self.mmaps.keys()[0])
+        self.mmaps[file] = m
+        return m
+
+    def _drop_mmap(self, file):
+        # Not closed explicitly, views handed out by read_view may still use
+        # it. The mapping is closed when the last view is released.
+        if self.mmaps.has_key(file):
+            del self.mmaps[file]
+
     def write(self, pos, s):
         # might raise an IOError
         total = 0
@@ -357,6 +416,7 @@ class Storage:
         self.handles = {}
         self.whandles = {}
         self.handlebuffer = None
+        self.mmaps = {}
 
 
     def _get_disabled_ranges(self, f):
@@ -479,6 +539,7 @@ class Storage:
 
 
     def delete_file(self, f):
+        self._drop_mmap(self.files[f][0])
         try:
             os.remove(self.files[f][0])
         except:
@@ -10,6 +10,8 @@ import traceback
 import time
 
 from Tribler.Core.Merkle.merkle import MerkleTree
+from Tribler.Core.BitTornado.BT1.HashChecker import HashChecker
+from Tribler.Core.BitTornado.BT1.WriteCache import WriteCache
 from Tribler.Core.Utilities.Crypto import sha
 from Tribler.Core.BitTornado.bitfield import Bitfield
 from Tribler.Core.BitTornado.clock import clock
@@ -25,6 +27,9 @@ from bisect import insort
 DEBUG = False
 
 STATS_INTERVAL = 0.2
+HASHCHECK_POLL_INTERVAL = 0.05 # seconds between polls for hashcheck results
+WRITE_BUFFER_FLUSH_INTERVAL = 10 # seconds between checks for old buffered pieces
+WRITE_BUFFER_MAX_AGE = 30 # seconds a piece may stay in the write buffer
 RARE_RAWSERVER_TASKID = -481  # This must be a rawserver task ID that is never valid.
 
 
@@ -102,6 +107,11 @@ class StorageWrapper:
         
         self.alloc_type = config.get('alloc_type', 'normal')
         self.double_check = config.get('double_check', 0)
+        self.hashcheck_threads = config.get('hashcheck_threads', 0)
+        self.mmap_reads = config.get('mmap_reads', 0)
+        self.hashcheck_readsize = config.get('hashcheck_read_size', 4) * 1048576
+        self.hashchecker = None
+        self.initialize_delay = 0
         self.triple_check = config.get('triple_check', 0)
         if self.triple_check:
             self.double_check = True
@@ -140,6 +150,13 @@ class StorageWrapper:
         self.write_buf_size = 0L
         self.write_buf = {}   # structure:  piece: [(start, data), ...]
         self.write_buf_list = []
+        self.write_buf_time = {}   # piece: time the first block was buffered
+        self.write_cache = WriteCache.getInstance()
+        self.stat_write_blocks = 0
+        self.stat_write_writes = 0
+        self.stat_write_hits = 0
+        self.stat_write_misses = 0
+        self.stat_write_flushes = {'complete': 0, 'pressure': 0, 'timer': 0, 'sync': 0}
         # Arno, 2010-04-23: STBSPEED: the piece that were correct on disk at start
         self.pieces_on_disk_at_startup = []
 
@@ -171,6 +188,8 @@ class StorageWrapper:
 
         # Arno: move starting of periodic _bgalloc to init_alloc
         self.backfunc(self._bgsync, max(self.config['auto_flush']*60, 60))
+        if self.write_buf_max:
+            self.backfunc(self._bgflush, WRITE_BUFFER_FLUSH_INTERVAL)
 
 
     def _bgsync(self):
@@ -179,6 +198,16 @@ class StorageWrapper:
         self.backfunc(self._bgsync, max(self.config['auto_flush']*60, 60))
 
 
+    def _bgflush(self):
+        # write the pieces that have been waiting for their last blocks
+        # for a long time
+        t = clock() - WRITE_BUFFER_MAX_AGE
+        old = [piece for piece in self.write_buf_list if self.write_buf_time[piece] < t]
+        if old:
+            self.stat_write_flushes['timer'] += len(old)
+            self._flush_buffers(old)
+        self.backfunc(self._bgflush, WRITE_BUFFER_FLUSH_INTERVAL)
+
     def old_style_init(self):
         while self.initialize_tasks:
             msg, done, init, next = self.initialize_tasks.pop(0)
@@ -192,8 +221,13 @@ class StorageWrapper:
                         self.statusfunc(fractionDone = x)
                     self.unpauseflag.wait()
                     if self.flag.isSet():
+                        if self.hashchecker is not None:
+                            self.hashchecker.stop()
                         return False
                     x = next()
+                    if self.initialize_delay and self.hashchecker is not None:
+                        # wait for the hashcheck threads instead of spinning
+                        self.hashchecker.wait(self.initialize_delay)
 
         self.statusfunc(fractionDone = 0)
         return True
@@ -265,6 +299,7 @@ class StorageWrapper:
         if DEBUG:
             print >>sys.stderr,"StorageWrapper: _initialize: next is",self.initialize_next
 
+        self.initialize_delay = 0
         if self.initialize_next:
             x = self.initialize_next()
             if x is None:
@@ -289,7 +324,7 @@ class StorageWrapper:
                 diff = et - st
                 print >>sys.stderr,"StorageWrapper: _initialize: task took",diff
 
-        self.backfunc(self._initialize)
+        self.backfunc(self._initialize, self.initialize_delay)
 
 
     def init_hashcheck(self):
@@ -415,10 +450,15 @@ class StorageWrapper:
             if self.live_streaming:
                 return None
             if self.flag.isSet():
+                if self.hashchecker is not None:
+                    self.hashchecker.stop()
                 return None
             if not self.check_list:
                 return None
 
+            if self.check_hashes and self.hashcheck_threads > 0:
+                return self._threaded_hashcheckfunc()
+
             i = self.check_list.pop(0)
             if not self.check_hashes:
                 self._markgot(i, i)
@@ -435,59 +475,101 @@ class StorageWrapper:
                 sh.update(d2[:])
                 d2.release()
                 s = sh.digest()
-
-
-                if DEBUG:
-                    if s != self.hashes[i]:
-                        print >>sys.stderr,"StorageWrapper: hashcheckfunc: piece corrupt",i
-
-                # Merkle: If we didn't read the hashes from persistent storage then
-                # we can't check anything. Exception is the case where we are the
-                # initial seeder. In that case we first calculate all hashes, 
-                # and then compute the hash tree. If the root hash equals the
-                # root hash in the .torrent we're a seeder. Otherwise, we are
-                # client with messed up data and no (local) way of checking it.
-                #
-                if not self.hashes_unpickled:
-                    if DEBUG:
-                        print "StorageWrapper: Merkle torrent, saving calculated hash",i
-                    self.initial_hashes[i] = s
-                    self._markgot(i, i)
-                elif s == self.hashes[i]:
-                    self._markgot(i, i)
-                elif (self.check_targets.get(s)
-                       and self._piecelen(i) == self._piecelen(self.check_targets[s][-1])):
-                    self._markgot(self.check_targets[s].pop(), i)
-                    self.out_of_place += 1
-                elif (not self.have[-1] and sp == self.hashes[-1]
-                       and (i == len(self.hashes) - 1
-                            or not self._waspre(len(self.hashes) - 1))):
-                    self._markgot(len(self.hashes) - 1, i)
-                    self.out_of_place += 1
-                else:
-                    self.places[i] = i
+                self._hashchecked(i, s, sp)
             self.numchecked += 1
             if self.amount_left == 0:
-                if not self.hashes_unpickled:
-                    # Merkle: The moment of truth. Are we an initial seeder?
-                    self.merkletree = MerkleTree(self.piece_size,self.total_length,None,self.initial_hashes)
-                    if self.merkletree.compare_root_hashes(self.root_hash):
-                        if DEBUG:
-                            print "StorageWrapper: Merkle torrent, initial seeder!"
-                        self.hashes = self.initial_hashes
-                    else:
-                        # Bad luck
-                        if DEBUG:
-                            print "StorageWrapper: Merkle torrent, NOT a seeder!"
-                        self.failed('download corrupted, hash tree does not compute; please delete and restart')
-                        return 1
-                self.finished()
+                if not self._hashcheck_finished():
+                    return 1
                 
             return (self.numchecked / self.check_total)
 
         except Exception, e:
             print_exc()
             self.failed('download corrupted: '+str(e)+'; please delete and restart')
+
+    def _threaded_hashcheckfunc(self):
+        """ Process the pieces hashed by the HashChecker threads so far.
+        Reading and hashing is done off the network thread, here we only
+        mark the pieces that checked out. """
+        if self.hashchecker is None:
+            if DEBUG:
+                print >>sys.stderr,"StorageWrapper: hashcheck: checking",len(self.check_list),"pieces using",self.hashcheck_threads,"threads"
+            self.hashchecker = HashChecker(self.storage, self.check_list, self.piece_size, 
+                                           self._piecelen, self.lastlen, self.hashcheck_threads, 
+                                           self.hashcheck_readsize, self.flag)
+        results = self.hashchecker.get_results()
+        if not results:
+            self.initialize_delay = HASHCHECK_POLL_INTERVAL
+            return (self.numchecked / self.check_total)
+
+        for i, s, sp, e in results:
+            if e is not None:
+                self.hashchecker.stop()
+                self.hashchecker = None
+                self.failed('IO Error: ' + str(e))
+                return None
+            self._hashchecked(i, s, sp)
+            self.numchecked += 1
+
+        if self.hashchecker.done():
+            self.hashchecker = None
+            self.check_list = []
+            if self.amount_left == 0:
+                if not self._hashcheck_finished():
+                    return 1
+        return (self.numchecked / self.check_total)
+
+    def _hashchecked(self, i, s, sp):
+        """ Mark piece i as present when its hash s checks out. sp is the
+        hash of the first self.lastlen bytes of the piece. """
+        if DEBUG:
+            if s != self.hashes[i]:
+                print >>sys.stderr,"StorageWrapper: hashcheckfunc: piece corrupt",i
+
+        # Merkle: If we didn't read the hashes from persistent storage then
+        # we can't check anything. Exception is the case where we are the
+        # initial seeder. In that case we first calculate all hashes, 
+        # and then compute the hash tree. If the root hash equals the
+        # root hash in the .torrent we're a seeder. Otherwise, we are
+        # client with messed up data and no (local) way of checking it.
+        #
+        if not self.hashes_unpickled:
+            if DEBUG:
+                print "StorageWrapper: Merkle torrent, saving calculated hash",i
+            self.initial_hashes[i] = s
+            self._markgot(i, i)
+        elif s == self.hashes[i]:
+            self._markgot(i, i)
+        elif (self.check_targets.get(s)
+               and self._piecelen(i) == self._piecelen(self.check_targets[s][-1])):
+            self._markgot(self.check_targets[s].pop(), i)
+            self.out_of_place += 1
+        elif (not self.have[-1] and sp == self.hashes[-1]
+               and (i == len(self.hashes) - 1
+                    or not self._waspre(len(self.hashes) - 1))):
+            self._markgot(len(self.hashes) - 1, i)
+            self.out_of_place += 1
+        else:
+            self.places[i] = i
+
+    def _hashcheck_finished(self):
+        """ Called when all data is present after the hashcheck. Returns
+        False when the download turned out to be corrupt. """
+        if not self.hashes_unpickled:
+            # Merkle: The moment of truth. Are we an initial seeder?
+            self.merkletree = MerkleTree(self.piece_size,self.total_length,None,self.initial_hashes)
+            if self.merkletree.compare_root_hashes(self.root_hash):
+                if DEBUG:
+                    print "StorageWrapper: Merkle torrent, initial seeder!"
+                self.hashes = self.initial_hashes
+            else:
+                # Bad luck
+                if DEBUG:
+                    print "StorageWrapper: Merkle torrent, NOT a seeder!"
+                self.failed('download corrupted, hash tree does not compute; please delete and restart')
+                return False
+        self.finished()
+        return True
     
 
     def init_movedata(self):
@@ -743,43 +825,124 @@ class StorageWrapper:
 
     def _write_to_buffer(self, piece, start, data):
         if not self.write_buf_max:
+            self.stat_write_blocks += 1
+            self.stat_write_writes += 1
             return self.write_raw(self.places[piece], start, data)
-        self.write_buf_size += len(data)
-        while self.write_buf_size > self.write_buf_max:
+        while self.write_buf_list and self.write_buf_size + len(data) > self.write_buf_max:
             old = self.write_buf_list.pop(0)
+            self.stat_write_flushes['pressure'] += 1
             if not self._flush_buffer(old, True):
                 return False
         if self.write_buf.has_key(piece):
             self.write_buf_list.remove(piece)
         else:
             self.write_buf[piece] = []
+            self.write_buf_time[piece] = clock()
         self.write_buf_list.append(piece)
         self.write_buf[piece].append((start, data))
+        self.write_buf_size += len(data)
+        self.stat_write_blocks += 1
+        self.write_cache.added(self, len(data))
+        return True
+
+    def _pop_buffer(self, piece):
+        """ Remove the blocks of piece from the write buffer and return them
+        as (position, place, start, data) tuples """
+        l = self.write_buf.pop(piece)
+        del self.write_buf_time[piece]
+        place = self.places[piece]
+        pos = self.piece_size * place
+        blocks = []
+        length = 0
+        for start, data in l:
+            blocks.append((pos + start, place, start, data))
+            length += len(data)
+        self.write_buf_size -= length
+        self.write_cache.removed(self, length)
+        return blocks
+
+    def _write_blocks(self, blocks):
+        """ Write the blocks, joining adjacent ones such that each run of
+        consecutive data takes a single write """
+        blocks.sort()
+        run = []
+        runend = None
+        for pos, place, start, data in blocks:
+            if run and pos != runend:
+                if not self._write_run(run):
+                    return False
+                run = []
+            run.append((place, start, data))
+            runend = pos + len(data)
+        if run:
+            return self._write_run(run)
         return True
 
+    def _write_run(self, run):
+        place, start, data = run[0]
+        if len(run) > 1:
+            data = ''.join([block[2] for block in run])
+        self.stat_write_writes += 1
+        return self.write_raw(place, start, data)
+
     def _flush_buffer(self, piece, popped = False):
         if not self.write_buf.has_key(piece):
             return True
         if not popped:
             self.write_buf_list.remove(piece)
-        l = self.write_buf[piece]
-        del self.write_buf[piece]
+        return self._write_blocks(self._pop_buffer(piece))
+
+    def _flush_buffers(self, pieces):
+        """ Flush several pieces, coalescing the writes of pieces that are
+        adjacent on disk """
+        blocks = []
+        for piece in pieces:
+            if self.write_buf.has_key(piece):
+                self.write_buf_list.remove(piece)
+                blocks.extend(self._pop_buffer(piece))
+        return self._write_blocks(blocks)
+
+    def flush_oldest_buffer(self):
+        """ Called by the WriteCache when all downloads together buffer too
+        much data. Returns False when nothing could be flushed. """
+        if not self.write_buf_list:
+            return False
+        self.stat_write_flushes['pressure'] += 1
+        return self._flush_buffer(self.write_buf_list.pop(0), True)
+
+    def _get_buffered_piece(self, piece):
+        """ Returns the data of piece when all its blocks are in the write
+        buffer, None otherwise """
+        l = self.write_buf.get(piece)
+        if not l:
+            return None
+        l = l[:]
         l.sort()
+        pos = 0
         for start, data in l:
-            self.write_buf_size -= len(data)
-            if not self.write_raw(self.places[piece], start, data):
-                return False
-        return True
+            if start != pos:
+                return None
+            pos += len(data)
+        if pos != self._piecelen(piece):
+            return None
+        return ''.join([data for start, data in l])
+
+    def get_write_cache_stats(self):
+        """ Returns a dictionary with the write buffer statistics of this
+        download """
+        return {'blocks': self.stat_write_blocks,
+                'writes': self.stat_write_writes,
+                'hits': self.stat_write_hits,
+                'misses': self.stat_write_misses,
+                'flushes': self.stat_write_flushes.copy(),
+                'buffered': self.write_buf_size,
+                'total_buffered': self.write_cache.get_size()}
 
     def sync(self):
-        spots = {}
-        for p in self.write_buf_list:
-            spots[self.places[p]] = p
-        l = spots.keys()
-        l.sort()
-        for i in l:
+        if self.write_buf_list:
+            self.stat_write_flushes['sync'] += len(self.write_buf_list)
             try:
-                self._flush_buffer(spots[i])
+                self._flush_buffers(self.write_buf_list[:])
             except:
                 pass
         try:
@@ -789,6 +952,16 @@ class StorageWrapper:
         except OSError, e:
             self.failed('OS Error: ' + str(e))
 
+    def close(self):
+        """ Called when the download shuts down, after sync. Drops the data
+        that could not be written and removes this download from the
+        WriteCache, which otherwise keeps it alive """
+        self.write_cache.unregister(self)
+        self.write_buf = {}
+        self.write_buf_time = {}
+        self.write_buf_list = []
+        self.write_buf_size = 0
+
 
     def _move_piece(self, index, newpos):
         oldpos = self.places[index]
@@ -925,26 +1098,40 @@ class StorageWrapper:
             return True
         
         del self.dirty[index]
-        if not self._flush_buffer(index):
-            return True
-        
         length = self._piecelen(index)
-        # Check hash
-        data = self.read_raw(self.places[index], 0, length, 
-                                     flush_first = self.triple_check)
-        if data is None:
+        buffered = None
+        if self.write_buf.has_key(index):
+            if not self.live_streaming and not self.triple_check:
+                buffered = self._get_buffered_piece(index)
+            if buffered is None:
+                self.stat_write_misses += 1
+            else:
+                self.stat_write_hits += 1
+            self.stat_write_flushes['complete'] += 1
+        if not self._flush_buffer(index):
             return True
         
         pieceok = False
-        if self.live_streaming:
-            # LIVESOURCEAUTH
-            if self.piece_from_live_source_func(index,data[:]):
+        if buffered is not None:
+            # Check hash of the data we just wrote, no need to read it back
+            if sha(buffered).digest() == self.hashes[index]:
                 pieceok = True
         else:
-            hash = sha(data[:]).digest()
-            data.release()
-            if hash == self.hashes[index]:
-                pieceok = True
+            # Check hash
+            data = self.read_raw(self.places[index], 0, length, 
+                                         flush_first = self.triple_check)
+            if data is None:
+                return True
+            
+            if self.live_streaming:
+                # LIVESOURCEAUTH
+                if self.piece_from_live_source_func(index,data[:]):
+                    pieceok = True
+            else:
+                hash = sha(data[:]).digest()
+                data.release()
+                if hash == self.hashes[index]:
+                    pieceok = True
                 
         if not pieceok: 
             self.amount_obtained -= length
@@ -1018,6 +1205,24 @@ class StorageWrapper:
             hashlist = []
         return [pb,hashlist]
 
+    def get_piece_view(self, index, begin, length):
+        """ Like get_piece, but returns a view on the memory-mapped piece
+        when mmap_reads is enabled. Slicing the view does not copy the data.
+        Falls back to get_piece when the piece can not be mapped. """
+        if self.mmap_reads and self.have[index] and self.waschecked[index]:
+            if length == -1:
+                length = self._piecelen(index) - begin
+            if begin < 0 or length < 0 or begin + length > self._piecelen(index):
+                return [None, []]
+            view = self.storage.read_view(self.piece_size * self.places[index] + begin, length)
+            if view is not None:
+                if self.merkle_torrent and begin == 0:
+                    hashlist = self.merkletree.get_hashes_for_piece(index)
+                else:
+                    hashlist = []
+                return [view, hashlist]
+        return self.get_piece(index, begin, length)
+
     def do_get_piece(self, index, begin, length):
         if not self.have[index]:
             return None
@@ -30,6 +30,7 @@ class Upload:
         self.super_seeding = False
         self.buffer = []
         self.measure = Measure(config['max_rate_period'], config['upload_rate_fudge'])
+        self.upload_counter = get_status_holder("LivingLab").get_counter("uploaded")
         self.was_ever_interested = False
         if storage.get_amount_left() == 0:
             if choker.super_seed:
@@ -107,7 +108,7 @@ class Upload:
                     self.piecebuf.release()
                 self.piecedl = index
                 # Merkle
-                [ self.piecebuf, self.hashlist ] = self.storage.get_piece(index, 0, -1)
+                [ self.piecebuf, self.hashlist ] = self.storage.get_piece_view(index, 0, -1)
             try:
                 piece = self.piecebuf[begin:begin+length]
                 assert len(piece) == length
@@ -122,16 +123,14 @@ class Upload:
             if self.piecebuf:
                 self.piecebuf.release()
                 self.piecedl = None
-            [piece, hashlist] = self.storage.get_piece(index, begin, length)
+            [piece, hashlist] = self.storage.get_piece_view(index, begin, length)
             if piece is None:
                 self.connection.close()
                 return None
         self.measure.update_rate(len(piece))
         self.totalup.update_rate(len(piece))
 
-        status = get_status_holder("LivingLab")
-        s_upload = status.get_or_create_status_element("uploaded",0)
-        s_upload.inc(len(piece))
+        self.upload_counter.inc(len(piece))
 
         # BarterCast counter
         self.connection.total_uploaded += length
@@ -0,0 +1,93 @@
+# see LICENSE.txt for license information
+
+import sys
+import threading
+
+try:
+    True
+except:
+    True = 1
+    False = 0
+
+DEBUG = False
+
+# Maximum amount of received data buffered by all downloads together
+DEFAULT_WRITE_CACHE_SIZE = 32 * 1048576L
+
+class WriteCache:
+    """
+    Bounds the write buffers of all StorageWrappers together.
+
+    Each StorageWrapper keeps its own write_buf of received blocks and
+    reports the bytes it adds and removes here. When the total exceeds
+    max_size, the download with the most buffered data flushes its least
+    recently used piece. Like the StorageWrappers themselves, this is only
+    used from the network thread.
+    """
+    __single = None
+    lock = threading.Lock()
+
+    def __init__(self, max_size = DEFAULT_WRITE_CACHE_SIZE):
+        if WriteCache.__single:
+            raise RuntimeError, "WriteCache is Singleton"
+        WriteCache.__single = self
+
+        self.max_size = max_size
+        self.size = 0L
+        # {StorageWrapper: True} for all wrappers with buffered data
+        self.wrappers = {}
+        self.stat_pressure_flushes = 0
+
+    def getInstance(*args, **kw):
+        # Singleton pattern with double-checking
+        if WriteCache.__single is None:
+            WriteCache.lock.acquire()
+            try:
+                if WriteCache.__single is None:
+                    WriteCache(*args, **kw)
+            finally:
+                WriteCache.lock.release()
+        return WriteCache.__single
+    getInstance = staticmethod(getInstance)
+
+    def delInstance(*args, **kw):
+        WriteCache.__single = None
+    delInstance = staticmethod(delInstance)
+
+    def set_max_size(self, max_size):
+        self.max_size = max_size
+        self._shrink()
+
+    def get_size(self):
+        return self.size
+
+    def added(self, wrapper, length):
+        """ Called by a StorageWrapper after buffering length bytes """
+        self.wrappers[wrapper] = True
+        self.size += length
+        self._shrink()
+
+    def removed(self, wrapper, length):
+        """ Called by a StorageWrapper after removing length bytes from its
+        buffer """
+        self.size -= length
+        if not wrapper.write_buf_size:
+            self.wrappers.pop(wrapper, None)
+
+    def unregister(self, wrapper):
+        """ Called by a StorageWrapper that shuts down, forgets the wrapper
+        and the data it still buffers """
+        self.wrappers.pop(wrapper, None)
+        self.size -= wrapper.write_buf_size
+
+    def _shrink(self):
+        candidates = self.wrappers.keys()
+        while self.size > self.max_size and candidates:
+            victim = max(candidates, key = lambda w: w.write_buf_size)
+            if DEBUG:
+                print >>sys.stderr,"WriteCache: over budget",self.size,"flushing from",victim
+            self.stat_pressure_flushes += 1
+            if not victim.flush_oldest_buffer():
+                # failed or nothing to flush, don't keep trying in this pass.
+                # The victim stays registered, its buffered data still counts
+                candidates.remove(victim)
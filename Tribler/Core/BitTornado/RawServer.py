@@ -1,7 +1,7 @@
 # Written by Bram Cohen and Pawel Garbacki
 # see LICENSE.txt for license information
 
-from bisect import insort
+from heapq import heappush, heappop, heapify
 from SocketHandler import SocketHandler
 import socket
 from cStringIO import StringIO
@@ -59,7 +59,15 @@ class RawServer:
         self.failfunc = failfunc
         self.errorfunc = errorfunc
         self.exccount = 0
+        # Pending tasks are kept in a heap of [time, seq, func, id]
+        # entries. seq keeps tasks with equal deadlines in FIFO order and
+        # ensures func is never compared. Killed tasks are not removed from
+        # the heap right away, their func is set to None and they are skipped
+        # when they come up (lazy deletion).
         self.funcs = []
+        self.funcs_seq = 0
+        self.funcs_ids = {}
+        self.funcs_cancelled = 0
         self.externally_added = []
         self.finished = Event()
         self.tasks_to_kill = []
@@ -81,7 +89,34 @@ class RawServer:
     def _add_task(self, func, delay, id = None):
         if delay < 0:
             delay = 0
-        insort(self.funcs, (clock() + delay, func, id))
+        self.funcs_seq += 1
+        task = [clock() + delay, self.funcs_seq, func, id]
+        heappush(self.funcs, task)
+        if id is not None:
+            self.funcs_ids.setdefault(id, {})[self.funcs_seq] = task
+
+    def _pop_task(self):
+        """ Remove the first task from the heap and return its (func, id).
+        func is None when the task was killed. """
+        garbage1, seq, func, id = heappop(self.funcs)
+        if func is None:
+            self.funcs_cancelled -= 1
+        elif id is not None:
+            tasks = self.funcs_ids[id]
+            del tasks[seq]
+            if not tasks:
+                del self.funcs_ids[id]
+        return func, id
+
+    def _next_task_time(self):
+        """ Return the deadline of the first live task, or None. """
+        funcs = self.funcs
+        while funcs and funcs[0][2] is None:
+            heappop(funcs)
+            self.funcs_cancelled -= 1
+        if funcs:
+            return funcs[0][0]
+        return None
 
     def add_task(self, func, delay = 0, id = None):
         #if DEBUG:
@@ -121,10 +156,11 @@ class RawServer:
 
     def pop_external(self):
         self.lock.acquire()
-        while self.externally_added:
-            (a, b, c) = self.externally_added.pop(0)
-            self._add_task(a, b, c)
+        externally_added = self.externally_added
+        self.externally_added = []
         self.lock.release()
+        for (a, b, c) in externally_added:
+            self._add_task(a, b, c)
 
     def listen_forever(self, handler):
         if DEBUG:
@@ -137,8 +173,9 @@ class RawServer:
                 try:
                     self.pop_external()
                     self._kill_tasks()
-                    if self.funcs:
-                        period = self.funcs[0][0] + 0.001 - clock()
+                    nexttime = self._next_task_time()
+                    if nexttime is not None:
+                        period = nexttime + 0.001 - clock()
                     else:
                         period = 2 ** 30
                     if period < 0:
@@ -157,9 +194,9 @@ class RawServer:
                     
                     
                     while self.funcs and self.funcs[0][0] <= clock():
-                        garbage1, func, id = self.funcs.pop(0)
-                        if id in self.tasks_to_kill:
-                            pass
+                        func, id = self._pop_task()
+                        if func is None:
+                            continue
                         try:
 #                            print func.func_name
                             if DEBUG:
@@ -241,13 +278,21 @@ class RawServer:
 
     def _kill_tasks(self):
         if self.tasks_to_kill:
-            new_funcs = []
-            for (t, func, id) in self.funcs:
-                if id not in self.tasks_to_kill:
-                    new_funcs.append((t, func, id))
-            self.funcs = new_funcs
+            for id in self.tasks_to_kill:
+                tasks = self.funcs_ids.pop(id, None)
+                if tasks:
+                    for task in tasks.itervalues():
+                        task[2] = None
+                    self.funcs_cancelled += len(tasks)
             self.tasks_to_kill = []
 
+            # Compact the heap when most of it consists of killed tasks,
+            # otherwise memory use is bounded only by the task deadlines
+            if self.funcs_cancelled > 1024 and self.funcs_cancelled * 2 > len(self.funcs):
+                self.funcs = [task for task in self.funcs if task[2] is not None]
+                heapify(self.funcs)
+                self.funcs_cancelled = 0
+
     def kill_tasks(self, id):
         self.tasks_to_kill.append(id)
 
@@ -9,6 +9,11 @@ try:
 except ImportError:
     from selectpoll import poll, POLLIN, POLLOUT, POLLERR, POLLHUP
     timemult = 1
+import selectpoll
+try:
+    import epollpoll
+except ImportError:
+    epollpoll = None
 from time import sleep
 from clock import clock
 import sys
@@ -25,6 +30,21 @@ DEBUG = False
 
 all = POLLIN | POLLOUT
 
+# {name: (poll class, multiplier from seconds to the poll() timeout unit)}
+# The event masks of all backends are the select.poll ones, see selectpoll.
+POLLERS = {}
+POLLERS["select"] = (selectpoll.poll, 1)
+if poll is not selectpoll.poll:
+    POLLERS["poll"] = (poll, 1000)
+if epollpoll:
+    POLLERS["epoll"] = (epollpoll.poll, 1)
+
+def default_poller():
+    """ Returns the name of the most scalable poll backend on this platform """
+    for name in ("epoll", "poll", "select"):
+        if name in POLLERS:
+            return name
+
 if sys.platform == 'win32':
     SOCKET_BLOCK_ERRORCODE=10035    # WSAEWOULDBLOCK
 else:
@@ -226,11 +246,16 @@ class SingleSocket:
 
 
 class SocketHandler:
-    def __init__(self, timeout, ipv6_enable, readsize = 100000):
+    def __init__(self, timeout, ipv6_enable, readsize = 100000, poller = None):
         self.timeout = timeout
         self.ipv6_enable = ipv6_enable
         self.readsize = readsize
-        self.poll = poll()
+        if poller is None:
+            poller = default_poller()
+        if DEBUG:
+            print >>sys.stderr,"SocketHandler: using poll backend",poller
+        poll_class, self.timemult = POLLERS[poller]
+        self.poll = poll_class()
         # {socket: SingleSocket}
         self.single_sockets = {}
         self.dead_from_write = []
@@ -576,7 +601,7 @@ class SocketHandler:
         s.handler.connection_lost(s)
 
     def do_poll(self, t):
-        r = self.poll.poll(t*timemult)
+        r = self.poll.poll(t*self.timemult)
         if r is None:
             connects = len(self.single_sockets)
             to_close = int(connects*0.05)+1 # close 5% of sockets
@@ -636,6 +636,8 @@ class BT1Download:
             self.storagewrapper.sync()
             self.storage.close()
             self.rerequest_stopped()
+        if self.storagewrapper is not None:
+            self.storagewrapper.close()
         resumedata = None
         if self.fileselector and self.started:
             if not self.failed:
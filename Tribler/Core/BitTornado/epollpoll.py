@@ -0,0 +1,73 @@
+# see LICENSE.txt for license information
+#
+# This poll class is used on Linux. It wraps select.epoll in the interface of
+# select.poll, so the cost of a poll() call depends on the number of sockets
+# with pending events instead of on the number of registered sockets.
+
+import sys
+import errno
+from select import epoll, EPOLLIN, EPOLLOUT, EPOLLERR, EPOLLHUP, EPOLLET
+from types import IntType
+
+POLLIN = EPOLLIN
+POLLOUT = EPOLLOUT
+POLLERR = EPOLLERR
+POLLHUP = EPOLLHUP
+
+# epoll takes its timeout in seconds but refuses values that do not fit
+# in a C int after conversion to milliseconds
+MAX_TIMEOUT = 2 ** 31 / 1000 - 1
+
+DEBUG = False
+
+class poll:
+    """
+    Level-triggered epoll with the select.poll interface.
+
+    When edge_triggered is True EPOLLET is added to every registration. Only
+    use this when the caller drains each socket until EWOULDBLOCK, as
+    SocketHandler reads a single chunk per event.
+    """
+    def __init__(self, edge_triggered = False):
+        self.epoll = epoll()
+        self.edge_triggered = edge_triggered
+        # {fileno: eventmask}
+        self.registered = {}
+
+    def register(self, f, t):
+        if type(f) != IntType:
+            f = f.fileno()
+        if self.edge_triggered:
+            t |= EPOLLET
+        if f in self.registered:
+            if self.registered[f] != t:
+                self.epoll.modify(f, t)
+                self.registered[f] = t
+        else:
+            self.epoll.register(f, t)
+            self.registered[f] = t
+
+    def unregister(self, f):
+        if type(f) != IntType:
+            f = f.fileno()
+        del self.registered[f]
+        try:
+            self.epoll.unregister(f)
+        except IOError:
+            # the file descriptor was already closed, in which case the
+            # kernel removed it from the epoll set
+            if DEBUG:
+                print >>sys.stderr,"epollpoll: unregister of closed fd",f
+
+    def poll(self, timeout = None):
+        if timeout is None or timeout < 0 or timeout > MAX_TIMEOUT:
+            timeout = -1
+        try:
+            return self.epoll.poll(timeout, max(1, len(self.registered)))
+        except IOError, e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+
+    def close(self):
+        self.epoll.close()
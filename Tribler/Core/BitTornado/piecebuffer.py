@@ -84,3 +84,55 @@ class BufferPool:
 
 _pool = BufferPool()
 PieceBuffer = _pool.new
+
+
+class MMapBuffer:
+    """ Read-only view on (parts of) memory-mapped files, with the
+    interface of a SingleBuffer. Slicing creates a new view, the data is
+    only copied out of the page cache by tostring(). """
+    def __init__(self, segments, length = None):
+        # segments: list of (mmap, begin, end)
+        self.segments = segments
+        if length is None:
+            length = 0
+            for m, begin, end in segments:
+                length += int(end - begin)
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getslice__(self, a, b):
+        if b > self.length:
+            b = self.length
+        if b < 0:
+            b += self.length
+        if a == 0 and b == self.length:
+            return MMapBuffer(self.segments[:], self.length)
+        if b <= a:
+            return MMapBuffer([], 0)
+        if len(self.segments) == 1:
+            m, begin, end = self.segments[0]
+            return MMapBuffer([(m, begin + a, begin + b)], b - a)
+        segments = []
+        pos = 0
+        for m, begin, end in self.segments:
+            length = end - begin
+            if pos + length > a and pos < b:
+                segments.append((m, begin + max(a - pos, 0), begin + min(b - pos, length)))
+            pos += length
+        return MMapBuffer(segments)
+
+    def tostring(self):
+        if len(self.segments) == 1:
+            m, begin, end = self.segments[0]
+            return m[begin:end]
+        return ''.join([m[begin:end] for m, begin, end in self.segments])
+
+    def getarray(self):
+        return self
+
+    def release(self):
+        # the mmaps are owned by Storage
+        self.segments = []
+        self.length = 0
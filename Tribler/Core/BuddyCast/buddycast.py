@@ -172,7 +172,7 @@ from Tribler.Core.simpledefs import NTFY_ACT_MEET, NTFY_ACT_RECOMMEND, NTFY_MYPR
 from Tribler.Core.NATFirewall.DialbackMsgHandler import DialbackMsgHandler
 from Tribler.Core.Overlay.SecureOverlay import OLPROTO_VER_FIRST, OLPROTO_VER_SECOND, OLPROTO_VER_THIRD, OLPROTO_VER_FOURTH, OLPROTO_VER_FIFTH, OLPROTO_VER_SIXTH, OLPROTO_VER_SEVENTH, OLPROTO_VER_EIGHTH, OLPROTO_VER_ELEVENTH, OLPROTO_VER_FIFTEENTH, OLPROTO_VER_CURRENT, OLPROTO_VER_LOWEST
 from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
-from similarity import P2PSim_Single, P2PSim_Full, P2PSimColdStart
+from similarity import P2PSim_Single, P2PSim_Full, P2PSimColdStart, PreferenceMatrix
 from TorrentCollecting import SimpleTorrentCollecting   #, TiT4TaTTorrentCollecting
 from Tribler.Core.Statistics.Logger import OverlayLogger
 from Tribler.Core.Statistics.Crawler import Crawler
@@ -2208,14 +2208,14 @@ class DataHandler:
     def getLocalPeerList(self, max_peers,minoversion=None):
         return self.peer_db.getLocalPeerList(max_peers,minoversion=minoversion)
   
-    def postInit(self, delay=4, batch=50, update_interval=10, npeers=None, updatesim=True):
+    def postInit(self, delay=4, npeers=None, updatesim=True):
         # build up a cache layer between app and db
         if npeers is None:
             npeers = self.max_num_peers
         self.updateMyPreferences()
         self.loadAllPeers(npeers)
         if updatesim:
-            self.updateAllSim(delay, batch, update_interval)
+            self.updateAllSim(delay)
 
     def updateMyPreferences(self, num_pref=None):
         # get most recent preferences, and sort by torrent id
@@ -2240,121 +2240,89 @@ class DataHandler:
 #        for pid in self.peers:
 #            self.peers[pid][PEER_PREF_POS].sort()    # keep in order
 
-    def updateAllSim(self, delay=4, batch=50, update_interval=10):
-        self._updateAllPeerSim(delay, batch, update_interval)    # 0.156 second
-        
-        #Disabled Torrent Relevancy since 5.0
-        #self._updateAllItemRel(delay, batch, update_interval)    # 0.875 second
-        # Tuning batch (without index relevance)
-        
-        # batch = 25:                             0.00 0.22 0.58
-        # batch = 50: min/avg/max execution time: 0.09 0.29 0.63 second 
-        # batch = 100:                            0.16 0.47 0.95
-        # update_interval=10
-        # 50000 updates take: 50000 / 50 * (10+0.3) / 3600 = 3 hours
-        # cpu load: 0.3/10 = 3%
-        
-        # With index relevance:
-        # batch = 50: min/avg/max execution time: 0.08 0.62 1.39 second
-        # batch = 25:                             0.00 0.41 1.67
-        # update_interval=5, batch=25
-        # 50000 updates take: 50000 / 25 * (5+0.4) / 3600 = 3 hours
-        # cpu load: 0.4/5 = 8%
-        
-    def cacheSimUpdates(self, update_table, updates, delay, batch, update_interval):
-        self.cached_updates[update_table].update(updates)
-        self.overlay_bridge.add_task(lambda:self.checkSimUpdates(batch, update_interval), delay, 'checkSimUpdates')
-        
-    def checkSimUpdates(self, batch, update_interval):
-        last_update = 0
-        if self.cached_updates['peer']:
-            updates = []
-            update_peers = self.cached_updates['peer']
-            keys = update_peers.keys()
-            shuffle(keys)   # to avoid always update the same items when cacheSimUpdates is called frequently
-            for key in keys[:batch]:
-                updates.append((update_peers.pop(key), key))
-            self.overlay_bridge.add_task(lambda:self.peer_db.updatePeerSims(updates), last_update + update_interval, 'updatePeerSims')
-            last_update += update_interval 
-            
-        if self.cached_updates['torrent']:
-            updates = []
-            update_peers = self.cached_updates['torrent'] 
-            keys = update_peers.keys()
-            shuffle(keys)   
-            for key in keys[:batch]:
-                updates.append((update_peers.pop(key), key))
-            self.overlay_bridge.add_task(lambda:self.torrent_db.updateTorrentRelevances(updates), last_update + update_interval, 'updateTorrentRelevances')
-            last_update += update_interval
-            
-        if self.cached_updates['peer'] or self.cached_updates['torrent']:
-            self.overlay_bridge.add_task(lambda:self.checkSimUpdates(batch, update_interval), last_update+0.001, 'checkSimUpdates')
+    def updateAllSim(self, delay=4):
+        """ Recompute the similarity of all peers and the relevance of their
+        torrents in one pass over the preference matrix. The changes are
+        written to the database in a single bulk update after delay seconds.
+        Returns the number of peers and torrents to update.
+        
+        This reads the whole Preference table, it is only done by postInit.
+        Use updateMyPrefSim when my preferences change. """
+        num_prefs = self.simi_db.getAllNumPrefs()
+        # getAllPreferences returns a cursor, it must be consumed before the
+        # next query
+        matrix = PreferenceMatrix(self.simi_db.getAllPreferences(), num_prefs)
+        
+        peer_updates, similarities = self._updateAllPeerSim(matrix)
+        torrent_updates = self._updateAllItemRel(matrix, similarities)
+        
+        if peer_updates or torrent_updates:
+            self.cached_updates['peer'].update(peer_updates)
+            self.cached_updates['torrent'].update(torrent_updates)
+            self.overlay_bridge.add_task(self.writeSimUpdates, delay, 'writeSimUpdates')
+        return len(peer_updates) + len(torrent_updates)
+        
+    def updateMyPrefSim(self, delay=4):
+        """ Recompute the similarity of the known peers after my preferences
+        changed, using the indexed overlap query instead of the preference
+        matrix. The relevance of torrents is left to the next full pass.
+        Returns the number of peers to update. """
+        if self.myprefs:
+            not_peer_id = self.getPeerID(self.permid)
+            similarities = P2PSim_Full(self.simi_db.getPeersWithOverlap(not_peer_id, self.myprefs), len(self.myprefs))
+        else:
+            similarities = {}
         
-    def _updateAllPeerSim(self, delay, batch, update_interval):
-        # update similarity to all peers to keep consistent
-        #if self.old_peer_num == len(self.peers):    # if no new peers, don't update
-        #    return
+        peer_updates = self._updatePeerSims(similarities)
+        if peer_updates:
+            self.cached_updates['peer'].update(peer_updates)
+            self.overlay_bridge.add_task(self.writeSimUpdates, delay, 'writeSimUpdates')
+        return len(peer_updates)
+        
+    def writeSimUpdates(self):
+        peer_updates = self.cached_updates['peer']
+        torrent_updates = self.cached_updates['torrent']
+        self.cached_updates = {'peer':{},'torrent':{}}
         
-        #call full_update
+        if peer_updates:
+            self.peer_db.updatePeerSims([(sim, peer_id) for peer_id, sim in peer_updates.iteritems()])
+        if torrent_updates:
+            self.torrent_db.updateTorrentRelevances([(rel, torrent_id) for torrent_id, rel in torrent_updates.iteritems()])
+        
+    def _updateAllPeerSim(self, matrix):
+        # update similarity to all peers to keep consistent
+        not_peer_id = self.getPeerID(self.permid)
+        similarities = matrix.getPeerSimilarities(self.myprefs, not_peer_id)
+        return self._updatePeerSims(similarities), similarities
+    
+    def _updatePeerSims(self, similarities):
+        # peers that are not in similarities no longer share a torrent with me
         updates = {}
-        if len(self.myprefs) > 0:
-           not_peer_id = self.getPeerID(self.permid)
-           similarities = P2PSim_Full(self.simi_db.getPeersWithOverlap(not_peer_id, self.myprefs), len(self.myprefs))
-            
-           for peer_id in self.peers:
-               if peer_id in similarities:
-                   oldsim = self.peers[peer_id][PEER_SIM_POS]
-                   sim = similarities[peer_id]
-                   updates[peer_id] = sim
-
+        for peer_id, peer in self.peers.iteritems():
+            sim = similarities.get(peer_id, 0)
+            if sim != peer[PEER_SIM_POS]:
+                peer[PEER_SIM_POS] = sim
+                updates[peer_id] = sim
+        
         #print >> sys.stderr, '****************** update peer sim', len(updates), len(self.peers)        
-        if updates:
-            self.cacheSimUpdates('peer', updates, delay, batch, update_interval)
+        return updates
                         
-    def _updateAllItemRel(self, delay, batch, update_interval):
+    def _updateAllItemRel(self, matrix, similarities):
         # update all item's relevance
-        # Relevance of I = Sum(Sim(Users who have I)) + Poplarity(I)
-        # warning: this function may take 5 seconds to commit to the database
-        
-        """
-        Disabled, not in use since v5.0
-        
-        if len(self.peers) == 0:
-            return
-        tids = {}
-        nsimpeers = 0
-        for peer_id in self.peers:
-            if self.peers[peer_id][PEER_PREF_POS]:
-                sim = self.peers[peer_id][PEER_SIM_POS]
-                if sim > 0:
-                    nsimpeers += 1
-                    prefs = self.peers[peer_id][PEER_PREF_POS]
-                    for tid in prefs:
-                        if tid not in tids:
-                            tids[tid] = [0,0]
-                        tids[tid][0] += sim
-                        tids[tid][1] += 1
-
-        if len(tids) == 1:
-            return
-        
-        res = self.torrent_db.getTorrentRelevances(tids)
-        if res:
-            old_rels = dict(res)
-        else:
-            old_rels = {}
-        #print >> sys.stderr, '********* update all item rel', len(old_rels), len(tids) #, old_rels[:10]
+        # Relevance of I = Sum(Sim(Users who have I)) / #(Users who have I) + #(Users who have I)
+        # for the users with a positive similarity
+        tids = matrix.getTorrentRelevances(similarities)
+        if not tids:
+            return {}
         
+        old_rels = dict(self.torrent_db.getTorrentRelevances(tids.keys()))
         for tid in tids.keys():
-            tids[tid] = tids[tid][0]/tids[tid][1] + tids[tid][1]
             old_rel = old_rels.get(tid, None)
             if old_rel != None and abs(old_rel - tids[tid]) <= old_rel*0.05:
                 tids.pop(tid)   # don't update db
-            
-        #print >> sys.stderr, '**************--- update all item rel', len(tids), len(old_rels) #, len(self.peers), nsimpeers, tids.items()[:10]  # 37307 2500
-        if tids:
-            self.cacheSimUpdates('torrent', tids, delay, batch, update_interval)
-        """
+        
+        #print >> sys.stderr, '**************--- update all item rel', len(tids), len(old_rels)
+        return tids
 
     def sesscb_ntfy_myprefs(self,subject,changeType,objectID,*args):
         """ Called by SessionCallback thread """
@@ -2386,7 +2354,7 @@ class DataHandler:
         if torrent_id not in self.myprefs:
             insort(self.myprefs, torrent_id)
             self.old_peer_num = 0
-            self.updateAllSim() # time-consuming
+            self.updateMyPrefSim()
             #self.total_pref_changed += self.update_i2i_threshold
             
     def delMyPref(self, infohash):
@@ -2394,7 +2362,7 @@ class DataHandler:
         if torrent_id in self.myprefs:
             self.myprefs.remove(torrent_id)
             self.old_peer_num = 0
-            self.updateAllSim()
+            self.updateMyPrefSim()
             #self.total_pref_changed += self.update_i2i_threshold
 
     def initRemoteSearchPeers(self, num_peers=10):
@@ -23,6 +23,7 @@ Test:
 """
 
 from sets import Set
+from array import array
 
 def P2PSim(pref1, pref2):
     """ Calculate simple similarity between peers """
@@ -120,6 +121,90 @@ def P2PSim_Full(db_rows, nmyprefs):
         similarity[db_row[0]] = P2PSim_Single(db_row, nmyprefs)
     return similarity
 
+class PreferenceMatrix:
+    """
+    The peer x torrent preference relation as a sparse matrix.
+
+    The rows are stored in compressed sparse row format: the torrent ids of
+    the peer in row r are torrent_ids[indptr[r]:indptr[r+1]]. The columns
+    (torrent_id:array of rows) are kept as well, hence the similarity of all
+    peers and the relevance of all torrents are both computed in a single pass
+    over the entries of the matrix that are involved.
+    """
+    def __init__(self, preferences, num_prefs):
+        """ preferences is an iterable of (peer_id, torrent_id) pairs ordered
+        by peer_id, num_prefs an iterable of (peer_id, num_prefs) pairs. Only
+        peers with num_prefs are included, like the join with the Peer table
+        in SimilarityDBHandler.getPeersWithOverlap. """
+        self.num_prefs = dict(num_prefs)
+        self.peer_ids = array('l')
+        self.indptr = array('l', [0])
+        self.torrent_ids = array('l')
+        self.columns = {}
+        
+        row = -1
+        last_peer_id = None
+        included = False
+        for peer_id, torrent_id in preferences:
+            if peer_id != last_peer_id:
+                last_peer_id = peer_id
+                included = peer_id in self.num_prefs
+                if included:
+                    if row >= 0:
+                        self.indptr.append(len(self.torrent_ids))
+                    self.peer_ids.append(peer_id)
+                    row += 1
+            if included:
+                self.torrent_ids.append(torrent_id)
+                column = self.columns.get(torrent_id)
+                if column is None:
+                    column = self.columns[torrent_id] = array('l')
+                column.append(row)
+        if row >= 0:
+            self.indptr.append(len(self.torrent_ids))
+            
+    def __len__(self):
+        return len(self.torrent_ids)
+    
+    def getPeerSimilarities(self, myprefs, not_peer_id=None):
+        """ Returns {peer_id:similarity} for all peers that share at least one
+        torrent with myprefs, using the same formula as P2PSim_Single """
+        nmyprefs = len(myprefs)
+        if nmyprefs == 0:
+            return {}
+        
+        overlap = array('l', [0]) * len(self.peer_ids)
+        for torrent_id in set(myprefs):
+            for row in self.columns.get(torrent_id, ()):
+                overlap[row] += 1
+        
+        similarities = {}
+        peer_ids = self.peer_ids
+        num_prefs = self.num_prefs
+        for row in xrange(len(peer_ids)):
+            if overlap[row]:
+                peer_id = peer_ids[row]
+                if peer_id != not_peer_id:
+                    similarities[peer_id] = P2PSim_Single((peer_id, num_prefs[peer_id], overlap[row]), nmyprefs)
+        return similarities
+    
+    def getTorrentRelevances(self, similarities):
+        """ Returns {torrent_id:relevance} for all torrents of the peers with a
+        positive similarity. The relevance of a torrent is the average
+        similarity of these peers that have it plus their number. """
+        sums = {}
+        counts = {}
+        torrent_ids = self.torrent_ids
+        indptr = self.indptr
+        for row, peer_id in enumerate(self.peer_ids):
+            sim = similarities.get(peer_id, 0)
+            if sim > 0:
+                for torrent_id in torrent_ids[indptr[row]:indptr[row+1]]:
+                    sums[torrent_id] = sums.get(torrent_id, 0.0) + sim
+                    counts[torrent_id] = counts.get(torrent_id, 0) + 1
+        
+        return dict((torrent_id, sums[torrent_id] / counts[torrent_id] + counts[torrent_id]) for torrent_id in sums)
+
 def P2PSimColdStart(choose_from, not_in, nr):
     """
         choose_from has keys: ip port oversion num_torrents
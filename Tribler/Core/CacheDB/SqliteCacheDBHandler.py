@@ -5,7 +5,7 @@
 # for any function you add to database. 
 # Please reuse the functions in sqlitecachedb as much as possible
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str, str2bin, NULL, SQLiteNoCacheDB
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str, str2bin, NULL, SQLiteNoCacheDB, MAX_SQL_VARIABLES
 from copy import deepcopy,copy
 from traceback import print_exc, print_stack
 from time import time
@@ -1225,6 +1225,14 @@ class TorrentDBHandler(BasicDBHandler):
         assert isinstance(torrentdef, TorrentDef), "TORRENTDEF has invalid type: %s" % type(torrentdef)
         assert torrentdef.is_finalized(), "TORRENTDEF is not finalized"
         mime, thumb = torrentdef.get_thumbnail()
+        
+        # the category may be calculated beforehand, see Category.calculateCategories
+        category = extra_info.get("category")
+        if category is None:
+            # todo: the category_id is calculated directly from
+            # torrentdef.metainfo, the category checker should use
+            # the proper torrentdef api
+            category = self.category.calculateCategory(torrentdef.metainfo, torrentdef.get_name_as_unicode())
 
         return {"infohash":bin2str(torrentdef.get_infohash()),
                 "name":torrentdef.get_name_as_unicode(),
@@ -1237,10 +1245,7 @@ class TorrentDBHandler(BasicDBHandler):
                 "secret":0, # todo: check if torrent is secret
                 "relevance":0.0,
                 "source_id":self._getSourceID(source),
-                # todo: the category_id is calculated directly from
-                # torrentdef.metainfo, the category checker should use
-                # the proper torrentdef api
-                "category_id":self._getCategoryID(self.category.calculateCategory(torrentdef.metainfo, torrentdef.get_name_as_unicode())),
+                "category_id":self._getCategoryID(category),
                 "status_id":self._getStatusID(extra_info.get("status", "unknown")),
                 "num_seeders":extra_info.get("seeder", -1),
                 "num_leechers":extra_info.get("leecher", -1),
@@ -1415,6 +1420,28 @@ class TorrentDBHandler(BasicDBHandler):
             where = 'torrent_id=%d AND tracker=%s'%(torrent_id, repr(tracker))
         self._db.update('TorrentTracker', where, commit=commit, **update)
 
+    def updateTorrentChecks(self, checks, commit=True):
+        """ Stores the results of torrent checking in bulk. checks is a list
+        of (infohash, seeder, leecher, status, last_check_time, ignored_times,
+        retried_times) tuples, retried_times may be None to keep the current
+        value. Unknown infohashes are skipped. """
+        torrent_ids = self._db.getTorrentIDS([check[0] for check in checks])
+        torrent_values = []
+        tracker_values = []
+        for torrent_id, (_, seeder, leecher, status, last_check_time, ignored_times, retried_times) in zip(torrent_ids, checks):
+            if torrent_id is not None:
+                torrent_values.append((seeder, leecher, self._getStatusID(status), torrent_id))
+                tracker_values.append((last_check_time, ignored_times, retried_times, torrent_id))
+        
+        if torrent_values:
+            sql_update_torrent = "UPDATE Torrent SET num_seeders = ?, num_leechers = ?, status_id = ? WHERE torrent_id = ?"
+            self._db.executemany(sql_update_torrent, torrent_values, commit=False)
+            sql_update_tracker = "UPDATE TorrentTracker SET last_check = ?, ignored_times = ?, retried_times = COALESCE(?, retried_times) WHERE torrent_id = ? AND announce_tier = 1"
+            self._db.executemany(sql_update_tracker, tracker_values, commit=False)
+        
+        if commit:
+            self.commit()
+        
     def deleteTorrent(self, infohash, delete_file=False, commit = True):
         if not self.hasTorrent(infohash):
             return False
@@ -1814,8 +1841,13 @@ class TorrentDBHandler(BasicDBHandler):
         return self.hasTorrent(infohash)
     
     def getTorrentRelevances(self, tids):
-        sql = 'SELECT torrent_id, relevance from Torrent WHERE torrent_id in ' + str(tuple(tids))
-        return self._db.fetchall(sql)
+        tids = list(tids)
+        res = []
+        for begin in xrange(0, len(tids), MAX_SQL_VARIABLES):
+            parameters = tids[begin:begin+MAX_SQL_VARIABLES]
+            sql = 'SELECT torrent_id, relevance from Torrent WHERE torrent_id in (' + ','.join('?'*len(parameters)) + ')'
+            res.extend(self._db.fetchall(sql, parameters))
+        return res
     
     def updateTorrentRelevance(self, infohash, relevance):
         self.updateTorrent(infohash, relevance=relevance)
@@ -2186,6 +2218,8 @@ class TorrentDBHandler(BasicDBHandler):
                    'torrent_path':torrent_path,
                    'infohash':str2bin(res[4]),
                    'status':self.id2status[res[5]],
+                   'seeder':res[6],
+                   'leecher':res[7],
                    'last_check':res[8]
                   }
             return res
@@ -3377,14 +3411,16 @@ class ChannelCastDBHandler(object):
         channel_id = self._db.fetchone(get_channel, (peer_id,))
         
         if channel_id: #update this channel
+            self._indexChannel(channel_id, name)
             update_channel = "UPDATE _Channels SET dispersy_cid = ?, name = ?, description = ? WHERE id = ?"
             self._db.execute_write(update_channel, (_dispersy_cid, name, description, channel_id), commit = self.shouldCommit)
             
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_UPDATE, channel_id)
             
         else: #insert channel
-            insert_channel = "INSERT INTO _Channels (dispersy_cid, peer_id, name, description) VALUES (?, ?, ?, ?); SELECT last_insert_rowid();"
-            channel_id = self._db.fetchone(insert_channel, (_dispersy_cid, peer_id, name, description))
+            insert_channel = "INSERT INTO _Channels (dispersy_cid, peer_id, name, description) VALUES (?, ?, ?, ?)"
+            channel_id = self._db.execute_insert(insert_channel, (_dispersy_cid, peer_id, name, description))
+            self._indexChannel(channel_id, name, commit = True)
             
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_INSERT, channel_id)
             
@@ -3398,11 +3434,18 @@ class ChannelCastDBHandler(object):
             commit = self.shouldCommit
         
         if modification_type in ['name','description']:
+            if modification_type == 'name':
+                self._indexChannel(channel_id, modification_value)
             update_channel = "UPDATE _Channels Set " + modification_type + " = ?, modified = ? WHERE id = ?"
             self._db.execute_write(update_channel, (modification_value, long(time()), channel_id), commit = commit)
             
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_MODIFIED, channel_id)
     
+    def _indexChannel(self, channel_id, name, commit = False):
+        #INSERT OR REPLACE not working for fts3 table
+        self._db.execute_write(u"DELETE FROM ChannelFullTextIndex WHERE rowid = ?", (channel_id, ), commit = False)
+        self._db.execute_write(u"INSERT INTO ChannelFullTextIndex (rowid, name) VALUES (?, ?)", (channel_id, name), commit = commit)
+    
     #Requires all torrents to be from the same channel
     def on_torrents_from_dispersy(self, torrentlist):
         assert len(torrentlist) > 0
@@ -3414,6 +3457,7 @@ class ChannelCastDBHandler(object):
         insert_data = []
         insert_files = []
         insert_collecting = []
+        insert_torrentdefs = []
         updated_channels = {}
         
         for i, torrent in enumerate(torrentlist):
@@ -3449,8 +3493,8 @@ class ChannelCastDBHandler(object):
                 try:
                     torrentdef = TorrentDef.load_from_dict(metainfo)
                     torrentdef.infohash = infohash
-                
-                    self.torrent_db._addTorrentToDB(torrentdef, "DISP", {}, False)
+                    
+                    insert_torrentdefs.append(torrentdef)
                     
                 except:
                     print >> sys.stderr, "Could not create a TorrentDef instance", channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers
@@ -3468,6 +3512,20 @@ class ChannelCastDBHandler(object):
             
             updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
         
+        if len(insert_torrentdefs) > 0:
+            try:
+                categories = self.torrent_db.category.calculateCategories([(torrentdef.metainfo, torrentdef.get_name_as_unicode()) for torrentdef in insert_torrentdefs])
+            except:
+                # fall back to categorizing each torrent in _addTorrentToDB
+                print_exc()
+                categories = [None] * len(insert_torrentdefs)
+            for torrentdef, category in zip(insert_torrentdefs, categories):
+                try:
+                    self.torrent_db._addTorrentToDB(torrentdef, "DISP", {"category":category}, False)
+                except:
+                    print >> sys.stderr, "Could not add torrent", torrentdef.get_name_as_unicode(), bin2str(torrentdef.get_infohash())
+                    print_exc()
+        
         if len(insert_data) > 0:
             sql_insert_torrent = "INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, time_stamp) VALUES (?,?,?,?,?,?)"
             self._db.executemany(sql_insert_torrent, insert_data, commit = False)
@@ -3586,6 +3644,7 @@ class ChannelCastDBHandler(object):
             
             if channel_id in latest_update:
                 new_name = latest_update[channel_id][1][:40]
+                self._indexChannel(channel_id, new_name)
                 self._db.execute_write(update_name, (new_name, modified, nrTorrents, channel_id), commit = False)
             else:
                 self._db.execute_write(update_channel, (modified, nrTorrents , channel_id), commit = False)
@@ -3609,8 +3668,8 @@ class ChannelCastDBHandler(object):
         mid_global_time = buffer(mid_global_time)
 
         
-        sql = "INSERT OR REPLACE INTO _Comments (channel_id, dispersy_id, peer_id, comment, reply_to_id, reply_after_id, time_stamp) VALUES (?, ?, ?, ?, ?, ?, ?); SELECT last_insert_rowid();"
-        comment_id = self._db.fetchone(sql, (channel_id, dispersy_id, peer_id, comment, reply_to, reply_after, timestamp))
+        sql = "INSERT OR REPLACE INTO _Comments (channel_id, dispersy_id, peer_id, comment, reply_to_id, reply_after_id, time_stamp) VALUES (?, ?, ?, ?, ?, ?, ?)"
+        comment_id = self._db.execute_insert(sql, (channel_id, dispersy_id, peer_id, comment, reply_to, reply_after, timestamp))
         
         if playlist_dispersy_id or infohash:
             if playlist_dispersy_id:
@@ -3701,8 +3760,8 @@ class ChannelCastDBHandler(object):
         if isinstance(prev_modification_id, (str)):
             prev_modification_id = buffer(prev_modification_id)
         
-        sql = "INSERT OR REPLACE INTO _ChannelMetaData (dispersy_id, channel_id, peer_id, type_id, value, time_stamp, prev_modification, prev_global_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?); SELECT last_insert_rowid();"
-        metadata_id = self._db.fetchone(sql, (dispersy_id, channel_id, peer_id, modification_type_id, modification_value, timestamp, prev_modification_id, prev_modification_global_time))
+        sql = "INSERT OR REPLACE INTO _ChannelMetaData (dispersy_id, channel_id, peer_id, type_id, value, time_stamp, prev_modification, prev_global_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        metadata_id = self._db.execute_insert(sql, (dispersy_id, channel_id, peer_id, modification_type_id, modification_value, timestamp, prev_modification_id, prev_modification_global_time))
         
         if channeltorrent_id:
             sql = "INSERT INTO MetaDataTorrent (metadata_id, channeltorrent_id) VALUES (?,?)"
@@ -4124,39 +4183,41 @@ class ChannelCastDBHandler(object):
         keywords = [keyword for keyword in keywords if len(keyword) > 1]
         
         if len(keywords) > 0:
-            sql = "SELECT distinct id, dispersy_cid, name FROM Channels WHERE"
-            for keyword in keywords:
-                sql += " name like '%"+keyword+"%' and"
-                
+            select_channels = "SELECT C.id FROM Channels C, ChannelFullTextIndex WHERE C.id = ChannelFullTextIndex.rowid AND ChannelFullTextIndex MATCH ?"
             if dispersyOnly:
-                sql += " dispersy_cid != '-1'"
-            else:
-                sql = sql[:-3]
-            
+                select_channels += " AND C.dispersy_cid != '-1'"
             if limitChannels:
-                sql += " LIMIT %d"%limitChannels
-                   
-            channels = self._db.fetchall(sql)
-            select_torrents = "SELECT infohash, ChannelTorrents.name, Torrent.name, time_stamp from Torrent, ChannelTorrents WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND channel_id = ? ORDER BY num_seeders DESC LIMIT ?"
+                select_channels += " LIMIT %d"%limitChannels
+            
+            # the torrents of all matching channels at once, ordered by channel
+            # and number of seeders, at most limitTorrents per channel
+            sql = """SELECT C.id, C.dispersy_cid, C.name, infohash, CT.name, T.name, CT.time_stamp
+                     FROM Channels C, ChannelTorrents CT, Torrent T
+                     WHERE C.id IN (%s) AND CT.channel_id = C.id AND T.torrent_id = CT.torrent_id
+                     AND CT.id IN (SELECT CT2.id FROM ChannelTorrents CT2, Torrent T2
+                                   WHERE CT2.channel_id = C.id AND T2.torrent_id = CT2.torrent_id
+                                   ORDER BY T2.num_seeders DESC LIMIT ?)
+                     ORDER BY C.id, T.num_seeders DESC"""%select_channels
             
             limitTorrents = limitTorrents or 20
             
             results = []
-            for channel_id, dispersy_cid, name in channels:
-                dispersy_cid = str(dispersy_cid)
-                torrents = self._db.fetchall(select_torrents, (channel_id, limitTorrents))
-                for infohash, ChTname, CoTname, time_stamp in torrents:
-                    infohash = str2bin(infohash)
-                    results.append((channel_id, dispersy_cid, name, infohash, ChTname or CoTname, time_stamp))
+            for channel_id, dispersy_cid, name, infohash, ChTname, CoTname, time_stamp in self._db.fetchall(sql, (self._getChannelMatch(keywords), limitTorrents)):
+                results.append((channel_id, str(dispersy_cid), name, str2bin(infohash), ChTname or CoTname, time_stamp))
             return results
         return []
     
     def searchChannels(self, keywords):
-        sql = "SELECT id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam FROM Channels WHERE"
-        for keyword in keywords:
-            sql += " name like '%"+keyword+"%' and"
-        sql = sql[:-3]
-        return self._getChannels(sql)
+        keywords = split_into_keywords(" ".join(keywords))
+        if len(keywords) > 0:
+            sql = "SELECT C.id, C.name, C.description, C.dispersy_cid, C.modified, C.nr_torrents, C.nr_favorite, C.nr_spam FROM Channels C, ChannelFullTextIndex WHERE C.id = ChannelFullTextIndex.rowid AND ChannelFullTextIndex MATCH ?"
+            return self._getChannels(sql, (self._getChannelMatch(keywords),))
+        return []
+    
+    def _getChannelMatch(self, keywords):
+        # every keyword is a prefix query, like the name like '%keyword%'
+        # queries that were used before it also matches longer words
+        return u" ".join(keyword + u"*" for keyword in keywords)
 
     def getChannelNames(self, permids):
         names = {}
@@ -4855,8 +4916,8 @@ class TermDBHandler(BasicDBHandler):
         if term_id:
             return term_id
         else:
-            self.insertTerm(term, commit=True) # this HAS to commit, otherwise last_insert_row_id() won't work. 
-            return self.getOne("last_insert_rowid()")
+            self.insertTerm(term, commit=True)
+            return self.getTermIDNoInsert(term)
     
     def insertTerm(self, term, commit=True):
         """creates a new entry for term in table Term"""
@@ -4939,6 +5000,17 @@ class SimilarityDBHandler:
         row = self._db.fetchall(sql_get_peers_with_overlap, (not_peer_id,))
         return row
     
+    def getAllPreferences(self):
+        """ Returns an iterator over all (peer_id, torrent_id) pairs ordered
+        by peer_id """
+        sql_get_all_preferences = "SELECT peer_id, torrent_id FROM Preference ORDER BY peer_id"
+        return self._db.execute_read(sql_get_all_preferences)
+    
+    def getAllNumPrefs(self):
+        """ Returns (peer_id, num_prefs) for all peers that have preferences """
+        sql_get_all_num_prefs = "SELECT peer_id, num_prefs FROM Peer WHERE peer_id IN (SELECT DISTINCT peer_id FROM Preference)"
+        return self._db.fetchall(sql_get_all_num_prefs)
+    
     def getTorrentsWithSimilarity(self, myprefs, top_x):
         sql_get_torrents_with_similarity = """SELECT similarity, torrent_id FROM Peer
                                               JOIN Preference ON Peer.peer_id = Preference.peer_id
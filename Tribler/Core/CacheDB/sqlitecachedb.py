@@ -7,6 +7,7 @@ import os
 from time import sleep, time
 from base64 import encodestring, decodestring
 import threading
+from Queue import Queue
 from traceback import print_exc, print_stack
 
 from Tribler.Core.simpledefs import INFOHASH_LENGTH, NTFY_DISPERSY, NTFY_STARTED
@@ -30,7 +31,8 @@ from Tribler.Core.Utilities.utilities import get_collected_torrent_filename
 ##Changed from 8 to 9 for Niels's Open2Edit tables
 ##Changed from 9 to 10 for Fix in Open2Edit PlayListTorrent table
 ##Changed from 10 to 11 add a index on channeltorrent.torrent_id to improve search performance
-CURRENT_MAIN_DB_VERSION = 11
+##Changed from 11 to 12 add a full-text index on channel names to improve channel search performance
+CURRENT_MAIN_DB_VERSION = 12
 
 TEST_SQLITECACHEDB_UPGRADE = False
 CREATE_SQL_FILE = None
@@ -39,6 +41,8 @@ DB_FILE_NAME = 'tribler.sdb'
 DB_DIR_NAME = 'sqlite'    # db file path = DB_DIR_NAME/DB_FILE_NAME
 DEFAULT_BUSY_TIMEOUT = 10000
 MAX_SQL_BATCHED_TO_TRANSACTION = 1000   # don't change it unless carefully tested. A transaction with 1000 batched updates took 1.5 seconds
+MAX_SQL_VARIABLES = 500     # SQLite allows at most 999 variables in a single statement
+DEFAULT_ID_CACHE_SIZE = 50000   # number of permid:peer_id and infohash:torrent_id pairs kept in memory
 NULL = None
 icon_dir = None
 SHOW_ALL_EXECUTE = False
@@ -47,6 +51,7 @@ cost_reads = []
 torrent_dir = None
 config_dir = None
 TEST_OVERRIDE = False
+USE_WRITER_THREAD = True    # perform all writes to the database file on a single DatabaseWriter thread
 
 
 DEBUG = False
@@ -76,10 +81,16 @@ def init(config, db_exception_handler = None):
     icon_dir = os.path.abspath(config['peer_icon_path'])
 
     sqlitedb.initDB(sqlite_db_path, CREATE_SQL_FILE)  # the first place to create db in Tribler
+    if USE_WRITER_THREAD and sqlite_db_path != ':memory:':
+        # every thread has its own connection, hence an in-memory database can not be shared
+        sqlitedb.start_writer()
     return sqlitedb
         
 def done(config_dir):
-    SQLiteCacheDB.getInstance().close()
+    sqlitedb = SQLiteCacheDB.getInstance()
+    print >>sys.stderr,"cachedb: done: id caches",sqlitedb.getIdCacheStats()
+    sqlitedb.stop_writer()
+    sqlitedb.close()
 
 def make_filename(config_dir,filename):
     if config_dir is None:
@@ -167,6 +178,214 @@ class safe_dict(dict):
         finally:
             self.lock.release()
 
+class IdCache:
+    """
+    A bounded two-way mapping between keys (permids or infohashes) and the
+    ids of their rows in the database.
+
+    The pairs are kept in two generations. A lookup that finds a pair in the
+    old generation moves it to the new one, when the new generation is full
+    the old one is discarded. This approximates a least recently used policy
+    at a constant cost per lookup.
+    """
+    def __init__(self, max_size=DEFAULT_ID_CACHE_SIZE):
+        self.lock = threading.RLock()
+        self.max_generation = max(1, max_size / 2)
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            # {key:id} and {id:key} for both generations
+            self.new_ids = {}
+            self.new_keys = {}
+            self.old_ids = {}
+            self.old_keys = {}
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.new_ids) + len(self.old_ids)
+
+    def __contains__(self, key):
+        return key in self.new_ids or key in self.old_ids
+
+    def add(self, key, id):
+        self.lock.acquire()
+        try:
+            self._remove(key, id)
+            if len(self.new_ids) >= self.max_generation:
+                self.old_ids = self.new_ids
+                self.old_keys = self.new_keys
+                self.new_ids = {}
+                self.new_keys = {}
+            self.new_ids[key] = id
+            self.new_keys[id] = key
+        finally:
+            self.lock.release()
+
+    def remove(self, key=None, id=None):
+        self.lock.acquire()
+        try:
+            self._remove(key, id)
+        finally:
+            self.lock.release()
+
+    def _remove(self, key, id):
+        for ids, keys in ((self.new_ids, self.new_keys), (self.old_ids, self.old_keys)):
+            if key in ids:
+                keys.pop(ids.pop(key), None)
+            if id in keys:
+                ids.pop(keys.pop(id), None)
+
+    def get_id(self, key):
+        """ Returns the id for key, or None when it is not cached """
+        id = self.new_ids.get(key)
+        if id is None:
+            id = self.old_ids.get(key)
+            if id is None:
+                self.misses += 1
+                return None
+            self.add(key, id)
+        self.hits += 1
+        return id
+
+    def get_key(self, id):
+        """ Returns the key for id, or None when it is not cached """
+        key = self.new_keys.get(id)
+        if key is None:
+            key = self.old_keys.get(id)
+            if key is None:
+                self.misses += 1
+                return None
+            self.add(key, id)
+        self.hits += 1
+        return key
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': lookups and float(self.hits) / lookups or 0.0}
+
+class DatabaseFuture:
+    """
+    The result of statements submitted to the DatabaseWriter.
+
+    When given, callback(future) is called on the DatabaseWriter thread once
+    the statements are committed or failed.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.event = threading.Event()
+        self.value = None
+        self.exception = None
+
+    def done(self):
+        return self.event.isSet()
+
+    def set_result(self, value, exception=None):
+        self.value = value
+        self.exception = exception
+        self.event.set()
+        if self.callback:
+            try:
+                self.callback(self)
+            except:
+                print_exc()
+
+    def result(self, timeout=None):
+        """ Wait until the statements are committed. Raises the exception of
+        a failed transaction. """
+        self.event.wait(timeout)
+        if not self.event.isSet():
+            raise Exception, "cachedb: timeout while waiting for the DatabaseWriter"
+        if self.exception:
+            raise self.exception
+        return self.value
+
+class DatabaseWriter(threading.Thread):
+    """
+    Owns the only connection that writes to the database file.
+
+    Other threads submit their cached statements and, unless they use the
+    async API, wait for the returned DatabaseFuture. Statements that are
+    submitted while a transaction is running are committed together in the
+    next transaction. Since there is only one writer, other connections are
+    opened read-only and, with the database in WAL mode, never wait for a
+    write to finish.
+    """
+    def __init__(self, db):
+        threading.Thread.__init__(self, name="DatabaseWriter")
+        self.setDaemon(True)
+        self.db = db
+        self.queue = Queue()
+        self.ready = threading.Event()
+
+    def is_current(self):
+        return threading.currentThread() is self
+
+    def submit(self, sql_queue, thread_name=None, callback=None, rowid=False):
+        """ Commit sql_queue, a list of (sql, args) tuples, on the writer
+        thread. Statements of a failed batch that were not tried are given
+        back to the cache of thread_name. Returns a DatabaseFuture, its value
+        is the rowid of the last inserted row when rowid is True. """
+        future = DatabaseFuture(callback)
+        self.queue.put((sql_queue, thread_name, future, rowid))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        # the connection of this thread is the only one that may write
+        try:
+            cur = self.db.getCursor()
+            cur.execute("PRAGMA synchronous = NORMAL;")
+        finally:
+            self.ready.set()
+
+        running = True
+        while running:
+            jobs = [self.queue.get()]
+            # everything that was submitted in the meantime is committed at once
+            while not self.queue.empty():
+                jobs.append(self.queue.get())
+            if None in jobs:
+                running = False
+                jobs = [job for job in jobs if job is not None]
+
+            # the rowid can only be reported when a job has its own transaction
+            if len(jobs) > 1 and sum(len(job_queue) for job_queue, _, _, _ in jobs) <= MAX_SQL_BATCHED_TO_TRANSACTION \
+                    and not any(rowid for _, _, _, rowid in jobs):
+                sql_queue = []
+                for job_queue, _, _, _ in jobs:
+                    sql_queue.extend(job_queue)
+                try:
+                    self.db._commit_statements(sql_queue)
+                except:
+                    # the transaction was rolled back, commit the jobs one by
+                    # one to report the error to the right one
+                    pass
+                else:
+                    for _, _, future, _ in jobs:
+                        future.set_result(None)
+                    continue
+
+            for sql_queue, thread_name, future, rowid in jobs:
+                try:
+                    self.db._commit_statements(sql_queue, thread_name)
+                except Exception, e:
+                    future.set_result(None, e)
+                else:
+                    future.set_result(rowid and self.db.last_insert_rowid() or None)
+
+        self.db.close()
+
 class SQLiteCacheDBBase:
     lock = threading.RLock()
 
@@ -176,9 +395,10 @@ class SQLiteCacheDBBase:
         self.cache_transaction_table = safe_dict()   # {thread_name:[sql]
         self.class_variables = safe_dict({'db_path':None,'busytimeout':None})  # busytimeout is in milliseconds
         
-        self.permid_id = safe_dict()    
-        self.infohash_id = safe_dict()
+        self.permid_id = IdCache()      # permid:peer_id pairs
+        self.infohash_id = IdCache()    # infohash:torrent_id pairs
         self.show_execute = False
+        self.writer = None      # DatabaseWriter, when started all writes are done on its thread
         
         #TODO: All global variables must be protected to be thread safe?
         self.status_table = None
@@ -192,6 +412,8 @@ class SQLiteCacheDBBase:
     def close(self, clean=False):
         # only close the connection object in this thread, don't close other thread's connection object
         thread_name = threading.currentThread().getName()
+        if clean:
+            self.stop_writer()
         cur = self.getCursor(create=False)
         
         if cur:
@@ -207,8 +429,8 @@ class SQLiteCacheDBBase:
             except:
                 print_exc()
         if clean:    # used for test suite
-            self.permid_id = safe_dict()
-            self.infohash_id = safe_dict()
+            self.permid_id = IdCache()
+            self.infohash_id = IdCache()
             self.exception_handler = None
             self.class_variables = safe_dict({'db_path':None,'busytimeout':None})
             self.cursor_table = safe_dict()
@@ -249,7 +471,11 @@ class SQLiteCacheDBBase:
             if db_dir and not os.path.isdir(db_dir):
                 os.makedirs(db_dir)            
         
-        con = apsw.Connection(dbfile_path)
+        if self.writer and not self.writer.is_current():
+            # all writes are done by the DatabaseWriter
+            con = apsw.Connection(dbfile_path, flags=apsw.SQLITE_OPEN_READONLY)
+        else:
+            con = apsw.Connection(dbfile_path)
         con.setbusytimeout(busytimeout)
 
         cur = con.cursor()
@@ -271,6 +497,36 @@ class SQLiteCacheDBBase:
             
         return cur
     
+    def start_writer(self):
+        """
+        Start the DatabaseWriter thread. From now on all cached statements are
+        committed on this thread and connections opened by other threads are
+        read-only. The database is switched to WAL mode, such that readers do
+        not block the writer and the writer does not block readers.
+        Connections opened before are not affected, they should only be used
+        for reading.
+        """
+        if self.writer is None:
+            # the journal mode is stored in the database file
+            mode = self.fetchone("PRAGMA journal_mode = WAL;")
+            if str(mode).lower() != 'wal':
+                print >> sys.stderr, "cachedb: unable to use WAL mode, journal mode is", mode
+            self.writer = DatabaseWriter(self)
+            self.writer.start()
+            
+            # the writer opens its connection before the read-only connections are opened
+            self.writer.ready.wait()
+            
+    def stop_writer(self):
+        """ Commit the statements submitted to the DatabaseWriter and stop it.
+        Read-only connections remain read-only, hence this is only used when
+        the database is closed. """
+        writer = self.writer
+        if writer:
+            self.writer = None
+            if not writer.is_current():
+                writer.stop()
+            
     def createDBTable(self, sql_create_table, dbfile_path, busytimeout=DEFAULT_BUSY_TIMEOUT):
         """ 
         Create a SQLite database.
@@ -480,6 +736,24 @@ class SQLiteCacheDBBase:
             raise msg
         
 
+    def _executemany(self, sql, args):
+        cur = self.getCursor()
+
+        if SHOW_ALL_EXECUTE or self.show_execute:
+            thread_name = threading.currentThread().getName()
+            print >> sys.stderr, '===', thread_name, '===\n', sql, '\n-----\n', args, '\n======\n'
+
+        try:
+            return cur.executemany(sql, args)
+            
+        except Exception, msg:
+            if not str(msg).startswith("BusyError"):
+                print_exc()
+                print >> sys.stderr, "cachedb: executemany error:", Exception, msg 
+                thread_name = threading.currentThread().getName()
+                print >> sys.stderr, '===', thread_name, '===\nSQL Type:', type(sql), '\n-----\n', sql, '\n-----\n', len(args), 'argument lists\n======\n'
+            raise msg
+
     def execute_read(self, sql, args=None):
         # this is only called for reading. If you want to write the db, always use execute_write or executemany
         return self._execute(sql, args)
@@ -506,47 +780,113 @@ class SQLiteCacheDBBase:
             self.cache_transaction_table[thread_name] = []
         self.cache_transaction_table[thread_name].append((sql, args))
                     
-    def transaction(self, sql=None, args=None):
+    def transaction(self, sql=None, args=None, rowid=False):
         if sql:
             self.cache_transaction(sql, args)
         
         thread_name = threading.currentThread().getName()
         
-        n = 0
-        sql_full = ''
-        arg_list = []
         sql_queue = self.cache_transaction_table.get(thread_name,None)
         if sql_queue:
-            while True:
-                try:
-                    _sql,_args = sql_queue.pop(0)
-                except IndexError:
-                    break
+            # take all queued statements at once, statements that are cached
+            # while these are executed will be executed by the next commit
+            self.cache_transaction_table[thread_name] = []
+            
+            writer = self.writer
+            if writer and not writer.is_current():
+                # wait, the caller expects to read its own writes
+                return writer.submit(sql_queue, thread_name, rowid=rowid).result()
+            else:
+                self._commit_statements(sql_queue, thread_name)
+                if rowid:
+                    return self.last_insert_rowid()
+    
+    def execute_insert(self, sql, args=None):
+        """ Commits sql, an INSERT statement, together with the statements
+        cached by this thread. Returns the rowid of the inserted row.
+        
+        Use this instead of appending 'SELECT last_insert_rowid()' to the
+        statement, the connections of other threads than the DatabaseWriter
+        can not write. """
+        return self.transaction(sql, args, rowid=True)
+    
+    def last_insert_rowid(self):
+        return self.getCursor().getconnection().last_insert_rowid()
                 
-                _sql = _sql.strip()
-                if not _sql:
-                    continue
-                if not _sql.endswith(';'):
-                    _sql += ';'
-                sql_full += _sql + '\n'
-                if _args != None:
-                    arg_list += list(_args)
-                n += 1
+    def _commit_statements(self, sql_queue, thread_name=None):
+        # if too many sql in cache, split them into batches to prevent processing and locking DB for a long time
+        # TODO: optimize the value of MAX_SQL_BATCHED_TO_TRANSACTION
+        for begin in xrange(0, len(sql_queue), MAX_SQL_BATCHED_TO_TRANSACTION):
+            try:
+                self._transaction(self._group_statements(sql_queue[begin:begin+MAX_SQL_BATCHED_TO_TRANSACTION]))
+            except:
+                # keep the statements of the batches that were not tried
+                remaining = sql_queue[begin+MAX_SQL_BATCHED_TO_TRANSACTION:]
+                if remaining and thread_name:
+                    self.cache_transaction_table[thread_name] = remaining + self.cache_transaction_table.get(thread_name, [])
+                raise
                 
-                # if too many sql in cache, split them into batches to prevent processing and locking DB for a long time
-                # TODO: optimize the value of MAX_SQL_BATCHED_TO_TRANSACTION
-                if n % MAX_SQL_BATCHED_TO_TRANSACTION == 0:
-                    self._transaction(sql_full, arg_list)
-                    sql_full = ''
-                    arg_list = []
+    def execute_write_async(self, sql, args=None, callback=None):
+        """ Commit a single statement without waiting for it. Returns a
+        DatabaseFuture, callback(future) is called when the statement is
+        committed. Without a DatabaseWriter the statement is committed
+        immediately. """
+        return self.executemany_async(sql, [args], callback)
+        
+    def executemany_async(self, sql, args, callback=None):
+        """ Like execute_write_async, for a statement executed once for
+        each item in args """
+        sql_queue = [(sql, arg) for arg in args]
+        writer = self.writer
+        if writer and not writer.is_current():
+            return writer.submit(sql_queue, None, callback)
+        
+        future = DatabaseFuture(callback)
+        try:
+            self._commit_statements(sql_queue)
+        except Exception, e:
+            future.set_result(None, e)
+        else:
+            future.set_result(None)
+        return future
                     
-            self._transaction(sql_full, arg_list)
+    def _group_statements(self, sql_queue):
+        """ Returns a list of (sql, arg_list) tuples where consecutive
+        statements with the same sql are grouped together, such that they
+        can be executed with a single executemany. arg_list is None for
+        statements without arguments. """
+        groups = []
+        last_sql = None
+        for _sql, _args in sql_queue:
+            _sql = _sql.strip()
+            if not _sql:
+                continue
+            if _args is None:
+                groups.append((_sql, None))
+                last_sql = None
+            elif _sql == last_sql:
+                groups[-1][1].append(_args)
+            else:
+                groups.append((_sql, [_args]))
+                last_sql = _sql
+        return groups
             
-    def _transaction(self, sql, args=None):
-        if sql:
-            sql = 'BEGIN TRANSACTION; \n' + sql + 'COMMIT TRANSACTION;'
+    def _transaction(self, groups):
+        if groups:
+            sql = 'BEGIN TRANSACTION;'
             try:
-                self._execute(sql, args)
+                self._execute(sql)
+                for group_sql, arg_list in groups:
+                    # sql is the statement reported when the transaction fails
+                    sql = group_sql
+                    if arg_list is None:
+                        self._execute(sql)
+                    elif len(arg_list) == 1:
+                        self._execute(sql, arg_list[0])
+                    else:
+                        self._executemany(sql, arg_list)
+                sql = 'COMMIT TRANSACTION;'
+                self._execute(sql)
             except Exception,e:
                 self.commit_retry_if_busy_or_rollback(e,0,sql=sql)
             
@@ -655,6 +995,23 @@ class SQLiteCacheDBBase:
                 arg.append(v)
         sql = sql[:-5]
         self.execute_write(sql, argv.values(), commit)
+        
+        # the ids of deleted rows may be reused
+        if table_name == 'Torrent':
+            self._invalidateIds(self.infohash_id, argv.get('torrent_id'))
+        elif table_name == 'Peer':
+            self._invalidateIds(self.permid_id, argv.get('peer_id'))
+            
+    def _invalidateIds(self, cache, id):
+        if isinstance(id, (int, long)):
+            cache.remove(id=id)
+        else:
+            cache.clear()
+            
+    def getIdCacheStats(self):
+        """ Returns the size and hit rate of the permid and infohash caches """
+        return {'peer': self.permid_id.get_stats(),
+                'torrent': self.infohash_id.get_stats()}
     
     # -------- Read Operations --------
     def size(self, table_name):
@@ -821,47 +1178,52 @@ class SQLiteCacheDBBase:
                 self.delete('Peer', peer_id=peer_id, commit=commit)
             else:
                 self.delete('Peer', peer_id=peer_id, friend=0, superpeer=0, commit=commit)
-            deleted = not self.hasPeer(permid, check_db=True)
-            if deleted and permid in self.permid_id:
-                self.permid_id.pop(permid)
+            if permid is None:
+                deleted = self.fetchone("SELECT peer_id FROM Peer WHERE peer_id==?", (peer_id,)) is None
+            else:
+                deleted = not self.hasPeer(permid, check_db=True)
+            if deleted:
+                self.permid_id.remove(permid, peer_id)
 
         return deleted
                 
     def getPeerID(self, permid):
         assert isinstance(permid, str), permid
         # permid must be binary
-        if permid in self.permid_id:
-            return self.permid_id[permid]
+        peer_id = self.permid_id.get_id(permid)
+        if peer_id is not None:
+            return peer_id
         
         sql_get_peer_id = "SELECT peer_id FROM Peer WHERE permid==?"
         peer_id = self.fetchone(sql_get_peer_id, (bin2str(permid),))
         if peer_id != None:
-            self.permid_id[permid] = peer_id
+            self.permid_id.add(permid, peer_id)
         
         return peer_id
     
     def getPeerIDS(self, permids):
+        to_return = []
         to_select = []
-        
         for permid in permids:
             assert isinstance(permid, str), permid
-            
-            if permid not in self.permid_id:
-                to_select.append(permid)
-        
-        if len(to_select) > 0:
-            parameters = '?,'*len(to_select)
-            sql_get_peer_ids = "SELECT peer_id, permid FROM Peer WHERE permid IN ("+parameters[:-1]+")"
-            peerids = self.fetchall(sql_get_peer_ids, to_select)
-            for peer_id, permid in peerids:
-                self.permid_id[permid] = peer_id
+            peer_id = self.permid_id.get_id(permid)
+            if peer_id is None:
+                to_select.append(bin2str(permid))
+            to_return.append(peer_id)
         
-        to_return = []
-        for permid in permids:
-            if permid in self.permid_id:
-                to_return.append(self.permid_id[permid])
-            else:
-                to_return.append(None)
+        if to_select:
+            found = {}
+            for begin in xrange(0, len(to_select), MAX_SQL_VARIABLES):
+                parameters = to_select[begin:begin+MAX_SQL_VARIABLES]
+                sql_get_peer_ids = "SELECT peer_id, permid FROM Peer WHERE permid IN ("+','.join('?'*len(parameters))+")"
+                for peer_id, permid in self.fetchall(sql_get_peer_ids, parameters):
+                    permid = str2bin(permid)
+                    self.permid_id.add(permid, peer_id)
+                    found[permid] = peer_id
+            
+            for i, permid in enumerate(permids):
+                if to_return[i] is None:
+                    to_return[i] = found.get(permid)
         return to_return
     
     def hasPeer(self, permid, check_db=False):
@@ -897,55 +1259,58 @@ class SQLiteCacheDBBase:
             
         if torrent_id != None:
             self.delete('Torrent', torrent_id=torrent_id, commit=commit)
-            if infohash in self.infohash_id:
-                self.infohash_id.pop(infohash)
     
     def getTorrentID(self, infohash):
         assert isinstance(infohash, str), "INFOHASH has invalid type: %s" % type(infohash)
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
-        if infohash in self.infohash_id:
-            return self.infohash_id[infohash]
+        tid = self.infohash_id.get_id(infohash)
+        if tid is not None:
+            return tid
         
         sql_get_torrent_id = "SELECT torrent_id FROM Torrent WHERE infohash==?"
         tid = self.fetchone(sql_get_torrent_id, (bin2str(infohash),))
         if tid != None:
-            self.infohash_id[infohash] = tid
+            self.infohash_id.add(infohash, tid)
         return tid
     
     def getTorrentIDS(self, infohashes):
+        to_return = []
         to_select = []
-        
         for infohash in infohashes:
             assert isinstance(infohash, str), "INFOHASH has invalid type: %s" % type(infohash)
             assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
-            
-            if not infohash in self.infohash_id:
+            torrent_id = self.infohash_id.get_id(infohash)
+            if torrent_id is None:
                 to_select.append(bin2str(infohash))
+            to_return.append(torrent_id)
         
-        while len(to_select) > 0:
-            nrToQuery = min(len(to_select), 50)
-            parameters = '?,'*nrToQuery
-            sql_get_torrent_ids = "SELECT torrent_id, infohash FROM Torrent WHERE infohash IN ("+parameters[:-1]+")"
-            
-            torrents = self.fetchall(sql_get_torrent_ids, to_select[:nrToQuery])
-            for torrent_id, infohash in torrents:
-                self.infohash_id[str2bin(infohash)] = torrent_id
-                
-            to_select = to_select[nrToQuery:]
-        
-        to_return = []
-        for infohash in infohashes:
-            if infohash in self.infohash_id:
-                to_return.append(self.infohash_id[infohash])
-            else:
-                to_return.append(None)
+        if to_select:
+            found = {}
+            for begin in xrange(0, len(to_select), MAX_SQL_VARIABLES):
+                parameters = to_select[begin:begin+MAX_SQL_VARIABLES]
+                sql_get_torrent_ids = "SELECT torrent_id, infohash FROM Torrent WHERE infohash IN ("+','.join('?'*len(parameters))+")"
+                for torrent_id, infohash in self.fetchall(sql_get_torrent_ids, parameters):
+                    infohash = str2bin(infohash)
+                    self.infohash_id.add(infohash, torrent_id)
+                    found[infohash] = torrent_id
+            
+            for i, infohash in enumerate(infohashes):
+                if to_return[i] is None:
+                    to_return[i] = found.get(infohash)
         return to_return
         
     def getInfohash(self, torrent_id):
+        infohash = self.infohash_id.get_key(torrent_id)
+        if infohash is not None:
+            return infohash
+        
         sql_get_infohash = "SELECT infohash FROM Torrent WHERE torrent_id==?"
         arg = (torrent_id,)
         ret = self.fetchone(sql_get_infohash, arg)
+        if ret is None:
+            return None
         ret = str2bin(ret)
+        self.infohash_id.add(ret, torrent_id)
         return ret
     
     def getTorrentStatusTable(self):
@@ -2000,7 +2365,14 @@ ALTER TABLE Peer ADD COLUMN services integer DEFAULT 0;
             
         if fromver < 11:
             index = "CREATE INDEX IF NOT EXISTS ChannelTorIndex ON _ChannelTorrents(torrent_id)"
-            self.execute_write(index)           
+            self.execute_write(index)
+
+        if fromver < 12:
+            create_index = "CREATE VIRTUAL TABLE ChannelFullTextIndex USING fts3(name)"
+            self.execute_write(create_index, commit=False)
+
+            fill_index = "INSERT INTO ChannelFullTextIndex (rowid, name) SELECT id, name FROM _Channels"
+            self.execute_write(fill_index)
             
 class SQLiteCacheDB(SQLiteCacheDBV5):
     __single = None    # used for multithreaded singletons pattern
@@ -2069,6 +2441,10 @@ class SQLiteNoCacheDB(SQLiteCacheDBV5):
         else:
             self.shouldCommit = True
     
+    def execute_insert(self, sql, args=None):
+        self.execute_write(sql, args)
+        return self.last_insert_rowid()
+    
     def executemany(self, sql, args, commit=True):
         if not self.shouldCommit:
             self._execute("BEGIN;")
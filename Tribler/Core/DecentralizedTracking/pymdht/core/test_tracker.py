@@ -166,3 +166,38 @@ class TestTracker(object):
         time.unmock()
         time = tracker.time = time.actual_time
 
+
+
+class TestTrackerLoad(object):
+
+    def setup(self):
+        global time
+        time = tracker.time = MockTime()
+        self.t = tracker.Tracker(VALIDITY_PERIOD, CLEANUP_COUNTER)
+
+    def test_load(self):
+        num_keys = 100000
+        start = time.actual_time.time()
+        # Three peers per key, announced within half a validity period
+        for i in xrange(3 * num_keys):
+            self.t.put(i % num_keys, ('1.2.3.4', i % 3))
+            if i % 1000 == 999:
+                time.sleep(.05)
+        eq_(self.t.num_keys, num_keys)
+        eq_(self.t.num_peers, 3 * num_keys)
+        for k in xrange(num_keys):
+            eq_(len(self.t.get(k)), 3)
+        put_get_time = time.actual_time.time() - start
+        # All peers expire
+        time.sleep(VALIDITY_PERIOD)
+        self.t.put(-1, PEERS[0])
+        eq_(self.t.num_keys, 1)
+        eq_(self.t.num_peers, 1)
+        total_time = time.actual_time.time() - start
+        logger.critical('%d keys: %.2f s puts and gets, %.2f s total' % (
+                num_keys, put_get_time, total_time))
+
+    def teardown(self):
+        global time
+        time.unmock()
+        time = tracker.time = time.actual_time
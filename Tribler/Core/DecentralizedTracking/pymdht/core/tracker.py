@@ -2,6 +2,8 @@
 # Released under GNU LGPL 2.1
 # See LICENSE.txt for more information
 
+import heapq
+
 import ptime as time
 
 VALIDITY_PERIOD = 30 * 60 #30 minutes
@@ -9,53 +11,119 @@ CLEANUP_COUNTER = 100
 
 MAX_PEERS = 50 # Avoids way too long get_peers respoonses (longer than UDP
 
+# Stale entries allowed in a key's order list before it is compacted
+COMPACT_SLACK = 16
+
+
+class KeyPeers(object):
+    '''
+    Peers announced for a key, in the order of their last announcement.
+
+    A peer announced again moves to the end. Its previous position is not
+    removed from the order list but skipped (its sequence number no longer
+    matches) and dropped when the list is compacted.
+    '''
+    __slots__ = ('_seqs', '_order')
+
+    def __init__(self):
+        self._seqs = {} # peer: sequence number of its last put
+        self._order = [] # (seq, peer), oldest first
+
+    def __len__(self):
+        return len(self._seqs)
+
+    def put(self, peer, seq):
+        '''
+        Return True when the peer was not in the key yet.
+        '''
+        is_new = peer not in self._seqs
+        self._seqs[peer] = seq
+        self._order.append((seq, peer))
+        self._maybe_compact()
+        return is_new
+
+    def remove(self, peer, seq):
+        '''
+        Remove the peer if it was last put with this sequence number.
+        '''
+        if self._seqs.get(peer) == seq:
+            del self._seqs[peer]
+            self._maybe_compact()
+            return True
+        return False
+
+    def latest(self, num_peers):
+        '''
+        Return (at most) the num_peers last announced peers, oldest first.
+        '''
+        seqs = self._seqs
+        peers = []
+        for seq, peer in reversed(self._order):
+            if seqs.get(peer) == seq:
+                peers.append(peer)
+                if len(peers) == num_peers:
+                    break
+        peers.reverse()
+        return peers
+
+    def _maybe_compact(self):
+        if len(self._order) > 2 * len(self._seqs) + COMPACT_SLACK:
+            seqs = self._seqs
+            self._order = [(seq, peer) for seq, peer in self._order
+                           if seqs.get(peer) == seq]
+
+
 class Tracker(object):
+    '''
+    Peers are kept per key in a KeyPeers. A heap with the (timestamp,
+    sequence number) of every put is used to expire peers in timestamp
+    order, hence put and get cost O(log n) amortised instead of the periodic
+    walk over all keys.
+    '''
 
     def __init__(self, validity_period=VALIDITY_PERIOD,
                  cleanup_counter=CLEANUP_COUNTER):
         self._tracker_dict = {}
+        # (ts, seq, k, peer) for every put. Entries of peers that were put
+        # again later are skipped when they expire.
+        self._expiry_heap = []
+        self._seq = 0
         self.validity_period = validity_period
+        # Not used anymore: expired peers are removed on every put and get
         self.cleanup_counter = cleanup_counter
-        self._put_counter = 0
         self.num_keys = 0
         self.num_peers = 0
-        
+
     def put(self, k, peer):
-        #Clean up every n puts
-        self._put_counter += 1
-        if self._put_counter == self.cleanup_counter:
-            self._put_counter = 0
-            for k_ in self._tracker_dict.keys():
-                ts_peers = self._tracker_dict[k_]
-                self._cleanup_key(k_)
-                if not ts_peers: #empty list. Delete key
-                    del self._tracker_dict[k_]
-                    self.num_keys -= 1
-        
-        ts_peers = self._tracker_dict.setdefault(k,[])
-        if not ts_peers:
+        now = time.time()
+        self._expire(now)
+        self._seq += 1
+        key_peers = self._tracker_dict.get(k)
+        if key_peers is None:
+            key_peers = self._tracker_dict[k] = KeyPeers()
             self.num_keys += 1
-        else:
-            # let's see whether the peer is already there
-            for i in range(len(ts_peers)):
-                if ts_peers[i][1] == peer:
-                    self.num_peers -= 1
-                    del ts_peers[i]
-                    break
-        ts_peers.append((time.time(), peer))
-        self.num_peers += 1
+        if key_peers.put(peer, self._seq):
+            self.num_peers += 1
+        heapq.heappush(self._expiry_heap, (now, self._seq, k, peer))
 
     def get(self, k):
-        ts_peers = self._tracker_dict.get(k, [])
-        self._cleanup_key(k)
-        return [ts_peer[1] for ts_peer in ts_peers[-MAX_PEERS:]]
+        self._expire(time.time())
+        key_peers = self._tracker_dict.get(k)
+        if key_peers is None:
+            return []
+        return key_peers.latest(MAX_PEERS)
 
-    def _cleanup_key(self, k):
+    def _expire(self, now):
         '''
-        Clean up the list as side effect.
+        Remove the peers whose last put is older than the validity period.
         '''
-        ts_peers = self._tracker_dict.get(k, None)
-        oldest_valid_ts = time.time() - self.validity_period
-        while ts_peers and  ts_peers[0][0] < oldest_valid_ts:
-            del ts_peers[0]
-            self.num_peers -= 1
+        oldest_valid_ts = now - self.validity_period
+        heap = self._expiry_heap
+        while heap and heap[0][0] < oldest_valid_ts:
+            _, seq, k, peer = heapq.heappop(heap)
+            key_peers = self._tracker_dict.get(k)
+            if key_peers is not None and key_peers.remove(peer, seq):
+                self.num_peers -= 1
+                if not key_peers:
+                    del self._tracker_dict[k]
+                    self.num_keys -= 1
@@ -774,6 +774,43 @@ class DownloadConfigInterface:
         @return A number of minutes. """
         return self.dlconfig['auto_flush']
 
+    def set_hashcheck_threads(self,value):
+        """ Number of threads that read and hash existing data when the
+        Download is started (0 = check on the network thread).
+        @param value A number of threads.
+        """
+        self.dlconfig['hashcheck_threads'] = value
+
+    def get_hashcheck_threads(self):
+        """ Returns the number of hashcheck threads.
+        @return A number of threads. """
+        return self.dlconfig['hashcheck_threads']
+
+    def set_hashcheck_read_size(self,value):
+        """ The amount of consecutive data the hashcheck threads read from
+        disk at once.
+        @param value A size in megabytes.
+        """
+        self.dlconfig['hashcheck_read_size'] = value
+
+    def get_hashcheck_read_size(self):
+        """ Returns the hashcheck read size.
+        @return A number of megabytes. """
+        return self.dlconfig['hashcheck_read_size']
+
+    def set_mmap_reads(self,value):
+        """ Whether to serve uploads from memory-mapped files, which avoids
+        copying the data of completed files. Files that are still being
+        written are read as usual.
+        @param value Boolean
+        """
+        self.dlconfig['mmap_reads'] = value
+
+    def get_mmap_reads(self):
+        """ Returns whether memory-mapped reads are enabled.
+        @return Boolean. """
+        return self.dlconfig['mmap_reads']
+
     def set_exclude_ips(self,value):
         """ Set a list of IP addresses to be excluded.
         @param value A list of IP addresses in dotted notation.
@@ -441,6 +441,25 @@ class DownloadState(Serializable):
         else:
             return self.stats['vod_stats']
 
+    def get_write_cache_stats(self):
+        """ Returns a dictionary with the statistics of the write buffer of
+        the download. The keys contained are:
+        <pre>
+        'blocks' = number of received blocks
+        'writes' = number of writes issued to disk
+        'hits' = completed pieces hash checked from memory
+        'misses' = completed pieces that had to be read back from disk
+        'flushes' = dict with the number of pieces flushed per reason
+                    ('complete', 'pressure', 'timer', 'sync')
+        'buffered' = bytes currently buffered by this download
+        'total_buffered' = bytes currently buffered by all downloads
+        </pre>, or no keys if the statistics are not available.
+        @return Dict.
+        """
+        if self.stats is None or self.stats['stats'] is None:
+            return {}
+        else:
+            return getattr(self.stats['stats'], 'write_cache', {})
 
 
     def get_log_messages(self):
@@ -1296,6 +1296,22 @@ class SessionConfigInterface:
         @return int
         """
         return self.sessconfig['dispersy_port']
+
+    def set_dispersy_verifier_processes(self, value):
+        """ Sets the number of worker processes that verify the signatures
+        of incoming Dispersy packets (default = 0, verify on the Dispersy
+        thread).
+        @param value int
+        """
+        assert isinstance(value, int)
+        self.sessconfig['dispersy_verifier_processes'] = value
+
+    def get_dispersy_verifier_processes(self):
+        """ Returns the number of worker processes that verify the
+        signatures of incoming Dispersy packets.
+        @return int
+        """
+        return self.sessconfig['dispersy_verifier_processes']
     #
     # SWIFTPROC
     #
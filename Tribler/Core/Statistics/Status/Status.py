@@ -11,6 +11,10 @@ status_holders = {}
 global status_lock
 status_lock = threading.Lock()
 
+# Counters are pushed to their status elements (and thus the reporters)
+# this often, in seconds
+COUNTER_FLUSH_INTERVAL = 5.0
+
 def get_status_holder(name):
     global status_lock
     global status_holders
@@ -65,14 +69,24 @@ class StatusHolder:
         self.reporters = {}
         self.lock = threading.Lock()
         self.events = []
+        self.counters = {}
+        self.flush_thread = None
+        self.flush_stop = None
 
     def reset(self):
         """
-        Reset everything to blanks!
+        Reset everything to blanks!  Counters obtained before the reset
+        are no longer reported.
         """
+        self.lock.acquire()
+        try:
+            self._stop_flush_thread()
+        finally:
+            self.lock.release()
         self.elements = {}
         self.reporters = {}
         self.events = []
+        self.counters = {}
 
     def get_name(self):
         """
@@ -177,6 +191,76 @@ class StatusHolder:
         finally:
             self.lock.release()
                                      
+    def get_counter(self, name, initial_value=0):
+        """
+        Get a counter for the status element with the given name, creating
+        the element if needed.  Resolve the counter once and keep it, its
+        inc() is cheap enough to call for every uploaded block.  Counted
+        values are pushed to the status element every
+        COUNTER_FLUSH_INTERVAL seconds and whenever the reporters fetch
+        the elements.
+        """
+        assert name
+
+        self.lock.acquire()
+        try:
+            if name in self.counters:
+                return self.counters[name]
+        finally:
+            self.lock.release()
+
+        element = self.get_or_create_status_element(name, initial_value)
+
+        self.lock.acquire()
+        try:
+            if not name in self.counters:
+                self.counters[name] = Counter(element)
+            if self.flush_thread is None:
+                self._start_flush_thread()
+            return self.counters[name]
+        finally:
+            self.lock.release()
+
+    def _start_flush_thread(self):
+        # One daemon thread per holder flushes the counters until the
+        # holder is reset
+        self.flush_stop = threading.Event()
+        self.flush_thread = threading.Thread(target=self._flush_periodically,
+                                             args=(self.flush_stop,))
+        self.flush_thread.setName("StatusHolderFlush_"+self.name)
+        self.flush_thread.setDaemon(True)
+        self.flush_thread.start()
+
+    def _stop_flush_thread(self):
+        if self.flush_thread is not None:
+            self.flush_stop.set()
+            self.flush_thread = None
+            self.flush_stop = None
+
+    def _flush_periodically(self, stop):
+        while True:
+            stop.wait(COUNTER_FLUSH_INTERVAL)
+            if stop.isSet():
+                break
+            try:
+                self.flush_counters()
+            except Exception, e:
+                print >> sys.stderr, "Status: error while flushing counters:", e
+
+    def flush_counters(self):
+        """
+        Push the values counted since the last flush to the status
+        elements, notifying the reporters
+        """
+        self.lock.acquire()
+        try:
+            counters = self.counters.values()
+        finally:
+            self.lock.release()
+
+        for counter in counters:
+            counter.flush()
+
     def remove_status_element(self, element):
         """
         Remove a status element
@@ -243,6 +327,7 @@ class StatusHolder:
         Reporters will use this to get a copy of all
         elements that should be reported
         """
+        self.flush_counters()
         self.lock.acquire()
         try:
             return self.elements.values()[:]
@@ -266,6 +351,7 @@ class StatusHolder:
         """
         Forces all reporters to report now
         """
+        self.flush_counters()
         for reporter in self.reporters.values():
             reporter.report_now()
 
@@ -372,7 +458,92 @@ class StatusElement(BaseElement):
         finally:
             self.lock.release()
 
-        
+
+class Counter:
+    """
+    A cheap handle to increment a numeric status element.  Use
+    get_counter() on a Status Holder object to get one.
+
+    Every thread increments its own cell, so inc() takes no locks and
+    does not call the reporters.  A cell is a [counted, flushed] list:
+    only its thread writes the first value and only flush() writes the
+    second.  flush() adds the difference to the status element and
+    drops the cells of threads that have stopped.
+    """
+
+    def __init__(self, element):
+        """
+        DO NOT USE THIS - use get_counter() using a Status Holder object
+        """
+        self.element = element
+        # (thread, cell) tuples
+        self.cells = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def get_name(self):
+        return self.element.get_name()
+
+    def _add_cell(self):
+        cell = [0, 0]
+        self.lock.acquire()
+        try:
+            self.cells.append((threading.currentThread(), cell))
+        finally:
+            self.lock.release()
+        self.local.cell = cell
+        return cell
+
+    def inc(self, value=1):
+        try:
+            self.local.cell[0] += value
+        except AttributeError:
+            self._add_cell()[0] += value
+
+    def dec(self, value=1):
+        self.inc(-value)
+
+    def get_pending(self):
+        """
+        Return the amount counted, but not yet flushed to the element
+        """
+        self.lock.acquire()
+        try:
+            return sum([cell[0] - cell[1] for _, cell in self.cells])
+        finally:
+            self.lock.release()
+
+    def get_value(self):
+        """
+        Return the value of the status element including the amount
+        that has not been flushed yet
+        """
+        return self.element.get_value() + self.get_pending()
+
+    def flush(self):
+        """
+        Add the amount counted since the last flush to the status element
+        """
+        pending = 0
+        self.lock.acquire()
+        try:
+            cells = []
+            for thread, cell in self.cells:
+                # a stopped thread no longer changes its cell, so it can
+                # be dropped once its value is flushed
+                alive = thread.isAlive()
+                counted = cell[0]
+                pending += counted - cell[1]
+                cell[1] = counted
+                if alive:
+                    cells.append((thread, cell))
+            self.cells = cells
+        finally:
+            self.lock.release()
+        if pending:
+            self.element.inc(pending)
+
+
 class EventElement(BaseElement):
     type = "event"
 
@@ -3,6 +3,7 @@
 # see LICENSE.txt for license information
 
 import sys
+import apsw
 # import cPickle
 from time import strftime
 
@@ -16,6 +17,24 @@ from Tribler.Core.dispersy.encoding import encode
 
 DEBUG = False
 
+def split_statements(sql):
+    """
+    Split sql into its statements. A ';' inside a string literal or a
+    trigger body does not end a statement.
+    """
+    statements = []
+    statement = ""
+    for part in sql.split(";"):
+        statement += part + ";"
+        if apsw.complete(statement):
+            if statement[:-1].strip():
+                statements.append(statement)
+            statement = ""
+    if statement[:-1].strip():
+        # incomplete, executing it reports the error
+        statements.append(statement)
+    return statements
+
 class UserEventLogCrawler:
     __single = None
 
@@ -71,17 +90,33 @@ class UserEventLogCrawler:
 
         # execute the sql
         try:
-            #has to be execute_read, delete statements are also allowed in this function
-            cursor = self._sqlite_cache_db.execute_read(message)
+            #delete statements are also allowed in this function, these can
+            #not run on the read-only connection of this thread. The
+            #statements run in their original order, the cached writes are
+            #committed before a select such that it reads them
+            rows = []
+            uncommitted = False
+            for sql in split_statements(message):
+                if sql.strip().upper().startswith("SELECT"):
+                    if uncommitted:
+                        self._sqlite_cache_db.commit()
+                        uncommitted = False
+                    cursor = self._sqlite_cache_db.execute_read(sql)
+                    if not cursor:
+                        reply_callback("error", error=2)
+                        return
+                    rows.extend(cursor)
+                else:
+                    self._sqlite_cache_db.execute_write(sql, commit=False)
+                    uncommitted = True
+            if uncommitted:
+                self._sqlite_cache_db.commit()
 
         except Exception, e:
             reply_callback(str(e), error=1)
         else:
-            if cursor:
-                reply_callback(encode(list(cursor)))
-                # reply_callback(cPickle.dumps(list(cursor), 2))
-            else:
-                reply_callback("error", error=2)
+            reply_callback(encode(rows))
+            # reply_callback(cPickle.dumps(rows, 2))
 
     def handle_crawler_reply(self, permid, selversion, channel_id, channel_data, error, message, request_callback):
         """
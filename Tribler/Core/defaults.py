@@ -93,6 +93,7 @@ sessdefaults['channelcast_recent_own_subscriptions'] = 13
 sessdefaults['channelcast_random_own_subscriptions'] = 12 
 sessdefaults['dispersy'] = True
 sessdefaults['dispersy_port'] = 7759
+sessdefaults['dispersy_verifier_processes'] = 0 # 0 = verify signatures on the Dispersy thread
 
 # 14-04-2010, Andrea: settings to limit the results for a remote query in channels
 # if there are too many results the gui got freezed for a considerable amount of
@@ -167,7 +168,9 @@ sessdefaults.update(trackerdefaults)
 #  Version 2: as released in Tribler 4.5.0
 #  Version 3: 
 #  Version 4: allow users to specify a download directory every time
-DLDEFAULTS_VERSION = 5
+#  Version 6: hashcheck threads
+#  Version 7: memory-mapped reads
+DLDEFAULTS_VERSION = 7
 dldefaults = {}
 dldefaults['version'] = DLDEFAULTS_VERSION
 dldefaults['max_uploads'] = 7
@@ -217,6 +220,9 @@ dldefaults['triple_check'] = 0
 dldefaults['lock_files'] = 0
 dldefaults['lock_while_reading'] = 0
 dldefaults['auto_flush'] = 0
+dldefaults['hashcheck_threads'] = 2 # 0 = hashcheck on the network thread
+dldefaults['hashcheck_read_size'] = 4 # in MB
+dldefaults['mmap_reads'] = 0 # serve uploads from memory-mapped files
 #
 # Tribler per-download opts
 #
@@ -15,6 +15,7 @@ Ippolito <bob@redivi.com>.  Simplified, and optimized to use just python code.
 @contact: dispersy@frayja.com
 """
 
+from array import array
 from hashlib import sha1, sha256, sha384, sha512, md5
 from math import ceil, log
 from struct import unpack
@@ -26,6 +27,10 @@ if __debug__:
     from time import time
 
 class BloomFilter(Constructor):
+    """
+    The filter is stored as an array of unsigned bytes where bit POS is bit POS % 8 of byte POS /
+    8.  This is also the order of the bits in the BYTES property, i.e. the wire format.
+    """
     def _init_(self, m_size, k_functions, prefix, filter_):
         assert isinstance(m_size, int)
         assert 0 < m_size
@@ -34,7 +39,9 @@ class BloomFilter(Constructor):
         assert 0 < k_functions <= m_size
         assert isinstance(prefix, str)
         assert 0 <= len(prefix) < 256
-        assert isinstance(filter_, long)
+        assert isinstance(filter_, array)
+        assert filter_.typecode == "B"
+        assert len(filter_) * 8 == m_size
 
         self._m_size = m_size
         self._k_functions = k_functions
@@ -45,7 +52,6 @@ class BloomFilter(Constructor):
             dprint("m size:      ", m_size, "    ~", m_size / 8, " bytes")
             dprint("k functions: ", k_functions)
             dprint("prefix:      ", prefix.encode("HEX"))
-            dprint("filter:      ", filter_)
             hypothetical_error_rates = [0.4, 0.3, 0.2, 0.1, 0.01, 0.001, 0.0001]
             dprint("hypothetical error rate: ", " | ".join("%.4f" % hypothetical_error_rate for hypothetical_error_rate in hypothetical_error_rates))
             dprint("hypothetical capacity:   ", " | ".join("%6d" % self.get_capacity(hypothetical_error_rate) for hypothetical_error_rate in hypothetical_error_rates))
@@ -81,7 +87,7 @@ class BloomFilter(Constructor):
         assert isinstance(bytes_, str)
         assert 0 < len(bytes_)
         if __debug__: dprint("constructing bloom filter based on ", len(bytes_), " bytes and k_functions ", k_functions)
-        self._init_(len(bytes_) * 8, k_functions, prefix, long(sum(ord(bytes_[i]) << (i*8) for i in xrange(len(bytes_)))))
+        self._init_(len(bytes_) * 8, k_functions, prefix, array("B", bytes_))
 
     @constructor(int, float)
     def _init_m_f(self, m_size, f_error_rate, prefix=""):
@@ -94,32 +100,68 @@ class BloomFilter(Constructor):
         # self._n = int(m * ((log(2) ** 2) / abs(log(f))))
         # self._k = int(ceil(log(2) * (m / self._n)))
         if __debug__: dprint("constructing bloom filter based on m_size ", m_size, " bits and f_error_rate ", f_error_rate)
-        self._init_(m_size, self._get_k_functions(m_size, self._get_n_capacity(m_size, f_error_rate)), prefix, 0L)
+        self._init_(m_size, self._get_k_functions(m_size, self._get_n_capacity(m_size, f_error_rate)), prefix, array("B", "\x00" * (m_size / 8)))
     
     def _hashes(self, key):
         h = self._salt.copy()
         h.update(key)
-        return (index % self._m_size for index in unpack(self._fmt, h.digest()))
+        m_size = self._m_size
+        return [index % m_size for index in unpack(self._fmt, h.digest())]
         
     def add(self, key):
-        bits = 0L
+        filter_ = self._filter
         for pos in self._hashes(key):
-            bits |= 1 << pos
-        self._filter |= bits
+            filter_[pos >> 3] |= 1 << (pos & 7)
+
+    def add_keys(self, keys):
+        """
+        Add all KEYS to the filter.
+
+        This is equivalent to calling add for each key, but avoids the per-key method lookups.
+        """
+        filter_ = self._filter
+        salt_copy = self._salt.copy
+        fmt = self._fmt
+        m_size = self._m_size
+        for key in keys:
+            h = salt_copy()
+            h.update(key)
+            for index in unpack(fmt, h.digest()):
+                pos = index % m_size
+                filter_[pos >> 3] |= 1 << (pos & 7)
       
     def clear(self):
         """
         Set all bits in the filter to zero.
         """
-        self._filter = 0L
+        self._filter = array("B", "\x00" * (self._m_size / 8))
 
     def __contains__(self, key):
         filter_ = self._filter
         for pos in self._hashes(key):
-            if not filter_ & (1 << pos):
+            if not filter_[pos >> 3] & (1 << (pos & 7)):
                 return False 
         return True
 
+    def not_filter(self, iterator):
+        """
+        Yields all tuples in ITERATOR where the first element of the tuple is NOT in the filter.
+
+        This is the batched form of 'not key in bloom_filter'.
+        """
+        filter_ = self._filter
+        salt_copy = self._salt.copy
+        fmt = self._fmt
+        m_size = self._m_size
+        for tup in iterator:
+            h = salt_copy()
+            h.update(tup[0])
+            for index in unpack(fmt, h.digest()):
+                pos = index % m_size
+                if not filter_[pos >> 3] & (1 << (pos & 7)):
+                    yield tup
+                    break
+
     def _get_k_functions(self, m_size, n_capacity):
         return int(ceil(log(2) * m_size / n_capacity))
         
@@ -160,7 +202,7 @@ class BloomFilter(Constructor):
 
     @property
     def bytes(self):
-        return "".join(chr((self._filter & (0xff << c)) >> c) for c in xrange(0, self._m_size, 8))
+        return self._filter.tostring()
     
 if __debug__:
     def _test_behavior():
@@ -184,142 +226,41 @@ if __debug__:
         print d.size, d.get_capacity(f_error_rate), d.bytes.encode("HEX")
         
     def _performance_test():
-        def test2(bits, count, constructor = BloomFilter):
-            generate_begin = time()
+        def test(m_size, count, constructor=BloomFilter):
             ok = 0
-            data = [(i, sha1(str(i)).digest()) for i in xrange(count)]
+            data = [(sha1(str(i)).digest(), i) for i in xrange(count)]
             create_begin = time()
-            bloom = constructor(0.0001, bits)
+            bloom = constructor(m_size, 0.01, prefix="x")
             fill_begin = time()
-            for i, h in data:
+            for h, i in data:
                 if i % 2 == 0:
                     bloom.add(h)
             check_begin = time()
-            for i, h in data:
+            for h, i in data:
                 if (h in bloom) == (i % 2 == 0):
                     ok += 1
+            batch_begin = time()
+            missing = len(list(bloom.not_filter(iter(data))))
             write_begin = time()
-            string = str(bloom)
-            write_end = time()
+            string = bloom.bytes
+            read_begin = time()
+            other = constructor(string, bloom.functions, prefix="x")
+            read_end = time()
+            assert other.bytes == string
 
-            print "generate: {generate:.1f}; create: {create:.1f}; fill: {fill:.1f}; check: {check:.1f}; write: {write:.1f}".format(generate=create_begin-generate_begin, create=fill_begin-create_begin, fill=check_begin-fill_begin, check=write_begin-check_begin, write=write_end-write_begin)
-            print string.encode("HEX")[:100], "{len} bytes; ({ok}/{total} ~{part:.0%})".format(len=len(string), ok=ok, total=count, part=1.0*ok/count)
+            print "m: {m:6d}; count: {count:7d}; create: {create:.3f}; fill: {fill:.3f}; check: {check:.3f}; not_filter: {batch:.3f}; write: {write:.4f}; read: {read:.4f}".format(m=m_size, count=count, create=fill_begin-create_begin, fill=check_begin-fill_begin, check=batch_begin-check_begin, batch=write_begin-batch_begin, write=read_begin-write_begin, read=read_end-read_begin)
+            print string.encode("HEX")[:100], "{len} bytes; ({ok}/{total} ~{part:.0%}) {missing} missing".format(len=len(string), ok=ok, total=count, part=1.0*ok/count, missing=missing)
 
-        def test(bits, count, constructor = BloomFilter):
-            ok = 0
-            create_begin = time()
-            bloom = constructor(0.0001, bits)
-            fill_begin = time()
-            for i in xrange(count):
-                if i % 2 == 0:
-                    bloom.add(str(i))
-            check_begin = time()
-            for i in xrange(count):
-                if (str(i) in bloom) == (i % 2 == 0):
-                    ok += 1
-            write_begin = time()
-            string = str(bloom)
-            write_end = time()
-
-            print "create: {create:.1f}; fill: {fill:.1f}; check: {check:.1f}; write: {write:.1f}".format(create=fill_begin-create_begin, fill=check_begin-fill_begin, check=write_begin-check_begin, write=write_end-write_begin)
-            print string.encode("HEX")[:100], "{len} bytes; ({ok}/{total} ~{part:.0%})".format(len=len(string), ok=ok, total=count, part=1.0*ok/count)
-
-        b = BloomFilter(100, 0.0001)
+        b = BloomFilter(128, 0.0001)
         b.add("Hello")
-        data = str(b)
-
-        #c = BloomFilter(data, 0)
-        #assert "Hello" in c
-        #assert not "Bye" in c
-        
-        test2(10, 10,FasterBloomFilter)
-        test2(10, 100,FasterBloomFilter)
-        test2(100, 100,FasterBloomFilter)
-        test2(100, 1000,FasterBloomFilter)
-        test2(1000, 1000,FasterBloomFilter)
-        test2(1000, 10000,FasterBloomFilter)
-        test2(10000, 10000,FasterBloomFilter)
-        test2(10000, 100000,FasterBloomFilter)
-        
-        test(10, 10,FasterBloomFilter)
-        test(10, 100,FasterBloomFilter)
-        test(100, 100,FasterBloomFilter)
-        test(100, 1000,FasterBloomFilter)
-        test(1000, 1000,FasterBloomFilter)
-        test(1000, 10000,FasterBloomFilter)
-        test(10000, 10000,FasterBloomFilter)
-        test(10000, 100000,FasterBloomFilter)
-        test(100000, 100000,FasterBloomFilter)
-        test(100000, 1000000,FasterBloomFilter)
-        
-
-        #test2(10, 10)
-        #test2(10, 100)
-
-# generate: 0.0; create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000001d000000241400480001840684024080408012800008012424018008a0401001080280008500241000 45 bytes; (10/10 ~100%)
-# generate: 0.0; create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000001d000000bfbedf7fbafff4bffff7fdb7efdffe8df74f9fff6dbffb7bed7fdaf9ae76dfefffebffdb03 45 bytes; (90/100 ~90%)
-
-        test2(100, 100)
-        test2(100, 1000)
-
-# generate: 0.0; create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000002001000002050100400001820008020388084422108050c0b41440804a003044204020082804000049820c880420 368 bytes; (100/100 ~100%)
-# generate: 0.0; create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a000000200100009eedefcc77df2fff1feffe5fdeeefebffefe7fddffb77bf1cff574ddbedffafdbffffdf6fdef7f9ebf7f 368 bytes; (919/1000 ~92%)
-
-        test2(1000, 1000)
-        test2(1000, 10000)
-
-# generate: 0.0; create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000003c0b0000a203040502001140c0000010840900420a06152400042000004222010090000022861000824010102001 3603 bytes; (1000/1000 ~100%)
-# generate: 0.0; create: 0.0; fill: 0.1; check: 0.1; write: 0.0
-# 0a0000003c0b0000fad3ffeffffdfb7efb5efffcfefffceffb7fffb7df3ffff99f7bffd5fdd7f65d76e7ff2f9feffcda7fff 3603 bytes; (9279/10000 ~93%)
-
-        test2(10000, 10000)
-        test2(10000, 100000)
-
-# generate: 0.0; create: 0.0; fill: 0.1; check: 0.1; write: 0.0
-# 0a00000054700000205286262400208041034085040005524802d8667048204220001214805020502002600408060080d009 35953 bytes; (10000/10000 ~100%)
-# generate: 0.2; create: 0.0; fill: 0.7; check: 1.3; write: 0.0
-# 0a00000054700000fbfffffeffffffbbfffffff7edbfffffff7fdffff7dbffffffffffbf9efafffbfffff5dddbdfffffd7ff 35953 bytes; (92622/100000 ~93%)
-
-        #test(10, 10)
-        #test(10, 100)
-
-# create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000001d00000081012001030240322100040400440c510024402060400100010410088c0005020a18020100 45 bytes; (10/10 ~100%)
-# create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000001d000000ebfff7fbefdedfbbeffffdeee7ddbf7fb7fdff77ffff77f5d74dff9efdffffffef7f9e3f03 45 bytes; (92/100 ~92%)
-
-        test(100, 100)
-        test(100, 1000)
-
-# create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000002001000000108007008010210218120a0802824800806a20911008424200a00a0000114000100009466002820916 368 bytes; (100/100 ~100%)
-# create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a000000200100007ff7f777fabadfffd7fddfdf29dfdefe77fc7bedfffc7df37e7ff9ffbbfff57fb7feffcfdffd7ffffdbf 368 bytes; (915/1000 ~92%)
-
-        test(1000, 1000)
-        test(1000, 10000)
-
-# create: 0.0; fill: 0.0; check: 0.0; write: 0.0
-# 0a0000003c0b00000146869100238482200450100090040002000010000006244000000c4a0141040402210802000c208010 3603 bytes; (1000/1000 ~100%)
-# create: 0.0; fill: 0.1; check: 0.1; write: 0.0
-# 0a0000003c0b0000f7ffffbbdbfbefffeffff7ff5cffff27f6defffadff76ef5fbfbecffdfd7fdee77f7ffdffea07dfebbdf 3603 bytes; (9279/10000 ~93%)
-
-        test(10000, 10000)
-        test(10000, 100000)
-
-# create: 0.0; fill: 0.1; check: 0.1; write: 0.0
-# 0a00000054700000130050403102c002410c410200a100700200cc0c0007620100142c408c4a82080082000a866d1818a211 35953 bytes; (10000/10000 ~100%)
-# create: 0.0; fill: 0.8; check: 1.4; write: 0.0
-# 0a000000547000009ffefff7fdffecff7dffffbeeefffffefffdffeef9efffffebff7ffdffffbfffd7ffeeefff7ffdfbffff 35953 bytes; (92520/100000 ~93%)
-
-        test(100000, 100000)
-        test(100000, 1000000)
-        
+        c = BloomFilter(b.bytes, b.functions)
+        assert "Hello" in c
+        assert not "Bye" in c
+
+        # 10240 bits is roughly the size of the sync bloom filter in a dispersy-introduction-request
+        for m_size in (1024, 10240, 102400):
+            for count in (1000, 10000, 100000):
+                test(m_size, count)
 
     def _taste_test():
         def pri(f, m, invert=False):
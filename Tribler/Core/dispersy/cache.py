@@ -97,6 +97,105 @@ class CacheDict(object):
     def __str__(self):
         return "\n".join("%d -> %s" % (cache.__poke_count, key) for key, cache in self._dict.iteritems())
 
+class SyncCache(object):
+    """
+    A short lived cache for the packets that Dispersy.check_sync selects for a sync range.
+
+    Many peers walking the same community send introduction requests for the same (time_low,
+    time_high, modulo, offset) range.  The selected packets only depend on this range and on the
+    content of the sync table, hence the list can be reused until either LIFETIME seconds have
+    passed or the community stores, removes, or undoes a packet, in which case invalidate(community)
+    must be called.
+
+    The cache holds at most MAX_BYTES bytes of packets.  Lists larger than MAX_ENTRY_BYTES are not
+    cached at all.
+    """
+    def __init__(self, lifetime=5.0, max_bytes=5*1024*1024, max_entry_bytes=512*1024):
+        assert isinstance(lifetime, float)
+        assert lifetime > 0.0
+        assert isinstance(max_bytes, int)
+        assert isinstance(max_entry_bytes, int)
+        assert 0 < max_entry_bytes <= max_bytes
+        self._lifetime = lifetime
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes
+        # community:{key:(timestamp, byte_count, packets)} pairs
+        self._entries = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    @property
+    def max_entry_bytes(self):
+        return self._max_entry_bytes
+
+    def get(self, community, key, now):
+        """
+        Returns the cached packets for KEY or None when they are not available.
+        """
+        entries = self._entries.get(community)
+        if entries:
+            entry = entries.get(key)
+            if entry:
+                if entry[0] + self._lifetime > now:
+                    self._hits += 1
+                    return entry[2]
+                self._remove(community, key)
+        self._misses += 1
+        return None
+
+    def set(self, community, key, packets, byte_count, now):
+        """
+        Cache PACKETS, consisting of BYTE_COUNT bytes, for KEY.
+        """
+        if byte_count > self._max_entry_bytes:
+            return
+
+        if self._bytes + byte_count > self._max_bytes:
+            # remove the expired entries, followed by the oldest ones
+            entries = sorted((timestamp, community_, key_)
+                             for community_, sub in self._entries.iteritems()
+                             for key_, (timestamp, _, _) in sub.iteritems())
+            for timestamp, community_, key_ in entries:
+                if self._bytes + byte_count <= self._max_bytes and timestamp + self._lifetime > now:
+                    break
+                self._remove(community_, key_)
+                self._evictions += 1
+
+        if key in self._entries.get(community, ()):
+            self._remove(community, key)
+        self._entries.setdefault(community, {})[key] = (now, byte_count, packets)
+        self._bytes += byte_count
+
+    def _remove(self, community, key):
+        entries = self._entries[community]
+        self._bytes -= entries.pop(key)[1]
+        if not entries:
+            del self._entries[community]
+
+    def invalidate(self, community):
+        """
+        Remove all cached packets for COMMUNITY.  Must be called whenever the sync table changes
+        for COMMUNITY.
+        """
+        entries = self._entries.pop(community, None)
+        if entries:
+            self._bytes -= sum(byte_count for _, byte_count, _ in entries.itervalues())
+            self._invalidations += 1
+
+    def info(self):
+        """
+        Returns a dictionary with the cache statistics.
+        """
+        return {"hits":self._hits,
+                "misses":self._misses,
+                "invalidations":self._invalidations,
+                "evictions":self._evictions,
+                "entries":sum(len(entries) for entries in self._entries.itervalues()),
+                "bytes":self._bytes}
+
 if __debug__:
     if __name__ == "__main__":
         class Cache(object):
@@ -115,3 +214,21 @@ if __debug__:
         assert l == [("bar", bar)], l
         print
         print c
+
+        s = SyncCache(1.0, 100, 50)
+        s.set("community", (1, 10, 1, 0), ["packet"], 40, 0.0)
+        assert s.get("community", (1, 10, 1, 0), 0.5) == ["packet"]
+        assert s.get("community", (1, 10, 1, 0), 1.5) is None
+        s.set("community", (1, 10, 1, 0), ["packet"], 40, 2.0)
+        s.set("community", (1, 20, 1, 0), ["packet"], 40, 2.1)
+        s.set("community", (1, 30, 1, 0), ["packet"], 40, 2.2)
+        assert s.get("community", (1, 10, 1, 0), 2.3) is None
+        assert s.get("community", (1, 30, 1, 0), 2.3) == ["packet"]
+        s.set("community", (1, 40, 1, 0), ["packet"], 60, 2.3)
+        assert s.get("community", (1, 40, 1, 0), 2.3) is None
+        s.invalidate("community")
+        assert s.get("community", (1, 30, 1, 0), 2.3) is None
+        info = s.info()
+        assert info["bytes"] == 0 and info["entries"] == 0, info
+        assert info["hits"] == 2 and info["evictions"] == 1 and info["invalidations"] == 1, info
+        print s.info()
@@ -6,13 +6,17 @@ A callback thread running Dispersy.
 """
 
 from dprint import dprint
-from heapq import heappush, heappop
+from heapq import heapify, heappush, heappop
 from itertools import chain
 from thread import get_ident
 from threading import Thread, Lock, Event
 from time import sleep, time
 from types import GeneratorType
 
+# unregistered calls remain in the queues until they expire, unless there are more than N of them
+# and they make up more than half of the queues
+CANCELLED_COMPACT_THRESHOLD = 64
+
 if __debug__:
     from itertools import islice
     from atexit import register as atexit_register
@@ -37,7 +41,7 @@ class Delay(Yielder):
             new_deadline = deadline + self._delay
         else:
             new_deadline = time() + self._delay
-        heappush(requests, new_deadline, priority, root_id, (call[0], "desync"), callback)
+        cself._push_request((new_deadline, priority, root_id, (call[0], "desync"), callback))
 
 class Switch(Yielder):
     def __init__(self, cother):
@@ -66,7 +70,7 @@ class Idle(Yielder):
         self._idle_threshold = idle_threshold
 
     def handle(self, cself, requests, expired, actual_time, deadline, priority, root_id, call, callback):
-        self._expired = expired
+        self._cself = cself
         self._origional_deadline = deadline
         self._origional_priority = priority
         self._origional_root_id = root_id
@@ -75,9 +79,9 @@ class Idle(Yielder):
         generator = self._test_idle(actual_time - deadline)
         generator.send(None)
         if deadline + self._min_delay <= actual_time:
-            heappush(expired, (priority + 1024, deadline + self._min_delay, root_id, (generator, "desync"), None))
+            cself._push_expired((priority + 1024, deadline + self._min_delay, root_id, (generator, "desync"), None))
         else:
-            heappush(requests, (deadline + self._min_delay, priority + 1024, root_id, (generator, "desync"), None))
+            cself._push_request((deadline + self._min_delay, priority + 1024, root_id, (generator, "desync"), None))
 
     def _test_idle(self, desync):
         remaining_delay = self._max_delay - self._min_delay
@@ -86,7 +90,7 @@ class Idle(Yielder):
             if desync < self._idle_threshold:
                 break
             remaining_delay -= desync
-        heappush(self._expired, (self._origional_priority, self._origional_deadline, self._origional_root_id, (self._origional_generator, "desync"), self._origional_callback))
+        self._cself._push_expired((self._origional_priority, self._origional_deadline, self._origional_root_id, (self._origional_generator, "desync"), self._origional_callback))
 
 class Return(Yielder):
     def __init__(self, *results):
@@ -94,7 +98,7 @@ class Return(Yielder):
 
     def handle(self, cself, requests, expired, actual_time, deadline, priority, root_id, call, callback):
         if callback:
-            heappush(expired, (priority, deadline, root_id, (callback[0], self._results + callback[1], callback[2]), None))
+            cself._push_expired((priority, deadline, root_id, (callback[0], self._results + callback[1], callback[2]), None))
 
 class Callback(object):
     def __init__(self):
@@ -140,11 +144,28 @@ class Callback(object):
                                 # type=register, action=(deadline, priority, root_id, (call, args, kargs), callback)
                                 # type=unregister, action=root_id
 
+        # _requests contains the calls that are waiting for their deadline, ordered by deadline.
+        # _expired contains the calls that have passed their deadline, ordered by priority.  both
+        # are only used on the running thread
+        self._requests = [] # (deadline, priority, root_id, (call, args, kargs), callback)
+        self._expired = []  # (priority, deadline, root_id, (call, args, kargs), callback)
+
+        # _index contains the scheduled calls for each id.  it contains root_id:set(id(call)) pairs
+        # for every call in _requests and _expired that has not been unregistered.  unregistered
+        # calls are skipped when they are taken from the queues.  _cancelled contains the number of
+        # these calls that are still in the queues.  both are only used on the running thread
+        self._index = {}
+        self._cancelled = 0
+
+        # _statistics contains call_name:[cumulative_time, call_count] pairs and _max_desync the
+        # highest number of seconds that a call was made after its deadline.  see get_statistics()
+        self._statistics = {}
+        self._max_desync = 0.0
+
         if __debug__:
             def must_close(callback):
                 assert callback.is_finished
             atexit_register(must_close, self)
-            self._debug_statistics = {}
 
     @property
     def is_running(self):
@@ -169,6 +190,67 @@ class Callback(object):
         """
         return self._exception
 
+    @property
+    def queue_depth(self):
+        """
+        Returns the number of calls that are scheduled and have not been unregistered.
+        """
+        return len(self._requests) + len(self._expired) - self._cancelled
+
+    def get_statistics(self, reset=False):
+        """
+        Returns a dictionary with the scheduler statistics.
+
+        - requests: the number of calls waiting for their deadline
+        - expired: the number of calls that passed their deadline and are waiting to be made
+        - cancelled: the number of unregistered calls that are still in the queues
+        - max_desync: the highest number of seconds that a call was made after its deadline
+        - calls: call_name:(cumulative_time, call_count) pairs
+
+        When RESET is True max_desync and calls are reset after they are returned.
+        """
+        statistics = {"requests":len(self._requests),
+                      "expired":len(self._expired),
+                      "cancelled":self._cancelled,
+                      "max_desync":self._max_desync,
+                      "calls":dict((call_name, tuple(value)) for call_name, value in self._statistics.items())}
+        if reset:
+            self._statistics = {}
+            self._max_desync = 0.0
+        return statistics
+
+    def _push_request(self, request):
+        """
+        Schedule REQUEST, a (deadline, priority, root_id, call, callback) tuple.  Must be called on
+        the running thread.
+        """
+        self._index.setdefault(request[2], set()).add(id(request[3]))
+        heappush(self._requests, request)
+
+    def _push_expired(self, request):
+        """
+        Schedule REQUEST, a (priority, deadline, root_id, call, callback) tuple, to be called as
+        soon as possible.  Must be called on the running thread.
+        """
+        self._index.setdefault(request[2], set()).add(id(request[3]))
+        heappush(self._expired, request)
+
+    def _is_scheduled(self, request):
+        ids = self._index.get(request[2])
+        return ids is not None and id(request[3]) in ids
+
+    def _compact(self):
+        """
+        Remove all unregistered calls from the queues.
+        """
+        if __debug__: dprint("removing ", self._cancelled, " unregistered calls")
+        is_scheduled = self._is_scheduled
+        self._requests[:] = [request for request in self._requests if is_scheduled(request)]
+        heapify(self._requests)
+        self._expired[:] = [request for request in self._expired if is_scheduled(request)]
+        heapify(self._expired)
+        self._cancelled = 0
+
     def attach_exception_handler(self, func):
         """
         Attach a new exception notifier.
@@ -444,13 +526,16 @@ class Callback(object):
         get_timestamp = time
         lock = self._lock
         new_actions = self._new_actions
+        index = self._index
+        push_request = self._push_request
+        push_expired = self._push_expired
 
         # the timestamp that the callback is currently handling
         actual_time = 0
         # requests are ordered by deadline and moved to -expired- when they need to be handled
-        requests = [] # (deadline, priority, root_id, (call, args, kargs), callback)
+        requests = self._requests # (deadline, priority, root_id, (call, args, kargs), callback)
         # expired requests are ordered and handled by priority
-        expired = [] # (priority, deadline, root_id, (call, args, kargs), callback)
+        expired = self._expired # (priority, deadline, root_id, (call, args, kargs), callback)
 
         self._thread_ident = get_ident()
 
@@ -464,22 +549,24 @@ class Callback(object):
                 # schedule all new actions
                 for type_, action in new_actions:
                     if type_ == "register":
-                        heappush(requests, action)
+                        push_request(action)
                     elif type_ == "persistent-register":
-                        for tup in chain(requests, expired):
-                            if tup[2] == action[2]:
-                                break
-                        else:
-                            # no break, register callback
-                            heappush(requests, action)
+                        if not action[2] in index:
+                            # not registered yet, register callback
+                            push_request(action)
                     else:
                         assert type_ == "unregister"
-                        if __debug__: dprint("unregister ", len([request for request in requests if request[2] == action]), ":", len([request for request in expired if request[2] == action]), " from requests ", action)
-                        requests = [request for request in requests if not request[2] == action]
-                        expired = [request for request in expired if not request[2] == action]
+                        # the calls remain in the queues and are skipped when they are taken out
+                        ids = index.pop(action, None)
+                        if __debug__: dprint("unregister ", len(ids) if ids else 0, " calls ", action)
+                        if ids:
+                            self._cancelled += len(ids)
                 del new_actions[:]
                 self._event.clear()
 
+            if self._cancelled > CANCELLED_COMPACT_THRESHOLD and 2 * self._cancelled > len(requests) + len(expired):
+                self._compact()
+
             actual_time = get_timestamp()
 
             # move expired requests from REQUESTS to EXPIRED
@@ -500,11 +587,20 @@ class Callback(object):
                 priority, deadline, root_id, call, callback = heappop(expired)
                 assert deadline <= actual_time
 
-                while True:
-                    if __debug__:
-                        debug_call_name = call[0].__name__
-                        debug_call_start = time()
+                # skip calls that were unregistered
+                ids = index.get(root_id)
+                if ids is None or not id(call) in ids:
+                    self._cancelled -= 1
+                    continue
+                ids.discard(id(call))
+                if not ids:
+                    del index[root_id]
+
+                if actual_time - deadline > self._max_desync:
+                    self._max_desync = actual_time - deadline
+                call_start = get_timestamp()
 
+                while True:
                     # call can be either:
                     # 1. A (generator, arg)
                     # 2. A (callable, args, kargs) tuple
@@ -517,7 +613,7 @@ class Callback(object):
                             result = call[0].send(actual_time - deadline if call[1] == "desync" else call[1])
                         except StopIteration:
                             if callback:
-                                heappush(expired, (priority, deadline, root_id, (callback[0], (result,) + callback[1], callback[2]), None))
+                                push_expired((priority, deadline, root_id, (callback[0], (result,) + callback[1], callback[2]), None))
                         except (SystemExit, KeyboardInterrupt, GeneratorExit, AssertionError), exception:
                             dprint(exception=True, level="error")
                             with lock:
@@ -527,14 +623,14 @@ class Callback(object):
                         except Exception, exception:
                             dprint(exception=True, level="error")
                             if callback:
-                                heappush(expired, (priority, deadline, root_id, (callback[0], (exception,) + callback[1], callback[2]), None))
+                                push_expired((priority, deadline, root_id, (callback[0], (exception,) + callback[1], callback[2]), None))
                             self._call_exception_handlers(exception, False)
                         else:
                             if isinstance(result, float):
                                 # schedule CALL again in RESULT seconds
                                 # equivalent to: yield Delay(SECONDS)
                                 assert result >= 0.0
-                                heappush(requests, (get_timestamp() + result, priority, root_id, (call[0], "desync"), callback))
+                                push_request((get_timestamp() + result, priority, root_id, (call[0], "desync"), callback))
                             elif isinstance(result, Yielder):
                                 # let the Yielder object handle everything
                                 result.handle(self, requests, expired, actual_time, deadline, priority, root_id, call, callback)
@@ -562,7 +658,7 @@ class Callback(object):
                         except Exception, exception:
                             dprint(exception=True, level="error")
                             if callback:
-                                heappush(expired, (priority, deadline, root_id, (callback[0], (exception,) + callback[1], callback[2]), None))
+                                push_expired((priority, deadline, root_id, (callback[0], (exception,) + callback[1], callback[2]), None))
                             self._call_exception_handlers(exception, False)
                         else:
                             if isinstance(result, GeneratorType):
@@ -572,7 +668,7 @@ class Callback(object):
                                 continue
 
                             elif callback:
-                                heappush(expired, (priority, deadline, root_id, (callback[0], (result,) + callback[1], callback[2]), None))
+                                push_expired((priority, deadline, root_id, (callback[0], (result,) + callback[1], callback[2]), None))
 
                         finally:
                             if __debug__:
@@ -580,16 +676,17 @@ class Callback(object):
                                 debug_level = "warning" if debug_delay > CALL_DELAY_FOR_WARNING else "normal"
                                 dprint("call took %.4fs to " % debug_delay, call[0], level=debug_level)
 
-                    if __debug__:
-                        if debug_call_name not in self._debug_statistics:
-                            self._debug_statistics[debug_call_name] = [0.0, 0]
-
-                        self._debug_statistics[debug_call_name][0] += time() - debug_call_start
-                        self._debug_statistics[debug_call_name][1] += 1
-
                     # break out of the while loop
                     break
 
+                call_name = getattr(call[0], "__name__", "unknown")
+                value = self._statistics.get(call_name)
+                if value is None:
+                    self._statistics[call_name] = [get_timestamp() - call_start, 1]
+                else:
+                    value[0] += get_timestamp() - call_start
+                    value[1] += 1
+
             else:
                 # we need to wait for new requests
                 if requests:
@@ -604,8 +701,9 @@ class Callback(object):
                 continue
 
         # send GeneratorExit exceptions to remaining generators
-        for _, _, _, call, _ in chain(expired, requests):
-            if isinstance(call[0], GeneratorType):
+        for request in chain(expired, requests):
+            call = request[3]
+            if isinstance(call[0], GeneratorType) and self._is_scheduled(request):
                 if __debug__: dprint("raise Shutdown in ", call[0])
                 try:
                     call[0].close()
@@ -620,12 +718,12 @@ class Callback(object):
         if __debug__:
             dprint("top ten calls, sorted by cumulative time", line=True, force=True)
             key = lambda (_, (cumulative_time, __)): cumulative_time
-            for call_name, (cumulative_time, call_count) in islice(sorted(self._debug_statistics.iteritems(), key=key, reverse=True), 10):
+            for call_name, (cumulative_time, call_count) in islice(sorted(self._statistics.iteritems(), key=key, reverse=True), 10):
                 dprint("%8.2fs %6dx" % (cumulative_time, call_count), "  - ", call_name, force=True)
 
             dprint("top ten calls, sorted by execution count", line=True, force=True)
             key = lambda (_, (__, call_count)): call_count
-            for call_name, (cumulative_time, call_count) in islice(sorted(self._debug_statistics.iteritems(), key=key, reverse=True), 10):
+            for call_name, (cumulative_time, call_count) in islice(sorted(self._statistics.iteritems(), key=key, reverse=True), 10):
                 dprint("%8.2fs %6dx" % (cumulative_time, call_count), "  - ", call_name, force=True)
 
 if __debug__:
@@ -13,6 +13,7 @@ from hashlib import sha1
 # from math import sqrt
 # from random import gauss, choice
 from random import expovariate, random, Random
+from time import time
 
 from bloomfilter import BloomFilter
 from cache import CacheDict
@@ -26,12 +27,17 @@ from dispersydatabase import DispersyDatabase
 from distribution import SyncDistribution
 from member import Member
 from resolution import PublicResolution, LinearResolution, DynamicResolution
+from syncindex import SyncIndex
 from timeline import Timeline
 
 if __debug__:
     from dprint import dprint
     from math import ceil
-    from time import time
+
+# rebuild each claimed prepared sync bloom filter from the sync table and compare them.  this
+# selects all packets in the range, undoing the gain of the prepared bloom filters, hence it is
+# only enabled when debugging the SyncIndex
+CHECK_PREPARED_BLOOM_FILTERS = False
 
 class SubjectiveSetCache(object):
     def __init__(self, packet, subjective_set):
@@ -267,6 +273,10 @@ class Community(object):
         assert isinstance(self._global_time, (int, long))
         if __debug__: dprint("global time:   ", self._global_time)
 
+        # in-memory copy of the syncable packets, used to claim sync bloom filters.  loaded on
+        # first use
+        self._sync_index = SyncIndex(self.dispersy_sync_index_max_bytes)
+
         # sync range bloom filters
         if __debug__:
             b = BloomFilter(self.dispersy_sync_bloom_filter_bits, self.dispersy_sync_bloom_filter_error_rate)
@@ -499,6 +509,41 @@ class Community(object):
         """
         return (1500 - 60 - 8 - 51 - self._my_member.signature_length - 21 - 30) * 8
 
+    @property
+    def dispersy_sync_index_max_bytes(self):
+        """
+        The maximum number of packet bytes that the sync index keeps in memory.
+
+        The sync index always keeps the global times of all syncable packets in memory.  When the
+        packets themselves exceed this limit they are read from the database when a sync bloom
+        filter is claimed.
+        @rtype: int
+        """
+        return 4 * 1024 * 1024
+
+    @property
+    def dispersy_sync_bloom_filter_cache_size(self):
+        """
+        The number of sync bloom filters that are claimed in turn before they expire.
+
+        A claimed bloom filter is kept and claimed again in later walker steps.  New packets within
+        its range are added to it, hence claiming it again costs only the hashing of these new
+        packets.  Zero disables this, making a new bloom filter for every walker step.
+        @rtype: int
+        """
+        return 4
+
+    @property
+    def dispersy_sync_bloom_filter_cache_lifetime(self):
+        """
+        The number of seconds that a sync bloom filter can be claimed again.
+
+        After this time a bloom filter with a new range and prefix is made, hence false positives
+        do not persist.
+        @rtype: float
+        """
+        return 60.0
+
     def dispersy_claim_sync_bloom_filter(self, identifier):
         """
         Returns a (time_low, time_high, modulo, offset, bloom_filter) tuple or None.
@@ -593,8 +638,7 @@ class Community(object):
                 time_low = 1
                 time_high = 0
 
-            for _, packet in data:
-                bloom.add(str(packet))
+            bloom.add_keys(str(packet) for _, packet in data)
 
             #print >> sys.stderr, "Syncing %d-%d, nr_packets = %d, capacity = %d, packets %d-%d"%(time_low, time_high, len(data), capacity, data[0][0], data[-1][0])
 
@@ -665,8 +709,7 @@ class Community(object):
                 time_low = 1
                 time_high = 0
 
-            for _, packet in data:
-                bloom.add(str(packet))
+            bloom.add_keys(str(packet) for _, packet in data)
 
             #print >> sys.stderr, "Syncing %d-%d, nr_packets = %d, capacity = %d, packets %d-%d"%(time_low, time_high, len(data), capacity, data[0][0], data[-1][0])
 
@@ -681,6 +724,16 @@ class Community(object):
         
         syncable_messages = u", ".join(unicode(meta.database_id) for meta in self._meta_messages.itervalues() if isinstance(meta.distribution, SyncDistribution) and meta.distribution.priority > 32)
         if syncable_messages:
+            index = self.sync_index
+            now = time()
+            prepared = index.claim_bloom_filter(now, self.dispersy_sync_bloom_filter_cache_size)
+            if prepared:
+                if CHECK_PREPARED_BLOOM_FILTERS:
+                    self._check_prepared_bloom_filter(prepared, syncable_messages)
+                if __debug__:
+                    dprint(self.cid.encode("HEX"), " syncing %d-%d, nr_packets = %d, capacity = %d (prepared)" % (prepared.time_low, prepared.time_high, prepared.count, prepared.capacity))
+                return (prepared.time_low, prepared.time_high, 1, 0, prepared.bloom_filter)
+
             if __debug__:
                 t2 = time()
                     
@@ -696,12 +749,12 @@ class Community(object):
             bloomfilter_range = [1, self._global_time]
             if from_gbtime > 1:
                 #use from_gbtime -1/+1 to include from_gbtime
-                right = self._select_bloomfilter_range(syncable_messages, from_gbtime -1, capacity, True)
+                right = self._select_bloomfilter_range(index, from_gbtime -1, capacity, True)
 
                 #if right did not get to capacity, then we have less than capacity items in the database
                 #skip left
                 if right[2] >= capacity:
-                    left = self._select_bloomfilter_range(syncable_messages, from_gbtime + 1, capacity, False)
+                    left = self._select_bloomfilter_range(index, from_gbtime + 1, capacity, False)
                     left_range = left[1] - left[0]
                     right_range = right[1] - right[0]
 
@@ -715,13 +768,17 @@ class Community(object):
                 if __debug__:
                     t3 = time()
                 
-                data = list(self._dispersy_database.execute(u"SELECT global_time, packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time BETWEEN ? AND ? ORDER BY global_time ASC" % syncable_messages,
-                                                           (bloomfilter_range[0], bloomfilter_range[1])))
+                data = index.select(bloomfilter_range[0], bloomfilter_range[1])
+                if data is None:
+                    data = list(self._dispersy_database.execute(u"SELECT global_time, packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time BETWEEN ? AND ? ORDER BY global_time ASC" % syncable_messages,
+                                                               (bloomfilter_range[0], bloomfilter_range[1])))
             else:
                 if __debug__:
                     t3 = time()
                 
-                data = self._select_and_fix(syncable_messages, 0, capacity, True)
+                data = index.select_fixed(0, capacity, True)
+                if data is None:
+                    data = self._select_and_fix(syncable_messages, 0, capacity, True)
                 if len(data) > 0:
                     bloomfilter_range[1] = data[-1][0]
         
@@ -737,8 +794,9 @@ class Community(object):
                     bloomfilter_range[0] = 1
                     bloomfilter_range[1] = 0
 
-                for _, packet in data:
-                    bloom.add(str(packet))
+                bloom.add_keys(str(packet) for _, packet in data)
+                if len(data) <= capacity:
+                    index.prepare_bloom_filter(bloomfilter_range[0], bloomfilter_range[1], bloom, len(data), capacity, now + self.dispersy_sync_bloom_filter_cache_lifetime)
 
                 if __debug__:
                     dprint(self.cid.encode("HEX"), " syncing %d-%d, nr_packets = %d, capacity = %d, packets %d-%d, pivot = %d"%(bloomfilter_range[0], bloomfilter_range[1], len(data), capacity, data[0][0], data[-1][0], from_gbtime))
@@ -753,6 +811,16 @@ class Community(object):
             dprint(self.cid.encode("HEX"), " NOT syncing no syncable messages")
         return (1, 0, 1, 0, BloomFilter(8, 0.1, prefix='\x00'))
 
+    def _check_prepared_bloom_filter(self, prepared, syncable_messages):
+        """
+        A prepared bloom filter must be identical to a bloom filter that is built from the
+        packets in the sync table.  Only called when CHECK_PREPARED_BLOOM_FILTERS is True.
+        """
+        bloom = BloomFilter("\x00" * len(prepared.bloom_filter.bytes), prepared.bloom_filter.functions, prefix=prepared.bloom_filter.prefix)
+        bloom.add_keys(str(packet) for packet, in self._dispersy_database.execute(u"SELECT packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time BETWEEN ? AND ?" % syncable_messages,
+                                                                                 (prepared.time_low, prepared.time_high or self._global_time)))
+        assert bloom.bytes == prepared.bloom_filter.bytes, ("prepared bloom filter differs from the sync table", prepared.time_low, prepared.time_high, prepared.count)
+
     def _select_and_fix(self, syncable_messages, global_time, to_select, higher = True):
         assert isinstance(syncable_messages, unicode)
         if higher:
@@ -773,17 +841,12 @@ class Community(object):
             data.reverse()
         return data
 
-    def _select_bloomfilter_range(self, syncable_messages, global_time, to_select, higher = True):
-        assert isinstance(syncable_messages, unicode)
-        if higher:
-            data = list(self._dispersy_database.execute(u"SELECT global_time FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time > ? ORDER BY global_time ASC LIMIT ?" % syncable_messages,
-                                                    (global_time, to_select)))
-        else:
-            data = list(self._dispersy_database.execute(u"SELECT global_time FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time < ? ORDER BY global_time DESC LIMIT ?" % syncable_messages,
-                                                    (global_time, to_select)))
+    def _select_bloomfilter_range(self, index, global_time, to_select, higher = True):
+        assert isinstance(index, SyncIndex)
+        data = index.select_times(global_time, to_select, higher)
 
         if len(data) > 0:
-            bloomfilter_range = [min(data)[0], max(data)[0], len(data)]
+            bloomfilter_range = [min(data), max(data), len(data)]
         else:
             bloomfilter_range = [1, self._global_time, 0]
 
@@ -793,19 +856,17 @@ class Community(object):
             if higher:
                 bloomfilter_range[1] = self._global_time
                 
-                lower = list(self._dispersy_database.execute(u"SELECT global_time FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time < ? ORDER BY global_time DESC LIMIT ?" % syncable_messages,
-                                                            (global_time + 1, to_select)))
+                lower = index.select_times(global_time + 1, to_select, False)
                 if len(lower) > 0:
                     bloomfilter_range[2]+= len(lower)
-                    bloomfilter_range[0] = min(lower)[0]
+                    bloomfilter_range[0] = min(lower)
             else:
                 bloomfilter_range[0] = 1
-
-                higher = list(self._dispersy_database.execute(u"SELECT global_time FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time > ? ORDER BY global_time ASC LIMIT ?" % syncable_messages,
-                                                            (global_time - 1, to_select)))
+                
+                higher = index.select_times(global_time - 1, to_select, True)
                 if len(higher) > 0:
                     bloomfilter_range[2]+= len(higher)            
-                    bloomfilter_range[1] = max(higher)[0]
+                    bloomfilter_range[1] = max(higher)
 
         return bloomfilter_range
 
@@ -893,6 +954,30 @@ class Community(object):
         """
         return 5 * 1025
 
+    @property
+    def dispersy_sync_response_rate(self):
+        """
+        The maximum number of bytes per second to send to a single candidate in response to
+        dispersy-sync messages.
+
+        Up to dispersy_sync_response_limit bytes can be sent at once, after that the candidate has
+        to wait until enough time has passed.
+        @rtype: int
+        """
+        return 5 * 1025
+
+    @property
+    def dispersy_sync_upload_budget(self):
+        """
+        The maximum number of bytes per second to send to all candidates together in response to
+        dispersy-sync messages.
+
+        Nodes that receive many dispersy-sync messages, such as bootstrap and tracker nodes, can
+        lower this value to stay within their upload capacity.
+        @rtype: int
+        """
+        return 256 * 1024
+
     @property
     def dispersy_missing_sequence_response_limit(self):
         """
@@ -1000,6 +1085,19 @@ class Community(object):
         """
         return max(1, self._global_time)
 
+    @property
+    def sync_index(self):
+        """
+        The in-memory index of the syncable packets in this community.
+
+        The index is loaded from the database when it is not loaded yet.  Dispersy updates the
+        index whenever packets are stored, removed, undone, or redone.
+        @rtype: SyncIndex
+        """
+        if not self._sync_index.is_loaded:
+            self._sync_index.load(self._dispersy_database, [meta.database_id for meta in self._meta_messages.itervalues() if isinstance(meta.distribution, SyncDistribution) and meta.distribution.priority > 32])
+        return self._sync_index
+
     def unload_community(self):
         """
         Unload a single community.
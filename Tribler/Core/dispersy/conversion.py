@@ -103,17 +103,21 @@ class Conversion(object):
         assert data[:22] == self._prefix
         raise NotImplementedError("The subclass must implement decode_message")
 
-    def decode_message(self, address, data):
+    def decode_message(self, address, data, verified=False):
         """
         DATA is a string, where the first byte is the on-the-wire Dispersy version, the second byte
         is the on-the-wire Community version and the following 20 bytes is the Community Identifier.
         The rest is the message payload.
 
+        When VERIFIED is True the member signature is not checked, for instance because DATA was
+        read from the sync table.
+
         Returns a Message instance.
         """
         assert isinstance(data, str)
         assert len(data) >= 22
         assert data[:22] == self._prefix
+        assert isinstance(verified, bool)
         raise NotImplementedError("The subclass must implement decode_message")
 
     def encode_message(self, message):
@@ -1075,7 +1079,7 @@ class BinaryConversion(Conversion):
 
         return offset, placeholder.meta.resolution.implement(policy)
 
-    def _decode_authentication(self, authentication, offset, data):
+    def _decode_authentication(self, authentication, offset, data, verified=False):
         if isinstance(authentication, NoAuthentication):
             return offset, authentication.implement(), len(data)
 
@@ -1094,12 +1098,24 @@ class BinaryConversion(Conversion):
                 if not members:
                     raise DelayPacketByMissingMember(self._community, member_id)
 
+                # a packet from the sync table was verified before it was stored.  when several
+                # members share the member id, only the signature tells which one signed it
+                if verified and len(members) == 1:
+                    member = members[0]
+                    return offset, authentication.implement(member, is_signed=True), len(data) - member.signature_length
+
+                verifier = self._community.dispersy.signature_verifier
                 for member in members:
                     first_signature_offset = len(data) - member.signature_length
 
                     if __debug__:
                         debug_begin = time()
-                    if member.verify(data, data[first_signature_offset:], length=first_signature_offset):
+                    # the signature may already be verified by Dispersy._on_batch_cache, or the
+                    # packet may have been verified and stored before
+                    is_verified = verifier.get(member, data)
+                    if is_verified is None:
+                        is_verified = member.verify(data, data[first_signature_offset:], length=first_signature_offset)
+                    if is_verified:
                         if __debug__:
                             self.debug_stats["decode-authentication-verify"] += time() - debug_begin
                         return offset, authentication.implement(member, is_signed=True), first_signature_offset
@@ -1139,7 +1155,11 @@ class BinaryConversion(Conversion):
 
                 if __debug__:
                     debug_begin = time()
-                if member.verify(data, data[first_signature_offset:], length=first_signature_offset):
+                # the packet may have been verified and stored before
+                is_verified = verified or self._community.dispersy.signature_verifier.get(member, data)
+                if is_verified is None:
+                    is_verified = member.verify(data, data[first_signature_offset:], length=first_signature_offset)
+                if is_verified:
                     if __debug__:
                         self.debug_stats["decode-authentication-verify"] += time() - debug_begin
                     return offset, authentication.implement(member, is_signed=True), first_signature_offset
@@ -1208,7 +1228,7 @@ class BinaryConversion(Conversion):
         assert subjective_set, "We must always have subjective sets for ourself"
         return meta.destination.implement(placeholder.authentication.member.public_key in subjective_set)
 
-    def _decode_message(self, candidate, data, verify_all_signatures):
+    def _decode_message(self, candidate, data, verify_all_signatures, verified=False):
         """
         Decode a binary string into a Message structure, with some
         Dispersy specific parameters.
@@ -1218,9 +1238,13 @@ class BinaryConversion(Conversion):
         \x00 bytes.  Message.authentication.signed_members returns
         information on which members had a signature present.
         Signatures that are set and fail will NOT be accepted.
+
+        When VERIFIED is True the signature of a MemberAuthentication
+        message is not checked.
         """
         assert isinstance(data, str)
         assert isinstance(verify_all_signatures, bool)
+        assert isinstance(verified, bool)
         assert len(data) >= 22
         assert data[:22] == self._prefix, (data[:22].encode("HEX"), self._prefix.encode("HEX"))
 
@@ -1243,7 +1267,7 @@ class BinaryConversion(Conversion):
             debug_begin = time()
 
         # authentication
-        placeholder.offset, placeholder.authentication, placeholder.first_signature_offset = self._decode_authentication(placeholder.meta.authentication, placeholder.offset, placeholder.data)
+        placeholder.offset, placeholder.authentication, placeholder.first_signature_offset = self._decode_authentication(placeholder.meta.authentication, placeholder.offset, placeholder.data, verified)
         if verify_all_signatures and not placeholder.authentication.is_signed:
             raise DropPacket("Invalid signature")
         # drop packet if the creator is blacklisted.  we would prefer to do this in dispersy.py,
@@ -1320,13 +1344,13 @@ class BinaryConversion(Conversion):
 
         return meta_message
 
-    def decode_message(self, candidate, data):
+    def decode_message(self, candidate, data, verified=False):
         """
         Decode a binary string into a Message.Implementation structure.
         """
         assert isinstance(candidate, Candidate), candidate
         assert isinstance(data, str), data
-        return self._decode_message(candidate, data, True)
+        return self._decode_message(candidate, data, True, verified)
 
 class DefaultConversion(BinaryConversion):
     """
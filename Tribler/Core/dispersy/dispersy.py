@@ -48,6 +48,7 @@ from decorator import runtime_duration_warning
 from authentication import NoAuthentication, MemberAuthentication, MultiMemberAuthentication
 from bloomfilter import BloomFilter
 from bootstrap import get_bootstrap_addresses
+from cache import SyncCache
 from callback import Callback, Idle, Return
 from candidate import BootstrapCandidate, LoopbackCandidate, WalkCandidate
 from destination import CommunityDestination, CandidateDestination, MemberDestination, SubjectiveDestination
@@ -68,7 +69,9 @@ from payload import SignatureRequestPayload, SignatureResponsePayload
 from payload import SubjectiveSetPayload, MissingSubjectiveSetPayload
 from resolution import PublicResolution, LinearResolution
 from singleton import Singleton
+from syncresponder import SyncResponder
 from trigger import TriggerCallback, TriggerPacket, TriggerMessage
+from verifier import SignatureVerifier
 
 from Tribler.Core.NATFirewall.guessip import get_my_wan_ip
 
@@ -115,6 +118,10 @@ class Statistics(object):
         self._delay = {}
         self._success = {}
         self._outgoing = {}
+        self._sync_sent = {}
+        self._sync_dropped = {}
+        self._verified_hits = 0
+        self._verified_misses = 0
         self._sequence_number = 0
         self._total_up = 0, 0
         self._total_down = 0, 0
@@ -136,6 +143,10 @@ class Statistics(object):
                 "delay":self._delay,
                 "success":self._success,
                 "outgoing":self._outgoing,
+                "sync_sent":self._sync_sent,
+                "sync_dropped":self._sync_dropped,
+                "verified_hits":self._verified_hits,
+                "verified_misses":self._verified_misses,
                 "sequence_number":self._sequence_number,
                 "total_up":self._total_up,
                 "total_down":self._total_down,
@@ -156,6 +167,11 @@ class Statistics(object):
                 a, b = outgoing.get(key, (0, 0))
                 outgoing[key] = (a+amount, b+byte_count)
         info["outgoing"] = outgoing
+        amount, byte_count = 0, 0
+        for a, b in info["sync_sent"].itervalues():
+            amount += a
+            byte_count += b
+        info["sync_sent"] = (amount, byte_count)
         return info
 
     def reset(self):
@@ -170,6 +186,10 @@ class Statistics(object):
             self._delay = {}
             self._success = {}
             self._outgoing = {}
+            self._sync_sent = {}
+            self._sync_dropped = {}
+            self._verified_hits = 0
+            self._verified_misses = 0
             self._sequence_number += 1
             self._total_up = 0, 0
             self._total_down = 0, 0
@@ -219,6 +239,42 @@ class Statistics(object):
         a, b = subdict.get(key, (0, 0))
         subdict[key] = (a+amount, b+byte_count)
 
+    def sync_sent(self, address, byte_count, amount=1):
+        """
+        Called when the SyncResponder sends packets in response to a sync request.
+        """
+        assert isinstance(address, tuple)
+        assert len(address) == 2
+        assert isinstance(byte_count, (int, long))
+        assert isinstance(amount, (int, long))
+        a, b = self._sync_sent.get(address, (0, 0))
+        self._sync_sent[address] = (a+amount, b+byte_count)
+
+    def sync_dropped(self, key, byte_count, amount=1):
+        """
+        Called when the SyncResponder drops queued packets.
+        """
+        assert isinstance(key, (str, unicode))
+        assert isinstance(byte_count, (int, long))
+        assert isinstance(amount, (int, long))
+        a, b = self._sync_dropped.get(key, (0, 0))
+        self._sync_dropped[key] = (a+amount, b+byte_count)
+
+    def increment_verified_hits(self, amount=1):
+        """
+        Called when a signature did not need to be verified because the packet was verified and
+        stored before.
+        """
+        assert isinstance(amount, (int, long))
+        self._verified_hits += amount
+
+    def increment_verified_misses(self, amount=1):
+        """
+        Called when a signature had to be verified.
+        """
+        assert isinstance(amount, (int, long))
+        self._verified_misses += amount
+
     def increment_total_up(self, byte_count, amount):
         assert isinstance(byte_count, (int, long))
         assert isinstance(amount, (int, long))
@@ -239,7 +295,7 @@ class Dispersy(Singleton):
     The Dispersy class provides the interface to all Dispersy related commands, managing the in- and
     outgoing data for, possibly, multiple communities.
     """
-    def __init__(self, callback, working_directory):
+    def __init__(self, callback, working_directory, verifier_processes=0):
         """
         Initialize the Dispersy singleton instance.
 
@@ -252,9 +308,14 @@ class Dispersy(Singleton):
 
         @param working_directory: The directory where all files should be stored.
         @type working_directory: unicode
+
+        @param verifier_processes: The number of worker processes that verify signatures, zero to
+         verify them on the callback thread.  See SignatureVerifier.
+        @type verifier_processes: int or None
         """
         assert isinstance(callback, Callback)
         assert isinstance(working_directory, unicode)
+        assert verifier_processes is None or isinstance(verifier_processes, int)
 
         super(Dispersy, self).__init__()
 
@@ -270,6 +331,9 @@ class Dispersy(Singleton):
         # our data storage
         self._database = DispersyDatabase.get_instance(working_directory)
 
+        # packets selected by check_sync for recently requested sync ranges
+        self._sync_cache = SyncCache()
+
         # peer selection candidates.  address:Candidate pairs (where
         # address is obtained from socket.recv_from)
         self._candidates = {}
@@ -341,6 +405,13 @@ class Dispersy(Singleton):
         # statistics...
         self._statistics = Statistics()
 
+        # bandwidth throttled responses to sync requests
+        self._sync_responder = SyncResponder(self._callback, self._send, self._statistics)
+
+        # verifies the signatures of incoming batches, possibly in parallel, and remembers the
+        # stored packets that were verified
+        self._signature_verifier = SignatureVerifier(self._statistics, verifier_processes)
+
         if __debug__:
             self._callback.register(self._stats_candidates)
             self._callback.register(self._stats_detailed_candidates)
@@ -886,6 +957,8 @@ class Dispersy(Singleton):
                         # replace our current message with the other one
                         self._database.execute(u"UPDATE sync SET packet = ? WHERE community = ? AND member = ? AND global_time = ?",
                                                (buffer(message.packet), message.community.database_id, message.authentication.member.database_id, message.distribution.global_time))
+                        self._sync_cache.invalidate(message.community)
+                        message.community._sync_index.reset()
 
                         # notify that global times have changed
                         # message.community.update_sync_range(message.meta, [message.distribution.global_time])
@@ -1298,9 +1371,12 @@ class Dispersy(Singleton):
         message.packet_id = packet_id
         return message
 
-    def convert_packet_to_message(self, packet, community=None, load=True, auto_load=True):
+    def convert_packet_to_message(self, packet, community=None, load=True, auto_load=True, verified=False):
         """
         Returns the Message representing the packet or None when no conversion is possible.
+
+        VERIFIED must only be True for packets that were verified before, such as those read from
+        the sync table, their signature is not checked again.
         """
         if __debug__:
             # pylint: disable-msg=W0404
@@ -1309,6 +1385,7 @@ class Dispersy(Singleton):
         assert isinstance(community, (type(None), Community))
         assert isinstance(load, bool)
         assert isinstance(auto_load, bool)
+        assert isinstance(verified, bool)
 
         # find associated community
         if not community:
@@ -1326,7 +1403,7 @@ class Dispersy(Singleton):
             return None
 
         try:
-            return conversion.decode_message(LoopbackCandidate(), packet)
+            return conversion.decode_message(LoopbackCandidate(), packet, verified)
 
         except (DropPacket, DelayPacket), exception:
             if __debug__: dprint("unable to convert a ", len(packet), " byte packet (", exception, ")", exception=True, level="warning")
@@ -1451,10 +1528,12 @@ class Dispersy(Singleton):
 
          1. All duplicate binary packets are removed.
 
-         2. All binary packets are converted into Message.Implementation instances.  Some packets
+         2. The signatures of all binary packets are verified, possibly in parallel.
+
+         3. All binary packets are converted into Message.Implementation instances.  Some packets
             are dropped or delayed at this stage.
 
-         3. All remaining messages are passed to on_message_batch.
+         4. All remaining messages are passed to on_message_batch.
         """
         def unique(batch):
             unique = set()
@@ -1471,8 +1550,14 @@ class Dispersy(Singleton):
         # todo: make _convert_batch_into_messages accept iterator instead of list to avoid conversion
         batch = list(unique(batch))
 
+        # verify signatures before conversion, the conversion uses these results
+        self._signature_verifier.verify_batch(meta, batch)
+
         # convert binary packets into Message.Implementation instances
-        messages = list(self._convert_batch_into_messages(batch))
+        try:
+            messages = list(self._convert_batch_into_messages(batch))
+        finally:
+            self._signature_verifier.clear()
         assert all(isinstance(message, Message.Implementation) for message in messages), "_convert_batch_into_messages must return only Message.Implementation instances"
         assert all(message.meta == meta for message in messages), "All Message.Implementation instances must be in the same batch"
         if __debug__: dprint(len(messages), " ", meta.name, " messages after conversion")
@@ -1601,6 +1686,21 @@ class Dispersy(Singleton):
         # return the number of messages that were correctly handled (non delay, duplictes, etc)
         return len(messages)
 
+    def stop(self):
+        """
+        Stop the worker processes that Dispersy started.  Call this when Dispersy is no longer
+        used.
+        """
+        self._signature_verifier.close()
+
+    @property
+    def signature_verifier(self):
+        """
+        The SignatureVerifier that verifies the signatures of incoming batches.
+        @rtype: SignatureVerifier
+        """
+        return self._signature_verifier
+
     def _convert_packets_into_batch(self, packets):
         """
         Convert a list with one or more (candidate, data) tuples into a list with zero or more
@@ -1731,6 +1831,7 @@ class Dispersy(Singleton):
 
         meta = messages[0].meta
         if __debug__: dprint("attempting to store ", len(messages), " ", meta.name, " messages")
+        self._sync_cache.invalidate(meta.community)
         is_subjective_destination = isinstance(meta.destination, SubjectiveDestination)
         is_multi_member_authentication = isinstance(meta.authentication, MultiMemberAuthentication)
 
@@ -1763,6 +1864,9 @@ class Dispersy(Singleton):
             # ensure that we can reference this packet
             message.packet_id = self._database.last_insert_rowid
             if __debug__: dprint("insert_rowid: ", message.packet_id, " for ", message.name)
+            if not is_multi_member_authentication:
+                self._signature_verifier.stored(message.authentication.member, message.packet)
+            meta.community._sync_index.add(message.database_id, message.distribution.global_time, message.packet_id, message.packet)
 
             # link multiple members is needed
             if is_multi_member_authentication:
@@ -1807,6 +1911,8 @@ class Dispersy(Singleton):
                 self._database.executemany(u"DELETE FROM sync WHERE id = ?", [(id_,) for id_, _, _ in items])
                 assert len(items) == self._database.changes
                 if __debug__: dprint("deleted ", self._database.changes, " messages ", [id_ for id_, _, _ in items])
+                for id_, _, global_time in items:
+                    meta.community._sync_index.remove(global_time, id_)
 
                 if is_multi_member_authentication:
                     self._database.executemany(u"DELETE FROM reference_member_sync WHERE sync = ?", [(id_,) for id_, _, _ in items])
@@ -2673,6 +2779,8 @@ class Dispersy(Singleton):
         # remove all messages created by the malicious member
         self._database.execute(u"DELETE FROM sync WHERE community = ? AND member = ?",
                                (community.database_id, member.database_id))
+        self._sync_cache.invalidate(community)
+        community._sync_index.reset()
 
         # TODO: if we have a address for the malicious member, we can also remove her from the
         # candidate table
@@ -3394,6 +3502,74 @@ class Dispersy(Singleton):
                 else:
                     if __debug__: dprint("unable to give missing proof.  allowed:", allowed, ".  proofs:", len(proofs), " packets")
 
+    def _get_sync_groups(self, community):
+        """
+        Returns the syncable meta messages of COMMUNITY grouped in the order that check_sync
+        offers them, i.e. by priority (high to low) and then by global time using the
+        synchronization direction of the meta message.
+
+        Returns a list with (direction, meta_messages, subjective) tuples, where DIRECTION is 1
+        for ASC and -1 for DESC, META_MESSAGES is a dictionary with database_id:meta pairs, and
+        SUBJECTIVE is True when one of the meta messages uses the SubjectiveDestination policy.
+        """
+        groups = {}
+        for meta in community.get_meta_messages():
+            if isinstance(meta.distribution, SyncDistribution) and meta.distribution.priority > 32:
+                direction = -1 if meta.distribution.synchronization_direction == u"DESC" else 1
+                groups.setdefault((-meta.distribution.priority, direction), {})[meta.database_id] = meta
+        return [(direction, metas, any(isinstance(meta.destination, SubjectiveDestination) for meta in metas.itervalues()))
+                for (_, direction), metas
+                in sorted(groups.iteritems())]
+
+    def _select_sync_packets(self, community, time_low, time_high, modulo, offset):
+        """
+        Yields (packet, meta, public_key) tuples for all packets of COMMUNITY in the sync range
+        [TIME_LOW:TIME_HIGH] where (global_time + OFFSET) % MODULO is zero.  PUBLIC_KEY is only
+        given for meta messages that use the SubjectiveDestination policy, otherwise it is None.
+
+        Each group of meta messages with the same priority and direction is selected with its
+        own query on the sync(meta_message, undone, global_time) index.  Hence this is lazy: when
+        the caller stops iterating, no more packets are read from the database.
+        """
+        for direction, metas, subjective in self._get_sync_groups(community):
+            if subjective:
+                sql = u"SELECT sync.packet, sync.meta_message, member.public_key FROM sync JOIN member ON member.id = sync.member"
+            else:
+                sql = u"SELECT sync.packet, sync.meta_message, NULL FROM sync"
+            sql += u" WHERE sync.meta_message IN (%s) AND sync.undone = 0 AND sync.global_time BETWEEN ? AND ? AND (sync.global_time + ?) %% ? = 0 ORDER BY sync.global_time %s" % \
+                   (u", ".join(u"?" for _ in metas), u"DESC" if direction == -1 else u"ASC")
+            bindings = tuple(metas.iterkeys()) + (time_low, time_high, offset, modulo)
+            for packet, meta_message_id, public_key in self._database.execute(sql, bindings):
+                yield str(packet), metas[meta_message_id], None if public_key is None else str(public_key)
+
+    def _get_sync_packets(self, community, time_low, time_high, modulo, offset):
+        """
+        Returns an iterator over the same (packet, meta, public_key) tuples as
+        _select_sync_packets, using the sync cache when this range was recently selected.
+        """
+        key = (time_low, time_high, modulo, offset)
+        packets = self._sync_cache.get(community, key, time())
+        if packets is None:
+            return self._select_and_cache_sync_packets(community, key)
+        return iter(packets)
+
+    def _select_and_cache_sync_packets(self, community, key):
+        """
+        Yields the tuples from _select_sync_packets and adds them to the sync cache.  The packets
+        are only cached when the caller iterates over all of them.
+        """
+        packets = []
+        byte_count = 0
+        for tup in self._select_sync_packets(community, *key):
+            yield tup
+            if packets is not None:
+                packets.append(tup)
+                byte_count += len(tup[0])
+                if byte_count > self._sync_cache.max_entry_bytes:
+                    packets = None
+        if packets is not None:
+            self._sync_cache.set(community, key, packets, byte_count, time())
+
     @runtime_duration_warning(0.1)
     def check_sync(self, messages):
         """
@@ -3412,21 +3588,12 @@ class Dispersy(Singleton):
          Therefore, if multiple nodes receive this dispersy-sync message they will probably all send
          the same messages back.  So we need to make things smarter!
 
-        @todo: we need to optimise this to include a bandwidth throttle.  Otherwise a node can
-         easilly force us to send arbitrary large amounts of data.
+        The selected packets are not sent immediately but given to the SyncResponder, which sends
+        them as the dispersy_sync_response_rate and dispersy_sync_upload_budget of the community
+        allow.
         """
-        sql = u"""SELECT sync.packet, sync.meta_message, member.public_key
-                  FROM sync
-                  JOIN member ON member.id = sync.member
-                  JOIN meta_message ON meta_message.id = sync.meta_message
-                  WHERE sync.community = ? AND meta_message.priority > 32 AND sync.undone = 0 AND sync.global_time BETWEEN ? AND ? AND (sync.global_time + ?) % ? = 0
-                  ORDER BY meta_message.priority DESC, sync.global_time * meta_message.direction"""
-
         community = messages[0].community
 
-        # obtain all available messages for this community
-        meta_messages = dict((meta_message.database_id, meta_message) for meta_message in community.get_meta_messages())
-
         for message in messages:
             assert message.name == u"dispersy-introduction-request", "this method is called in batches, i.e. community and meta message grouped together"
             assert message.community == community, "this method is called in batches, i.e. community and meta message grouped together"
@@ -3456,53 +3623,37 @@ class Dispersy(Singleton):
                 offset = message.payload.offset
                 packets = []
 
-                if __debug__:
-                    begin = time()
-                    for _ in self._database.execute(sql, (community.database_id, time_low, time_high, offset, modulo)):
-                        pass
-                    end = time()
-                    select = end - begin
-                    dprint("select: %.3f" % select, " [", time_low, ":", time_high, "] %", modulo, "+", offset)
-
-                for packet, meta_message_id, packet_public_key in self._database.execute(sql, (community.database_id, time_low, time_high, offset, modulo)):
-                    packet = str(packet)
-                    packet_public_key = str(packet_public_key)
-
-                    if not packet in bloom_filter:
-                        packet_meta = meta_messages.get(meta_message_id, None)
-                        if not packet_meta:
-                            if __debug__: dprint("not syncing missing unknown message (", len(packet), " bytes, id: ", meta_message_id, ")", level="warning")
-                            continue
-
-                        # check if the packet uses the SubjectiveDestination policy
-                        if isinstance(packet_meta.destination, SubjectiveDestination):
-                            packet_cluster = packet_meta.destination.cluster
-
-                            # we need the subjective set for this particular cluster
-                            assert packet_cluster in subjective_sets, "subjective_sets must contain all existing clusters, however, some may be None"
-                            subjective_set = subjective_sets[packet_cluster]
-                            if not subjective_set:
-                                if __debug__: dprint("subjective set not available (not ", packet_cluster, " in ", subjective_sets.keys(), ")")
-                                yield DelayMessageBySubjectiveSet(message, packet_cluster)
-                                break
+                # not_filter only yields the packets that are not in the bloom filter
+                for packet, packet_meta, packet_public_key in bloom_filter.not_filter(self._get_sync_packets(community, time_low, time_high, modulo, offset)):
+                    # check if the packet uses the SubjectiveDestination policy
+                    if isinstance(packet_meta.destination, SubjectiveDestination):
+                        packet_cluster = packet_meta.destination.cluster
+
+                        # we need the subjective set for this particular cluster
+                        assert packet_cluster in subjective_sets, "subjective_sets must contain all existing clusters, however, some may be None"
+                        subjective_set = subjective_sets[packet_cluster]
+                        if not subjective_set:
+                            if __debug__: dprint("subjective set not available (not ", packet_cluster, " in ", subjective_sets.keys(), ")")
+                            yield DelayMessageBySubjectiveSet(message, packet_cluster)
+                            break
 
-                            # is packet_public_key in the subjective set
-                            if not packet_public_key in subjective_set:
-                                if __debug__: dprint("found missing ", packet_meta.name, " not matching requestors subjective set.  not syncing")
-                                continue
+                        # is packet_public_key in the subjective set
+                        if not packet_public_key in subjective_set:
+                            if __debug__: dprint("found missing ", packet_meta.name, " not matching requestors subjective set.  not syncing")
+                            continue
 
-                        if __debug__:dprint("found missing ", packet_meta.name, " (", len(packet), " bytes) ", sha1(packet).digest().encode("HEX"))
+                    if __debug__:dprint("found missing ", packet_meta.name, " (", len(packet), " bytes) ", sha1(packet).digest().encode("HEX"))
 
-                        packets.append(packet)
-                        byte_limit -= len(packet)
-                        if byte_limit <= 0:
-                            if __debug__:
-                                dprint("bandwidth throttle")
-                            break
+                    packets.append((packet_meta.distribution.priority, packet))
+                    byte_limit -= len(packet)
+                    if byte_limit <= 0:
+                        if __debug__:
+                            dprint("bandwidth throttle")
+                        break
 
                 if packets:
-                    if __debug__: dprint("syncing ", len(packets), " packets (", sum(len(packet) for packet in packets), " bytes) over [", time_low, ":", time_high, "] selecting (%", modulo, "+", offset, ") to " , message.candidate)
-                    self._send([message.candidate], packets, u"-sync-")
+                    if __debug__: dprint("syncing ", len(packets), " packets (", sum(len(packet) for _, packet in packets), " bytes) over [", time_low, ":", time_high, "] selecting (%", modulo, "+", offset, ") to " , message.candidate)
+                    self._sync_responder.enqueue(community, message.candidate, packets)
 
                 else:
                     if __debug__: dprint("did not find anything to sync, ignoring dispersy-sync message")
@@ -3830,6 +3981,9 @@ class Dispersy(Singleton):
 
         self._database.executemany(u"UPDATE sync SET undone = 1 WHERE community = ? AND member = ? AND global_time = ?",
                                    ((message.community.database_id, message.payload.member.database_id, message.payload.global_time) for message in messages))
+        for community in set(message.community for message in messages):
+            self._sync_cache.invalidate(community)
+            community._sync_index.reset()
         for meta, iterator in groupby(messages, key=lambda x: x.payload.packet.meta):
             sub_messages = list(iterator)
             meta.undo_callback([(message.payload.member, message.payload.global_time, message.payload.packet) for message in sub_messages])
@@ -3907,6 +4061,8 @@ class Dispersy(Singleton):
                 # 1. remove all except the dispersy-authorize, dispersy-destroy-community, and
                 # dispersy-identity messages
                 self._database.execute(u"DELETE FROM sync WHERE community = ? AND NOT (meta_message = ? OR meta_message = ? OR meta_message = ?)", (community.database_id, authorize_message_id, destroy_message_id, identity_message_id))
+                self._sync_cache.invalidate(community)
+                community._sync_index.reset()
 
                 # 2. cleanup the reference_member_sync table.  however, we should keep the ones
                 # that are still referenced
@@ -3975,6 +4131,9 @@ class Dispersy(Singleton):
 
                 if undo:
                     executemany(u"UPDATE sync SET undone = 1 WHERE id = ?", ((message.packet_id,) for message in undo))
+                    self._sync_cache.invalidate(community)
+                    for message in undo:
+                        community._sync_index.remove(message.distribution.global_time, message.packet_id)
                     assert self._database.changes == len(undo), (self._database.changes, len(undo))
                     meta.undo_callback([(message.authentication.member, message.distribution.global_time, message) for message in undo])
 
@@ -3983,6 +4142,9 @@ class Dispersy(Singleton):
 
                 if redo:
                     executemany(u"UPDATE sync SET undone = 0 WHERE id = ?", ((message.packet_id,) for message in redo))
+                    self._sync_cache.invalidate(community)
+                    for message in redo:
+                        community._sync_index.add(message.database_id, message.distribution.global_time, message.packet_id, message.packet)
                     assert self._database.changes == len(redo), (self._database.changes, len(redo))
                     meta.handle_callback(redo)
 
@@ -4355,24 +4517,47 @@ class Dispersy(Singleton):
         # 2.2: community["candidates"] is again always a list, new
         #      "dispersy_enable_candidate_walker_responses" attribute
         # 2.3: added info["timestamp"]
+        # 2.4: added info["sync_cache"]
+        # 2.5: added info["sync_responder"], info["statistics"]["sync_sent"] and
+        #      info["statistics"]["sync_dropped"], new "dispersy_sync_response_rate" and
+        #      "dispersy_sync_upload_budget" attributes
+        # 2.6: added community["sync_index"], new "dispersy_sync_index_max_bytes" attribute
+        # 2.7: added community["sync_index"]["bloom_filter..."], new
+        #      "dispersy_sync_bloom_filter_cache_size" and "dispersy_sync_bloom_filter_cache_lifetime"
+        #      attributes
+        # 2.8: added info["signature_verifier"]
+        # 2.9: added info["statistics"]["verified_hits"] and info["statistics"]["verified_misses"]
+        # 3.0: added info["callback"]
 
         now = time()
-        info = {"version":2.3, "class":"Dispersy", "lan_address":self._lan_address, "wan_address":self._wan_address, "timestamp":now}
+        info = {"version":3.0, "class":"Dispersy", "lan_address":self._lan_address, "wan_address":self._wan_address, "timestamp":now}
 
         if statistics:
             info["statistics"] = self._statistics.info()
+            info["sync_cache"] = self._sync_cache.info()
+            info["sync_responder"] = self._sync_responder.info()
+            info["signature_verifier"] = self._signature_verifier.info()
+            info["callback"] = self._callback.get_statistics()
 
         info["communities"] = []
         for community in self._communities.itervalues():
             community_info = {"classification":community.get_classification(), "hex_cid":community.cid.encode("HEX"), "global_time":community.global_time}
             info["communities"].append(community_info)
 
+            if statistics:
+                community_info["sync_index"] = community._sync_index.info()
+
             if attributes:
                 community_info["attributes"] = dict((attr, getattr(community, attr))
                                                     for attr
                                                     in ("dispersy_sync_bloom_filter_error_rate",
                                                         "dispersy_sync_bloom_filter_bits",
                                                         "dispersy_sync_response_limit",
+                                                        "dispersy_sync_response_rate",
+                                                        "dispersy_sync_upload_budget",
+                                                        "dispersy_sync_index_max_bytes",
+                                                        "dispersy_sync_bloom_filter_cache_size",
+                                                        "dispersy_sync_bloom_filter_cache_lifetime",
                                                         "dispersy_missing_sequence_response_limit",
                                                         "dispersy_enable_candidate_walker",
                                                         "dispersy_enable_candidate_walker_responses"))
@@ -58,6 +58,7 @@ CREATE TABLE sync(
  packet BLOB,
  UNIQUE(community, member, global_time));
 CREATE INDEX sync_meta_message_global_time_index ON sync(meta_message, global_time);
+CREATE INDEX sync_meta_message_undone_global_time_index ON sync(meta_message, undone, global_time);
 
 CREATE TABLE malicious_proof(
  id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -66,7 +67,7 @@ CREATE TABLE malicious_proof(
  packet BLOB);
 
 CREATE TABLE option(key TEXT PRIMARY KEY, value BLOB);
-INSERT INTO option(key, value) VALUES('database_version', '7');
+INSERT INTO option(key, value) VALUES('database_version', '8');
 """
 
 class DispersyDatabase(Database):
@@ -252,6 +253,13 @@ UPDATE option SET value = '7' WHERE key = 'database_version';
 
             # upgrade from version 7 to version 8
             if database_version < 8:
-                # there is no version 8 yet...
-                # self.executescript(u"""UPDATE option SET value = '8' WHERE key = 'database_version';""")
+                self.executescript(u"""
+CREATE INDEX sync_meta_message_undone_global_time_index ON sync(meta_message, undone, global_time);
+UPDATE option SET value = '8' WHERE key = 'database_version';
+""")
+
+            # upgrade from version 8 to version 9
+            if database_version < 9:
+                # there is no version 9 yet...
+                # self.executescript(u"""UPDATE option SET value = '9' WHERE key = 'database_version';""")
                 pass
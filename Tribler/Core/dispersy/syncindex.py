@@ -0,0 +1,317 @@
+"""
+The SyncIndex module keeps an in-memory copy of the syncable part of the sync table of a community.
+
+Every walker step the community claims a bloom filter: it selects a global time range containing
+roughly 'capacity' packets and adds these packets to the bloom filter.  Doing this with SQL queries
+requires several round trips, each reading packet blobs from the database.  The SyncIndex keeps the
+(global_time, sync.id) pairs of all syncable packets sorted in memory, allowing these ranges to be
+found using bisection.  The packets themselves are kept as well, as long as they fit within
+MAX_BYTES.
+
+The index must be kept up to date using add and remove.  When the sync table changes in a way that
+is not easily tracked (undo, malicious proof, community destruction) reset must be called, the
+index will then be reloaded when it is used the next time.
+
+The index also keeps the bloom filters that were recently claimed.  These can be claimed again
+until they expire, packets that are added to the index are added to the bloom filters that cover
+their global time.  Hence claiming a prepared bloom filter only costs the hashing of new packets.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+if __debug__:
+    from dprint import dprint
+
+class PreparedBloomFilter(object):
+    def __init__(self, time_low, time_high, bloom_filter, count, capacity, expires):
+        self.time_low = time_low
+        # zero indicates that the range ends at the current global time
+        self.time_high = time_high
+        self.bloom_filter = bloom_filter
+        self.count = count
+        self.capacity = capacity
+        self.expires = expires
+
+    def covers(self, global_time):
+        return self.time_low <= global_time and (self.time_high == 0 or global_time <= self.time_high)
+
+class SyncIndex(object):
+    def __init__(self, max_bytes):
+        assert isinstance(max_bytes, int)
+        assert max_bytes >= 0
+        self._max_bytes = max_bytes
+        self._meta_ids = None
+        self._bloom_filter_hits = 0
+        self._bloom_filter_misses = 0
+        self._reset()
+
+    def _reset(self):
+        self._loaded = False
+        # sorted by (global_time, id)
+        self._times = array("l")
+        self._ids = array("l")
+        # sync.id:packet pairs, or None when the packets do not fit in MAX_BYTES
+        self._packets = {}
+        self._packet_bytes = 0
+        # PreparedBloomFilter instances, the least recently claimed first
+        self._bloom_filters = []
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    @property
+    def has_packets(self):
+        """
+        True when all packets are available in memory.
+        """
+        return self._packets is not None
+
+    def __len__(self):
+        return len(self._times)
+
+    def load(self, database, meta_ids):
+        """
+        Load all packets for META_IDS, the database ids of the syncable meta messages, that are not
+        undone.
+        """
+        assert isinstance(meta_ids, (tuple, list, set))
+        self._reset()
+        self._meta_ids = set(meta_ids)
+        if self._meta_ids:
+            sql = u"SELECT id, global_time, packet FROM sync WHERE meta_message IN (%s) AND undone = 0 ORDER BY global_time, id" % u", ".join(u"?" for _ in self._meta_ids)
+            times = self._times
+            ids = self._ids
+            for id_, global_time, packet in database.execute(sql, tuple(self._meta_ids)):
+                times.append(global_time)
+                ids.append(id_)
+                if self._packets is not None:
+                    self._store_packet(id_, str(packet))
+        self._loaded = True
+        if __debug__: dprint("loaded ", len(self._times), " entries (", self._packet_bytes, " bytes in packets)")
+
+    def _store_packet(self, id_, packet):
+        if self._packet_bytes + len(packet) > self._max_bytes:
+            # from now on packets are obtained from the database
+            if __debug__: dprint("packets exceed ", self._max_bytes, " bytes, no longer keeping packets in memory")
+            self._packets = None
+            self._packet_bytes = 0
+        else:
+            self._packets[id_] = packet
+            self._packet_bytes += len(packet)
+
+    def reset(self):
+        """
+        Discard the index.  It will be loaded again on the next use.
+        """
+        self._reset()
+
+    def add(self, meta_id, global_time, id_, packet):
+        """
+        Called after a packet is added to the sync table.
+        """
+        if self._loaded and meta_id in self._meta_ids:
+            index = self._bisect(global_time, id_)
+            self._times.insert(index, global_time)
+            self._ids.insert(index, id_)
+            if self._packets is not None:
+                self._store_packet(id_, packet)
+
+            if self._bloom_filters:
+                for prepared in self._bloom_filters[:]:
+                    if prepared.covers(global_time):
+                        prepared.count += 1
+                        if prepared.count > prepared.capacity:
+                            # the error rate would exceed the one the bloom filter was made for
+                            self._bloom_filters.remove(prepared)
+                        else:
+                            prepared.bloom_filter.add(packet)
+
+    def remove(self, global_time, id_):
+        """
+        Called after a packet is removed from the sync table.
+        """
+        if self._loaded:
+            index = self._bisect(global_time, id_)
+            if index < len(self._ids) and self._ids[index] == id_ and self._times[index] == global_time:
+                del self._times[index]
+                del self._ids[index]
+                if self._packets is not None:
+                    self._packet_bytes -= len(self._packets.pop(id_))
+
+                # packets can not be removed from a bloom filter
+                if self._bloom_filters:
+                    self._bloom_filters = [prepared for prepared in self._bloom_filters if not prepared.covers(global_time)]
+
+    def _bisect(self, global_time, id_):
+        # the first index with (time, id) >= (global_time, id_)
+        times = self._times
+        ids = self._ids
+        index = bisect_left(times, global_time)
+        end = bisect_right(times, global_time, index)
+        while index < end and ids[index] < id_:
+            index += 1
+        return index
+
+    def count(self, time_low, time_high):
+        """
+        Returns the number of packets with TIME_LOW <= global_time <= TIME_HIGH.
+        """
+        return bisect_right(self._times, time_high) - bisect_left(self._times, time_low)
+
+    def select_times(self, global_time, to_select, higher=True):
+        """
+        Returns the global times of at most TO_SELECT packets with a global time higher (or lower
+        when HIGHER is False) than GLOBAL_TIME, nearest to GLOBAL_TIME first.
+        """
+        if higher:
+            index = bisect_right(self._times, global_time)
+            return self._times[index:index + to_select].tolist()
+        else:
+            index = bisect_left(self._times, global_time)
+            times = self._times[max(0, index - to_select):index].tolist()
+            times.reverse()
+            return times
+
+    def select_fixed(self, global_time, to_select, higher=True):
+        """
+        Returns (global_time, packet) tuples for at most TO_SELECT packets with a global time higher
+        (or lower when HIGHER is False) than GLOBAL_TIME.  When the last selected packet shares its
+        global time with packets that were not selected, these are included as well.  The tuples are
+        ordered by global time.
+
+        Returns None when the packets are not available in memory.
+        """
+        if self._packets is None:
+            return None
+        times = self._times
+        if higher:
+            begin = bisect_right(times, global_time)
+            end = min(len(times), begin + to_select)
+            if end > begin:
+                end = bisect_right(times, times[end - 1], end)
+        else:
+            end = bisect_left(times, global_time)
+            begin = max(0, end - to_select)
+            if end > begin:
+                begin = bisect_left(times, times[begin], 0, begin)
+        return self._slice(begin, end)
+
+    def select(self, time_low, time_high):
+        """
+        Returns (global_time, packet) tuples for all packets with TIME_LOW <= global_time <=
+        TIME_HIGH, ordered by global time.
+
+        Returns None when the packets are not available in memory.
+        """
+        if self._packets is None:
+            return None
+        return self._slice(bisect_left(self._times, time_low), bisect_right(self._times, time_high))
+
+    def claim_bloom_filter(self, now, cache_size):
+        """
+        Returns a PreparedBloomFilter that can be claimed again, or None when a new bloom filter
+        should be made.
+
+        Expired bloom filters are discarded.  While less than CACHE_SIZE bloom filters are
+        prepared None is returned, otherwise the least recently claimed one is returned.
+        """
+        if self._bloom_filters:
+            self._bloom_filters = [prepared for prepared in self._bloom_filters if prepared.expires > now]
+        if len(self._bloom_filters) < cache_size:
+            self._bloom_filter_misses += 1
+            return None
+        prepared = self._bloom_filters.pop(0)
+        self._bloom_filters.append(prepared)
+        self._bloom_filter_hits += 1
+        return prepared
+
+    def prepare_bloom_filter(self, time_low, time_high, bloom_filter, count, capacity, expires):
+        """
+        Keep BLOOM_FILTER, containing the COUNT packets between TIME_LOW and TIME_HIGH, to be
+        claimed again until EXPIRES.
+        """
+        assert count <= capacity
+        if self._loaded:
+            self._bloom_filters.append(PreparedBloomFilter(time_low, time_high, bloom_filter, count, capacity, expires))
+
+    def _slice(self, begin, end):
+        packets = self._packets
+        return zip(self._times[begin:end].tolist(), [packets[id_] for id_ in self._ids[begin:end]])
+
+    def info(self):
+        """
+        Returns a dictionary with the number of entries, the (approximate) memory used, and the
+        number of prepared bloom filters.
+        """
+        return {"loaded":self._loaded,
+                "entries":len(self._times),
+                "packets":self._packets is not None,
+                "bloom_filters":len(self._bloom_filters),
+                "bloom_filter_hits":self._bloom_filter_hits,
+                "bloom_filter_misses":self._bloom_filter_misses,
+                "bytes":self._times.itemsize * len(self._times) + self._ids.itemsize * len(self._ids) + self._packet_bytes}
+
+if __debug__:
+    if __name__ == "__main__":
+        class FakeDatabase(object):
+            def __init__(self, rows):
+                self.rows = rows
+            def execute(self, sql, bindings):
+                return iter(sorted(((id_, global_time, packet) for id_, global_time, packet, meta_id in self.rows if meta_id in bindings), key=lambda row: (row[1], row[0])))
+
+        rows = [(id_, global_time, "packet-%d" % id_, 1 + id_ % 3) for id_, global_time in enumerate([5, 1, 3, 3, 7, 9, 3, 12])]
+        index = SyncIndex(1024)
+        index.load(FakeDatabase(rows), [1, 2])
+        expected = sorted((global_time, id_) for id_, global_time, _, meta_id in rows if meta_id in (1, 2))
+        assert [(t, i) for t, i in zip(index._times, index._ids)] == expected, (index._times, index._ids)
+        assert index.select_times(3, 2) == [5, 7], index.select_times(3, 2)
+        assert index.select_times(7, 3, False) == [5, 3, 3], index.select_times(7, 3, False)
+        assert [t for t, _ in index.select_fixed(0, 2)] == [1, 3, 3], index.select_fixed(0, 2)
+        assert [t for t, _ in index.select_fixed(4, 1, False)] == [3, 3], index.select_fixed(4, 1, False)
+        assert index.count(3, 7) == index.select(3, 7).__len__()
+
+        index.add(1, 4, 100, "new")
+        index.add(3, 4, 101, "ignored")
+        assert (4, "new") in index.select(4, 4)
+        assert len(index.select(4, 4)) == 1
+        index.remove(4, 100)
+        assert index.select(4, 4) == []
+
+        from bloomfilter import BloomFilter
+        bloom = BloomFilter(128, 0.01)
+        assert index.claim_bloom_filter(10.0, 1) is None
+        index.prepare_bloom_filter(5, 0, bloom, 3, 4, 20.0)
+        assert index.claim_bloom_filter(15.0, 1).bloom_filter is bloom
+        index.add(1, 13, 102, "late")
+        assert "late" in bloom
+        index.add(1, 2, 103, "early")
+        assert not "early" in bloom
+        index.add(1, 14, 104, "full")
+        assert index.claim_bloom_filter(15.0, 1) is None
+        index.prepare_bloom_filter(5, 0, bloom, 3, 4, 20.0)
+        index.remove(14, 104)
+        assert index.claim_bloom_filter(15.0, 1) is None
+        index.prepare_bloom_filter(5, 0, bloom, 3, 4, 20.0)
+        assert index.claim_bloom_filter(20.0, 1) is None
+
+        # a claimed bloom filter is identical to one built from the packets it covers
+        index = SyncIndex(1024)
+        index.load(FakeDatabase(rows), [1, 2])
+        bloom = BloomFilter(128, 0.01, prefix="p")
+        bloom.add_keys(packet for _, packet in index.select(5, 20))
+        index.prepare_bloom_filter(5, 0, bloom, len(index.select(5, 20)), 10, 20.0)
+        index.add(1, 15, 200, "covered")
+        index.add(1, 4, 201, "before")
+        prepared = index.claim_bloom_filter(15.0, 1)
+        rebuilt = BloomFilter("\x00" * len(bloom.bytes), bloom.functions, prefix=bloom.prefix)
+        rebuilt.add_keys(packet for _, packet in index.select(prepared.time_low, 20))
+        assert rebuilt.bytes == prepared.bloom_filter.bytes
+
+        small = SyncIndex(10)
+        small.load(FakeDatabase(rows), [1, 2])
+        assert not small.has_packets
+        assert small.select(1, 10) is None
+        assert small.select_times(0, 100) == [t for t, _ in expected]
+        print index.info(), small.info()
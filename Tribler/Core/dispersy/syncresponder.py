@@ -0,0 +1,252 @@
+"""
+The SyncResponder module limits the bandwidth used to answer dispersy-introduction-request messages.
+
+Dispersy.check_sync selects the packets that a candidate is missing.  Instead of sending them all at
+once, they are queued here.  Each candidate has a token bucket that refills at
+community.dispersy_sync_response_rate bytes per second, and all candidates of a community share a
+token bucket that refills at community.dispersy_sync_upload_budget bytes per second.  The queues are
+drained from the Callback thread, highest priority packets first and taking turns between
+candidates when priorities are equal.
+"""
+
+from time import time
+
+if __debug__:
+    from dprint import dprint
+
+# seconds between two attempts to drain the queues
+SYNC_RESPONDER_INTERVAL = 0.1
+
+# queued packets that could not be sent within this many seconds are dropped
+SYNC_RESPONDER_TIMEOUT = 10.0
+
+class TokenBucket(object):
+    """
+    Allows RATE bytes per second with bursts of at most BURST bytes.
+
+    A packet may be sent while there are tokens left, even when it is larger than the remaining
+    tokens.  The bucket will then be negative for a while, hence packets larger than BURST are
+    not starved.
+    """
+    def __init__(self, rate, burst, now):
+        assert isinstance(rate, (int, long, float))
+        assert rate > 0
+        assert isinstance(burst, (int, long, float))
+        assert burst > 0
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._timestamp = now
+
+    def update(self, rate, burst):
+        self._rate = float(rate)
+        self._burst = float(burst)
+
+    def refill(self, now):
+        if now > self._timestamp:
+            self._tokens = min(self._burst, self._tokens + (now - self._timestamp) * self._rate)
+        self._timestamp = now
+
+    @property
+    def available(self):
+        return self._tokens > 0.0
+
+    @property
+    def full(self):
+        return self._tokens >= self._burst
+
+    def consume(self, byte_count):
+        self._tokens -= byte_count
+
+class SyncQueue(object):
+    def __init__(self, community, candidate, packets, bucket, now):
+        self.community = community
+        self.candidate = candidate
+        # list with (priority, packet) tuples, ordered by priority (high to low)
+        self.packets = packets
+        self.index = 0
+        self.bucket = bucket
+        self.timestamp = now
+        self.served = 0.0
+
+    @property
+    def head_priority(self):
+        return self.packets[self.index][0]
+
+    @property
+    def remaining(self):
+        return self.packets[self.index:]
+
+class SyncResponder(object):
+    def __init__(self, callback, send, statistics):
+        """
+        Packets are sent by calling SEND([candidate], packets, u"-sync-") on the thread of
+        CALLBACK.  The bytes sent and dropped are reported to STATISTICS.
+        """
+        self._callback = callback
+        self._send = send
+        self._statistics = statistics
+        # (community, sock_addr):SyncQueue pairs
+        self._queues = {}
+        # community:TokenBucket pairs.  kept until the bucket is full again, like the candidate
+        # buckets
+        self._community_buckets = {}
+        # (community, sock_addr):TokenBucket pairs.  kept after the queue is empty to ensure that
+        # a candidate can not reset its bucket by sending a new request
+        self._candidate_buckets = {}
+        self._running = False
+
+    def enqueue(self, community, candidate, packets):
+        """
+        Queue PACKETS, a list with (priority, packet) tuples ordered by priority, for CANDIDATE.
+
+        Packets still queued for CANDIDATE from an earlier request are dropped, the new request
+        contains a more recent bloom filter.  As many packets as the token buckets allow are sent
+        immediately.
+        """
+        assert isinstance(packets, list)
+        assert all(isinstance(priority, int) and isinstance(packet, str) for priority, packet in packets)
+        now = time()
+        key = (community, candidate.sock_addr)
+
+        queue = self._queues.pop(key, None)
+        if queue:
+            self._drop(queue, u"replaced")
+
+        if packets:
+            bucket = self._candidate_buckets.get(key)
+            if bucket is None:
+                bucket = self._candidate_buckets[key] = TokenBucket(community.dispersy_sync_response_rate, community.dispersy_sync_response_limit, now)
+            else:
+                bucket.update(community.dispersy_sync_response_rate, community.dispersy_sync_response_limit)
+            self._queues[key] = SyncQueue(community, candidate, packets, bucket, now)
+
+            self._process(now)
+            if self._pending() and not self._running:
+                self._running = True
+                self._callback.register(self._periodically_process)
+
+    def _drop(self, queue, reason):
+        packets = queue.remaining
+        if packets:
+            if __debug__: dprint("dropping ", len(packets), " queued sync packets for ", queue.candidate, " (", reason, ")")
+            self._statistics.sync_dropped(reason, sum(len(packet) for _, packet in packets), len(packets))
+
+    def _process(self, now):
+        community_buckets = {}
+        for queue in self._queues.itervalues():
+            queue.bucket.refill(now)
+            if not queue.community in community_buckets:
+                community = queue.community
+                bucket = self._community_buckets.get(community)
+                if bucket is None:
+                    bucket = self._community_buckets[community] = TokenBucket(community.dispersy_sync_upload_budget, community.dispersy_sync_upload_budget, now)
+                else:
+                    bucket.update(community.dispersy_sync_upload_budget, community.dispersy_sync_upload_budget)
+                bucket.refill(now)
+                community_buckets[community] = bucket
+
+        # queues that may still send something
+        active = [queue for queue in self._queues.itervalues() if queue.bucket.available and community_buckets[queue.community].available]
+        outgoing = {}
+        while active:
+            # one packet from each queue per round, the highest priority packets first and the
+            # queues that were served least recently first when the priorities are equal
+            active.sort(key=lambda queue: (-queue.head_priority, queue.served))
+            for queue in active:
+                community_bucket = community_buckets[queue.community]
+                if not (queue.bucket.available and community_bucket.available):
+                    continue
+                _, packet = queue.packets[queue.index]
+                queue.index += 1
+                queue.served = now
+                queue.bucket.consume(len(packet))
+                community_bucket.consume(len(packet))
+                outgoing.setdefault(queue, []).append(packet)
+            active = [queue for queue in active if queue.index < len(queue.packets) and queue.bucket.available and community_buckets[queue.community].available]
+
+        for queue, packets in outgoing.iteritems():
+            self._send([queue.candidate], packets, u"-sync-")
+            self._statistics.sync_sent(queue.candidate.sock_addr, sum(len(packet) for packet in packets), len(packets))
+
+        for key, queue in self._queues.items():
+            if queue.index == len(queue.packets):
+                del self._queues[key]
+            elif queue.timestamp + SYNC_RESPONDER_TIMEOUT < now:
+                self._drop(queue, u"timeout")
+                del self._queues[key]
+
+        # forget the buckets that are full again
+        for key, bucket in self._candidate_buckets.items():
+            if not key in self._queues:
+                bucket.refill(now)
+                if bucket.full:
+                    del self._candidate_buckets[key]
+
+        communities = set(queue.community for queue in self._queues.itervalues())
+        for community, bucket in self._community_buckets.items():
+            if not community in communities:
+                bucket.refill(now)
+                if bucket.full:
+                    del self._community_buckets[community]
+
+    def _pending(self):
+        """
+        Returns True while packets are queued or buckets are kept, both need _process to be
+        called periodically.
+        """
+        return bool(self._queues or self._candidate_buckets or self._community_buckets)
+
+    def _periodically_process(self):
+        try:
+            while self._pending():
+                yield SYNC_RESPONDER_INTERVAL
+                self._process(time())
+        finally:
+            self._running = False
+
+    def info(self):
+        """
+        Returns a dictionary with the number of candidates and the packets and bytes that are
+        currently queued.
+        """
+        queued = [queue.remaining for queue in self._queues.itervalues()]
+        return {"candidates":len(self._queues),
+                "packets":sum(len(packets) for packets in queued),
+                "bytes":sum(len(packet) for packets in queued for _, packet in packets)}
+
+if __debug__:
+    if __name__ == "__main__":
+        class Callback(object):
+            def register(self, call):
+                pass
+
+        class Statistics(object):
+            def sync_sent(self, sock_addr, byte_count, packet_count):
+                pass
+            def sync_dropped(self, reason, byte_count, packet_count):
+                pass
+
+        class Community(object):
+            dispersy_sync_response_rate = 1000
+            dispersy_sync_response_limit = 1000
+            dispersy_sync_upload_budget = 1000
+
+        class Candidate(object):
+            def __init__(self, sock_addr):
+                self.sock_addr = sock_addr
+
+        sent = []
+        responder = SyncResponder(Callback(), lambda candidates, packets, key: sent.extend(packets), Statistics())
+        communities = [Community() for _ in xrange(10)]
+        for community in communities:
+            responder.enqueue(community, Candidate(("127.0.0.1", 1)), [(128, "x" * 1500)])
+        assert len(sent) == 10
+        assert len(responder._community_buckets) == 10
+
+        # the buckets are forgotten once they are full again
+        responder._process(time() + 10.0)
+        assert not responder._pending()
+        assert responder._community_buckets == {} and responder._candidate_buckets == {}
+
+        print "SyncResponder tests passed"
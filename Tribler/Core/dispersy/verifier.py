@@ -0,0 +1,288 @@
+"""
+The verifier module verifies the signatures of incoming packets in parallel.
+
+Verifying an ECDSA signature is the most expensive step of decoding an incoming packet.  Before
+Dispersy converts a batch of packets into messages, the SignatureVerifier verifies the signatures
+of all packets in the batch that are signed by a single member, using a pool of worker processes
+when it is configured to use them and the batch is large enough.  The results are kept until the batch is converted, the conversion
+obtains them using get instead of verifying the signature itself.
+
+The same packet is often received many times, from several peers and when delayed packets are
+processed again.  The SignatureVerifier remembers the digests of recently stored packets, the
+signatures of these packets are not verified again.
+"""
+
+from hashlib import sha1
+
+from authentication import MemberAuthentication
+from crypto import ec_from_public_bin, ec_verify
+
+if __debug__:
+    from dprint import dprint
+
+# batches with fewer signatures are verified on the calling thread, sending them to the worker
+# processes costs more than it saves
+SIGNATURE_VERIFIER_MIN_BATCH = 16
+
+# the worker processes keep this many public keys in their EC cache
+SIGNATURE_VERIFIER_KEY_CACHE_SIZE = 1024
+
+# seconds to wait for the worker processes to verify a batch.  when they do not answer in time the
+# pool is terminated and all signatures are verified on the calling thread from then on
+SIGNATURE_VERIFIER_TIMEOUT = 30.0
+
+_key_cache = {}
+
+def _get_ec(public_key):
+    ec = _key_cache.get(public_key)
+    if ec is None:
+        if len(_key_cache) >= SIGNATURE_VERIFIER_KEY_CACHE_SIZE:
+            _key_cache.clear()
+        ec = _key_cache[public_key] = ec_from_public_bin(public_key)
+    return ec
+
+def _verify_signatures(jobs):
+    """
+    Returns a list with a boolean for each (public_key, digest, signature) tuple in JOBS.
+
+    This function is called in the worker processes, hence it may only use its arguments.
+    """
+    return [ec_verify(_get_ec(public_key), digest, signature) for public_key, digest, signature in jobs]
+
+class VerifiedPacketCache(object):
+    """
+    Remembers (member database id, packet digest) pairs for at most MAX_ENTRIES packets.
+
+    The entries are kept in two generations.  Lookups move an entry to the new generation, when
+    the new generation is full the old generation is discarded.  This approximates a least recently
+    used policy at a constant cost per operation.
+    """
+    def __init__(self, max_entries=20000):
+        assert isinstance(max_entries, int)
+        assert max_entries >= 2
+        self._max_generation = max_entries // 2
+        self._new = {}
+        self._old = {}
+
+    def __len__(self):
+        return len(self._new) + len(self._old)
+
+    def _add(self, key):
+        if len(self._new) >= self._max_generation:
+            self._old = self._new
+            self._new = {}
+        self._new[key] = True
+
+    def add(self, member_id, digest):
+        self._add((member_id, digest))
+
+    def contains(self, member_id, digest):
+        key = (member_id, digest)
+        if key in self._new:
+            return True
+        if key in self._old:
+            del self._old[key]
+            self._add(key)
+            return True
+        return False
+
+def get_default_processes():
+    """
+    Returns the number of worker processes to use: one less than the number of CPUs, with a maximum
+    of four.  Zero when the number of CPUs is unknown.
+    """
+    try:
+        from multiprocessing import cpu_count
+        return max(0, min(4, cpu_count() - 1))
+    except (ImportError, NotImplementedError):
+        return 0
+
+class SignatureVerifier(object):
+    def __init__(self, statistics, processes=0):
+        """
+        Verify signatures using PROCESSES worker processes.  When PROCESSES is zero all signatures
+        are verified on the calling thread.  When PROCESSES is None get_default_processes() is
+        used.
+
+        The worker processes are started by forking the calling process.  Frozen applications must
+        call multiprocessing.freeze_support() at the start of their main script before they use
+        worker processes.
+
+        The hits and misses of the verified packet cache are reported to STATISTICS.
+        """
+        assert processes is None or isinstance(processes, int)
+        assert processes is None or processes >= 0
+        self._statistics = statistics
+        self._processes = get_default_processes() if processes is None else processes
+        self._verified = VerifiedPacketCache()
+        # the pool is created when it is needed for the first time
+        self._pool = None
+        # (public_key, packet):bool pairs for the batch that is being converted
+        self._results = {}
+        self._batch_count = 0
+        self._parallel_count = 0
+        self._signature_count = 0
+
+    @property
+    def processes(self):
+        return self._processes
+
+    def _get_pool(self):
+        if self._pool is None and self._processes > 0:
+            try:
+                from multiprocessing import Pool
+                self._pool = Pool(self._processes)
+            except (ImportError, OSError):
+                if __debug__: dprint("unable to start ", self._processes, " worker processes, verifying signatures on the calling thread", exception=True, level="warning")
+                self._processes = 0
+        return self._pool
+
+    def verify_batch(self, meta, batch):
+        """
+        Verify the signatures in BATCH, a list with (candidate, packet, conversion) tuples that all
+        have META as their meta message.
+
+        Only messages that use MemberAuthentication with sha1 encoding are verified here, other
+        signatures are verified during conversion as before.  The results remain available until
+        clear is called.
+        """
+        if not (isinstance(meta.authentication, MemberAuthentication) and meta.authentication.encoding == "sha1"):
+            return
+
+        community = meta.community
+        keys = []
+        jobs = []
+        for _, packet, _ in batch:
+            # the member id follows the 22 byte prefix and the 1 byte message identifier
+            if len(packet) < 43:
+                continue
+            digest = sha1(packet).digest()
+            for member in community.get_members_from_id(packet[23:43]):
+                if self._verified.contains(member.database_id, digest):
+                    self._statistics.increment_verified_hits()
+                    self._results[(member.public_key, packet)] = True
+                    break
+                if member.public_key and member.has_identity(community):
+                    first_signature_offset = len(packet) - member.signature_length
+                    if first_signature_offset > 43:
+                        keys.append((member.public_key, packet))
+                        jobs.append((member.public_key, sha1(packet[:first_signature_offset]).digest(), packet[first_signature_offset:]))
+
+        if jobs:
+            self._statistics.increment_verified_misses(len(jobs))
+            self._results.update(zip(keys, self.verify(jobs)))
+
+    def verify(self, jobs):
+        """
+        Returns a list with a boolean for each (public_key, digest, signature) tuple in JOBS, in the
+        same order.
+        """
+        self._batch_count += 1
+        self._signature_count += len(jobs)
+        pool = self._get_pool() if len(jobs) >= SIGNATURE_VERIFIER_MIN_BATCH else None
+        if pool:
+            from multiprocessing import TimeoutError
+            self._parallel_count += 1
+            # one chunk per process, pool.map_async returns the results in order
+            size = (len(jobs) + self._processes - 1) // self._processes
+            try:
+                chunks = pool.map_async(_verify_signatures, [jobs[i:i+size] for i in xrange(0, len(jobs), size)]).get(SIGNATURE_VERIFIER_TIMEOUT)
+            except TimeoutError:
+                # a worker process died or hangs, the pool will never answer
+                if __debug__: dprint("worker processes did not answer within ", SIGNATURE_VERIFIER_TIMEOUT, " seconds, verifying signatures on the calling thread", level="warning")
+                self.close()
+                self._processes = 0
+            else:
+                results = []
+                for chunk in chunks:
+                    results.extend(chunk)
+                return results
+
+        return _verify_signatures(jobs)
+
+    def get(self, member, packet):
+        """
+        Returns True or False when the signature of MEMBER in PACKET was verified by verify_batch,
+        True when PACKET was verified and stored before, otherwise None.
+        """
+        result = self._results.get((member.public_key, packet))
+        if result is None:
+            if self._verified.contains(member.database_id, sha1(packet).digest()):
+                self._statistics.increment_verified_hits()
+                return True
+            self._statistics.increment_verified_misses()
+        return result
+
+    def stored(self, member, packet):
+        """
+        Called after PACKET, signed by MEMBER, was verified and stored.
+        """
+        self._verified.add(member.database_id, sha1(packet).digest())
+
+    def clear(self):
+        """
+        Forget the results of the last verify_batch call.
+        """
+        self._results.clear()
+
+    def close(self):
+        """
+        Stop the worker processes.  Signatures are verified on the calling thread when the
+        verifier is used afterwards.
+        """
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._processes = 0
+
+    def info(self):
+        """
+        Returns a dictionary with the number of processes, batches, and verified signatures.
+        """
+        return {"processes":self._processes,
+                "batches":self._batch_count,
+                "parallel_batches":self._parallel_count,
+                "signatures":self._signature_count,
+                "verified_packets":len(self._verified)}
+
+if __debug__:
+    if __name__ == "__main__":
+        from time import time
+        from crypto import ec_generate_key, ec_sign, ec_to_public_bin
+
+        cache = VerifiedPacketCache(4)
+        cache.add(1, "a")
+        cache.add(1, "b")
+        cache.add(1, "c")
+        assert cache.contains(1, "a") and cache.contains(1, "b") and cache.contains(1, "c")
+        assert not cache.contains(2, "a")
+        cache.add(1, "d")
+        cache.add(1, "e")
+        assert len(cache) <= 4
+        assert cache.contains(1, "e")
+
+        class Statistics(object):
+            def increment_verified_hits(self, amount=1):
+                pass
+            def increment_verified_misses(self, amount=1):
+                pass
+
+        ec = ec_generate_key(u"low")
+        public_key = ec_to_public_bin(ec)
+        jobs = []
+        for i in xrange(1000):
+            digest = sha1(str(i)).digest()
+            jobs.append((public_key, digest, ec_sign(ec, digest)))
+        jobs.append((public_key, sha1("invalid").digest(), jobs[0][2]))
+
+        for processes in (1, 2, 4, 8):
+            verifier = SignatureVerifier(Statistics(), processes if processes > 1 else 0)
+            # start the worker processes before measuring
+            verifier.verify(jobs[:SIGNATURE_VERIFIER_MIN_BATCH])
+            begin = time()
+            results = verifier.verify(jobs)
+            end = time()
+            assert results == [True] * 1000 + [False]
+            print "%d cores: %.0f messages/second" % (processes, len(jobs) / (end - begin))
+            verifier.close()
@@ -31,8 +31,8 @@ from Tribler.Core.dispersy.dispersy import Dispersy
 from Tribler.Core.dispersy.message import Message
 
 class BoosterDispersy(Dispersy):
-    def __init__(self, callback, statedir):
-        super(BoosterDispersy, self).__init__(callback, statedir)
+    def __init__(self, callback, statedir, verifier_processes=0):
+        super(BoosterDispersy, self).__init__(callback, statedir, verifier_processes)
 
         # logger
         session = Session.get_instance()
@@ -58,6 +58,7 @@ def main():
     command_line_parser.add_option("--port", action="store", type="int", help="Listen at this port")
     command_line_parser.add_option("--dispersy-port", action="store", type="int", help="Dispersy uses this UDL port", default=6421)
     command_line_parser.add_option("--nickname", action="store", type="string", help="The moderator name", default="Booster")
+    command_line_parser.add_option("--verifier-processes", action="store", type="int", help="Verify signatures in this many worker processes", default=0)
 
     # parse command-line arguments
     opt, args = command_line_parser.parse_args()
@@ -74,6 +75,7 @@ def main():
     if opt.port: sscfg.set_listen_port(opt.port)
     if opt.dispersy_port: sscfg.set_dispersy_port(opt.dispersy_port)
     if opt.nickname: sscfg.set_nickname(opt.nickname)
+    if opt.verifier_processes: sscfg.set_dispersy_verifier_processes(opt.verifier_processes)
 
     sscfg.set_megacache(True)
     sscfg.set_overlay(True)
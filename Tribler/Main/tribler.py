@@ -1167,4 +1167,11 @@ def run(params = None):
     #os._exit(0)
 
 if __name__ == '__main__':
+    # Dispersy may verify signatures in worker processes, in the frozen
+    # Windows build these start this executable again
+    try:
+        from multiprocessing import freeze_support
+        freeze_support()
+    except ImportError:
+        pass
     run()
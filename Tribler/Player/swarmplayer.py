@@ -684,5 +684,11 @@ def run_playerapp(appname,appversion,params = None):
 
 
 if __name__ == '__main__':
+    # worker processes of the frozen build start this executable again
+    try:
+        from multiprocessing import freeze_support
+        freeze_support()
+    except ImportError:
+        pass
     run_playerapp("SwarmPlayer","1.1.0")
 
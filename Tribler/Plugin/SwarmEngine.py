@@ -17,4 +17,10 @@ VIDEOHTTP_LISTENPORT = 6878
 
 
 if __name__ == '__main__':
+    # worker processes of the frozen build start this executable again
+    try:
+        from multiprocessing import freeze_support
+        freeze_support()
+    except ImportError:
+        pass
     run_bgapp("SwarmPlugin","1.1.0",I2I_LISTENPORT,BG_LISTENPORT,VIDEOHTTP_LISTENPORT,killonidle=False)
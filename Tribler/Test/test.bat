@@ -9,29 +9,39 @@ python test_TimedTaskQueue.py
 python test_bartercast.py
 python test_buddycast2_datahandler.py
 python test_cachingstream.py
+python test_category.py
 python test_closedswarm.py
 python test_connect_overlay.py singtest_connect_overlay
 python test_crawler.py
 python test_dialback_request.py
+python test_encrypter.py
 python test_extend_hs.py
 python test_friendship_crawler.py
 python test_g2g.py
+python test_hashchecker.py
 python test_gui_server.py
 python test_merkle.py
 python test_multicast.py
 python test_osutils.py
+python test_rawserver.py
 python test_permid.py
 python test_permid_response1.py
 python test_remote_query.py
 python test_seeding_stats.py
+python test_similarity.py
+python test_sockethandler.py
 python test_social_overlap.py
 python test_sqlitecachedb.py
 python test_status.py
+python test_storage_mmap.py
 python test_superpeers.py 
+python test_tracker_scraper.py
+python test_channel_search.py
 python test_url.py
 python test_url_metadata.py
 python test_ut_pex.py
 python test_video_server.py
+python test_writecache.py
 python test_threadpool.py
 python test_miscutils.py
 
@@ -135,7 +135,7 @@ class TestBuddyCastDataHandler(unittest.TestCase):
         
     def test_postInit(self):
         #self.data_handler.postInit()
-        self.data_handler.postInit(1,50,0, 50)
+        self.data_handler.postInit(1, 50)
         #from time import sleep
         
 class TestBuddyCast(unittest.TestCase):
@@ -0,0 +1,114 @@
+# see LICENSE.txt for license information
+
+import os
+import sys
+import unittest
+from random import Random
+from time import time
+
+from Tribler.Category.Category import Category
+
+DEBUG = True
+
+# Assume all test scripts are run from Tribler/Test
+INSTALL_DIR = os.path.join('..', '..')
+
+WORDS = ["divx", "xvid", "rmvb", "dvdrip", "season", "episode", "album", "live", "ubuntu", "linux", "cd1", "part", "r0", "sample", "readme", "cover"]
+SUFFIXES = ["avi", "mkv", "mp4", "flv", "mp3", "flac", "ogg", "pdf", "txt", "doc", "iso", "rar", "zip", "r01", "jpg", "png", "nfo", "exe", "platform", ""]
+
+class TestCategory(unittest.TestCase):
+    """ Classify torrents with the compiled category.conf rules """
+
+    def setUp(self):
+        self.category = Category.getInstance(INSTALL_DIR)
+        self.random = Random(42)
+
+    def random_name(self):
+        words = [self.random.choice(WORDS) for _ in xrange(self.random.randint(0, 3))]
+        name = self.random.choice([" ", ".", "_"]).join(words + ["file%d" % self.random.randint(0, 9)])
+        suffix = self.random.choice(SUFFIXES)
+        if suffix:
+            name += "." + suffix
+        if self.random.random() < 0.2:
+            name = name.upper()
+        return name
+
+    def random_torrent(self):
+        files_list = [(self.random_name(), self.random.choice([0.1, 3.0, 49.0, 50.0, 700.0, 4400.0])) for _ in xrange(self.random.randint(1, 30))]
+        display_name = self.random_name()
+        return files_list, display_name
+
+    def judge(self, files_list, display_name):
+        """ The category of a torrent using the uncompiled Category.judge """
+        torrent_category = ['other']
+        strongest_cat = 0.0
+        for category in self.category.category_info:
+            decision, strength = self.category.judge(category, files_list, display_name)
+            if decision and strength > strongest_cat:
+                torrent_category = [category['name']]
+                strongest_cat = strength
+        return torrent_category
+
+    def test_rules(self):
+        self.assert_(self.category.category_info)
+        self.assertEquals(self.category.calculateCategoryNonDict([("movie.avi", 700.0)], "movie", None, None), ["Video"])
+        self.assertEquals(self.category.calculateCategoryNonDict([("clip.flv", 10.0)], "clip", None, None), ["VideoClips"])
+        self.assertEquals(self.category.calculateCategoryNonDict([("track%d.mp3" % i, 5.0) for i in xrange(10)] + [("cover.jpg", 0.1)], "album", None, None), ["Audio"])
+        # keywords in the display name decide without looking at the files
+        self.assertEquals(self.category.calculateCategoryNonDict([("readme.txt", 0.1)], "movie.XviD", None, None), ["Video"])
+        self.assertEquals(self.category.calculateCategoryNonDict([("setup.exe", 10.0)], "setup", None, None), ["other"])
+
+    def test_same_as_judge(self):
+        for _ in xrange(2000):
+            files_list, display_name = self.random_torrent()
+            self.assertEquals(self.category.calculateCategoryNonDict(files_list, display_name, None, None), self.judge(files_list, display_name), (files_list, display_name))
+
+    def test_calculate_categories(self):
+        torrents = []
+        expected = []
+        for i in xrange(200):
+            files_list, display_name = self.random_torrent()
+            if i % 2:
+                torrent_dict = {'info': {'name': display_name, 'files': [{'path': ['dir', name], 'length': int(size * 1024 * 1024)} for name, size in files_list]}}
+            else:
+                torrent_dict = {'info': {'name': files_list[0][0], 'length': int(files_list[0][1] * 1024 * 1024)}, 'announce': 'http://tracker.example.org/announce'}
+            torrents.append((torrent_dict, display_name))
+            expected.append(self.category.calculateCategory(torrent_dict, display_name))
+        self.assertEquals(self.category.calculateCategories(torrents), expected)
+        self.assertEquals(self.category.calculateCategories([]), [])
+
+    def test_calculate_categories_malformed(self):
+        """ A malformed torrent is 'other' and does not affect the rest of the batch """
+        movie = ({'info': {'name': 'movie.avi', 'length': 700 * 1024 * 1024}}, "movie")
+        torrents = [movie, ({'info': None}, "broken"), ({}, "empty"), movie]
+        self.assertEquals(self.category.calculateCategories(torrents), [["Video"], ["other"], ["other"], ["Video"]])
+
+    def test_benchmark_calculate_categories(self):
+        """ Measure the number of torrents with 200 files classified per second """
+        torrents = []
+        for _ in xrange(100):
+            files_list = [(self.random_name(), self.random.choice([0.1, 3.0, 49.0, 700.0])) for _ in xrange(200)]
+            torrents.append(({'info': {'name': 'torrent', 'files': [{'path': [name], 'length': int(size * 1024 * 1024)} for name, size in files_list]}}, self.random_name()))
+
+        begin = time()
+        self.category.calculateCategories(torrents)
+        took = time() - begin
+
+        # the same rules without the compiled tables
+        begin = time()
+        for torrent_dict, display_name in torrents:
+            files_list = [(f['path'][-1], f['length'] / 1048576.0) for f in torrent_dict['info']['files']]
+            self.judge(files_list, display_name)
+        judge_took = time() - begin
+
+        if DEBUG:
+            print >>sys.stderr, "test: classified %d torrents in %.2f seconds (%.0f torrents/second), judging each category took %.2f seconds" % \
+                  (len(torrents), took, len(torrents) / took, judge_took)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCategory))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
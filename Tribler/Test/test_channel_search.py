@@ -0,0 +1,99 @@
+# see LICENSE.txt for license information
+
+import sys
+import unittest
+import time
+
+from Tribler.Test.test_as_server import TestAsServer
+from Tribler.Core.API import *
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
+
+DEBUG = True
+
+NR_CHANNELS = 10000
+NR_TORRENTS_PER_CHANNEL = 5
+TOPICS = [u"music", u"movies", u"ubuntu", u"games"]
+
+class TestChannelSearch(TestAsServer):
+    """ Search channels and their torrents through the ChannelFullTextIndex """
+
+    def setUpPostSession(self):
+        """ override TestAsServer """
+        TestAsServer.setUpPostSession(self)
+
+        self.channelcast_db = self.session.open_dbhandler(NTFY_CHANNELCAST)
+        # dispersy is not running, none of the channels are ours
+        self.channelcast_db.my_dispersy_cid = "my cid"
+        db = self.channelcast_db._db
+
+        # channel i is named "channel i <topic>" and has NR_TORRENTS_PER_CHANNEL
+        # torrents, torrent j has j % 13 seeders
+        channels = [(i, buffer("cid%d" % i), u"channel %d %s" % (i, TOPICS[i % len(TOPICS)]), NR_TORRENTS_PER_CHANNEL) for i in xrange(1, NR_CHANNELS + 1)]
+        db.executemany(u"INSERT INTO _Channels (id, dispersy_cid, name, nr_torrents) VALUES (?, ?, ?, ?)", channels, commit = False)
+        db.execute_write(u"INSERT INTO ChannelFullTextIndex (rowid, name) SELECT id, name FROM _Channels", commit = False)
+
+        torrents = [(j, bin2str("%020d" % j), u"torrent %d" % j, j % 13) for j in xrange(1, NR_CHANNELS * NR_TORRENTS_PER_CHANNEL + 1)]
+        db.executemany(u"INSERT INTO Torrent (torrent_id, infohash, name, num_seeders) VALUES (?, ?, ?, ?)", torrents, commit = False)
+        channeltorrents = [(j, (j - 1) / NR_TORRENTS_PER_CHANNEL + 1, j) for j in xrange(1, NR_CHANNELS * NR_TORRENTS_PER_CHANNEL + 1)]
+        db.executemany(u"INSERT INTO _ChannelTorrents (torrent_id, channel_id, time_stamp) VALUES (?, ?, ?)", channeltorrents, commit = True)
+
+    def test_search_channels(self):
+        self.channelcast_db.on_channel_from_dispersy("linux cid", None, u"Linux distributions", u"")
+        channels = self.channelcast_db.searchChannels([u"linux"])
+        self.assertEquals(len(channels), 1)
+        channel_id = channels[0][0]
+        self.assertEquals(channels[0][2], u"Linux distributions")
+
+        # keywords match the start of a word
+        self.assertEquals([channel[0] for channel in self.channelcast_db.searchChannels([u"distrib"])], [channel_id])
+        self.assertEquals(self.channelcast_db.searchChannels([u"inux"]), [])
+
+        # a renamed channel is found by its new name only
+        self.channelcast_db.on_channel_modification_from_dispersy(channel_id, 'name', u"Renamed")
+        self.assertEquals(self.channelcast_db.searchChannels([u"linux"]), [])
+        self.assertEquals([channel[0] for channel in self.channelcast_db.searchChannels([u"renamed"])], [channel_id])
+
+        self.assertEquals(len(self.channelcast_db.searchChannels([u"channel", u"music"])), NR_CHANNELS / len(TOPICS))
+        self.assertEquals(self.channelcast_db.searchChannels([]), [])
+
+    def test_search_channels_torrent(self):
+        results = self.channelcast_db.searchChannelsTorrent(u"ubuntu", 5, 3)
+        self.assertEquals(len(results), 5 * 3)
+
+        channel_ids = set(result[0] for result in results)
+        self.assertEquals(len(channel_ids), 5)
+        for channel_id in channel_ids:
+            torrents = [result for result in results if result[0] == channel_id]
+            self.assertEquals(len(torrents), 3)
+            channel_id, dispersy_cid, name, infohash, torrent_name, time_stamp = torrents[0]
+            self.assertEquals(dispersy_cid, "cid%d" % channel_id)
+            self.assertEquals(name, u"channel %d ubuntu" % channel_id)
+            self.assertEquals(infohash, str2bin(bin2str("%020d" % time_stamp)))
+            self.assertEquals(torrent_name, u"torrent %d" % time_stamp)
+
+            # the torrents with the most seeders come first
+            seeders = [result[5] % 13 for result in torrents]
+            self.assertEquals(seeders, sorted(seeders, reverse = True))
+
+        self.assertEquals(self.channelcast_db.searchChannelsTorrent(u"a"), [])
+        self.assertEquals(self.channelcast_db.searchChannelsTorrent(u"unknown"), [])
+
+    def test_benchmark_search_channels_torrent(self):
+        """ Measure the number of remote channel search requests answered per second """
+        nr_requests = 1000
+        begin = time.time()
+        for i in xrange(nr_requests):
+            results = self.channelcast_db.searchChannelsTorrent(u"%s %d" % (TOPICS[i % len(TOPICS)], i % 100 + 1), 10, 20)
+            self.assert_(results)
+        took = time.time() - begin
+        if DEBUG:
+            print >>sys.stderr, "test: answered %d channel searches over %d channels in %.2f seconds (%.0f requests/second)" % \
+                  (nr_requests, NR_CHANNELS, took, nr_requests / took)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestChannelSearch))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -0,0 +1,127 @@
+# see LICENSE.txt for license information
+
+import sys
+import unittest
+from time import time
+
+from Tribler.Core.BitTornado.BT1.Encrypter import Connection
+from Tribler.Core.BitTornado.BT1.MessageID import protocol_name, option_pattern, PIECE, HAVE
+from Tribler.Core.BitTornado.BT1.convert import tobinary
+
+DEBUG = True
+
+DOWNLOAD_ID = "D" * 20
+PEER_ID = "P" * 20
+
+class FakeSingleSocket:
+    def __init__(self):
+        self.written = []
+    def write(self, s):
+        self.written.append(s)
+    def close(self):
+        pass
+    def get_ip(self, real=False):
+        return "127.0.0.1"
+    def get_port(self, real=False):
+        return 6881
+
+class FakeRawServer:
+    def add_task(self, func, delay = 0, id = None):
+        pass
+
+class FakeConnecter:
+    """ Stands in for Connecter, only collects the messages """
+    def __init__(self):
+        self.messages = []
+        self.external_connection_made = 0
+    def connection_made(self, connection):
+        return self
+    def send_keepalive(self):
+        pass
+    def got_message(self, connection, message):
+        self.messages.append(message)
+    def connection_lost(self, connection):
+        pass
+
+class FakeEncoder:
+    def __init__(self):
+        self.connecter = FakeConnecter()
+        self.raw_server = FakeRawServer()
+        self.download_id = DOWNLOAD_ID
+        self.my_id = "M" * 20
+        self.max_len = 2 ** 17
+        self.connections = {}
+        self.repexer = None
+        self.measured = 0
+    def measurefunc(self, length):
+        self.measured += length
+    def got_id(self, connection):
+        return True
+
+def handshake():
+    return chr(len(protocol_name)) + protocol_name + option_pattern + DOWNLOAD_ID + PEER_ID
+
+def make_messages(count, piece_length = 2 ** 14):
+    block = "x" * piece_length
+    messages = []
+    for i in xrange(count):
+        if i % 4 == 3:
+            messages.append(HAVE + tobinary(i))
+        elif i % 4 == 2:
+            messages.append("")
+        else:
+            messages.append(PIECE + tobinary(i) + tobinary(0) + block)
+    return messages
+
+def make_stream(messages):
+    return "".join([tobinary(len(m)) + m for m in messages])
+
+def feed(stream, chunk_size):
+    encoder = FakeEncoder()
+    connection = Connection(encoder, FakeSingleSocket(), None, locally_initiated = False)
+    for index in xrange(0, len(stream), chunk_size):
+        connection.data_came_in(connection.connection, stream[index:index + chunk_size])
+    return encoder, connection
+
+class TestEncrypterFraming(unittest.TestCase):
+
+    def test_handshake(self):
+        encoder, connection = feed(handshake(), 1)
+        self.assert_(connection.complete)
+        self.assertEquals(connection.id, PEER_ID)
+        self.assertEquals(encoder.measured, len(handshake()))
+
+    def test_chunkings(self):
+        messages = make_messages(20, 100)
+        stream = handshake() + make_stream(messages)
+        for chunk_size in (1, 3, 4, 7, 68, 104, 1000, len(stream)):
+            encoder, connection = feed(stream, chunk_size)
+            # keepalives are not passed on
+            self.assertEquals(encoder.connecter.messages, [m for m in messages if m], chunk_size)
+            self.assertEquals(connection.buffer, [])
+
+    def test_too_long(self):
+        stream = handshake() + tobinary(2 ** 17 + 1) + "x" * 10
+        encoder, connection = feed(stream, len(stream))
+        self.assert_(connection.closed)
+        self.assertEquals(encoder.connecter.messages, [])
+
+    def test_benchmark_framing(self):
+        """ Measure the throughput of the wire framing for several read sizes """
+        messages = make_messages(2000)
+        stream = handshake() + make_stream(messages)
+        for chunk_size in (1460, 16 * 1024, 100000, 1024 * 1024):
+            begin = time()
+            encoder, connection = feed(stream, chunk_size)
+            took = time() - begin
+            self.assertEquals(len(encoder.connecter.messages), 1500)
+            if DEBUG:
+                print >>sys.stderr, "test: read size %7d: %.1f MB/s" % (chunk_size, len(stream) / max(took, 1e-6) / 1024 / 1024)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestEncrypterFraming))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -0,0 +1,103 @@
+# see LICENSE.txt for license information
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from threading import Event
+from time import time
+
+from Tribler.Core.defaults import dldefaults
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.StorageWrapper import StorageWrapper
+
+DEBUG = True
+
+PIECE_SIZE = 2 ** 18
+
+class TestHashCheck(unittest.TestCase):
+    """ Check the existing data of a download with and without the
+    HashChecker threads """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        shutil.rmtree(self.dir)
+
+    def create_files(self, sizes, corrupt = ()):
+        files = []
+        data = []
+        for i, size in enumerate(sizes):
+            name = os.path.join(self.dir, "file%d" % i)
+            content = os.urandom(size)
+            f = open(name, "wb")
+            f.write(content)
+            f.close()
+            files.append((name, size))
+            data.append(content)
+        data = "".join(data)
+        hashes = [sha(data[i:i + PIECE_SIZE]).digest() for i in xrange(0, len(data), PIECE_SIZE)]
+        for piece in corrupt:
+            hashes[piece] = "x" * 20
+        return files, hashes
+
+    def check(self, files, hashes, threads):
+        config = dldefaults.copy()
+        config['hashcheck_threads'] = threads
+        self.finished = 0
+        self.failure = None
+        storage = Storage(files, PIECE_SIZE, Event(), config)
+        self.storages.append(storage)
+        wrapper = StorageWrapper({'live': False}, storage, 2 ** 14, hashes, PIECE_SIZE, None,
+                                 self.finished_callback, self.failed_callback,
+                                 backfunc = lambda func, delay = 0, id = None: None, config = config)
+        self.assert_(wrapper.old_style_init())
+        self.assertEquals(self.failure, None)
+        return wrapper
+
+    def finished_callback(self):
+        self.finished += 1
+
+    def failed_callback(self, msg):
+        self.failure = msg
+
+    def test_complete(self):
+        files, hashes = self.create_files([PIECE_SIZE * 5 + 100, PIECE_SIZE * 3])
+        for threads in (0, 1, 4):
+            wrapper = self.check(files, hashes, threads)
+            self.assertEquals(wrapper.get_amount_left(), 0)
+            self.assert_(wrapper.have.complete())
+            self.assertEquals(self.finished, 1)
+
+    def test_corrupt(self):
+        files, hashes = self.create_files([PIECE_SIZE * 10 + 7], corrupt = (2, 10))
+        for threads in (0, 3):
+            wrapper = self.check(files, hashes, threads)
+            self.assertEquals([wrapper.have[i] for i in xrange(len(hashes))],
+                              [i not in (2, 10) for i in xrange(len(hashes))])
+            self.assertEquals(self.finished, 0)
+
+    def test_benchmark_hashcheck(self):
+        """ Measure the hashcheck rate with several numbers of threads """
+        files, hashes = self.create_files([PIECE_SIZE * 256])
+        for threads in (0, 1, 2, 4):
+            begin = time()
+            wrapper = self.check(files, hashes, threads)
+            took = time() - begin
+            self.assert_(wrapper.have.complete())
+            if DEBUG:
+                print >>sys.stderr, "test: %d hashcheck threads: %.1f MB/s" % (threads, PIECE_SIZE * 256 / max(took, 1e-6) / 1048576)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestHashCheck))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -0,0 +1,96 @@
+# see LICENSE.txt for license information
+
+import sys
+import unittest
+from threading import Event, Thread
+from time import time, sleep
+
+from Tribler.Core.BitTornado.RawServer import RawServer
+
+DEBUG = True
+
+class TestRawServerTasks(unittest.TestCase):
+    """ Test the task scheduler of the RawServer """
+
+    def setUp(self):
+        self.doneflag = Event()
+        self.rawserver = RawServer(self.doneflag, 60.0, 300.0, ipv6_enable = False)
+        self.called = []
+
+    def tearDown(self):
+        self.doneflag.set()
+        self.rawserver.add_task(lambda: None)
+        self.rawserver.shutdown()
+
+    def start(self):
+        thread = Thread(target = self.rawserver.listen_forever, args = (None,))
+        thread.setDaemon(True)
+        thread.start()
+
+    def task(self, name):
+        return lambda: self.called.append(name)
+
+    def test_order(self):
+        self.rawserver.add_task(self.task("c"), 0.3)
+        self.rawserver.add_task(self.task("a"), 0.1)
+        self.rawserver.add_task(self.task("b"), 0.2)
+        for name in ("d", "e", "f"):
+            self.rawserver.add_task(self.task(name), 0.4)
+        self.start()
+        sleep(1)
+        self.assertEquals(self.called, ["a", "b", "c", "d", "e", "f"])
+
+    def test_kill_tasks(self):
+        self.rawserver.add_task(self.task("a"), 0.1, "keep")
+        self.rawserver.add_task(self.task("b"), 0.2, "kill")
+        self.rawserver.add_task(self.task("c"), 0.3, "kill")
+        self.rawserver.add_task(self.task("d"), 0.4)
+        self.rawserver.kill_tasks("kill")
+        self.start()
+        sleep(1)
+        self.assertEquals(self.called, ["a", "d"])
+        self.assertEquals(self.rawserver.funcs_ids, {})
+
+    def test_kill_unknown_id(self):
+        self.rawserver.add_task(self.task("a"), 0.1, "keep")
+        self.rawserver.kill_tasks("unknown")
+        self.start()
+        sleep(0.5)
+        self.assertEquals(self.called, ["a"])
+
+    def test_benchmark_tasks(self):
+        """ Measure add/dispatch/kill throughput with many pending tasks """
+        rawserver = self.rawserver
+        func = lambda: None
+        for count in (10000, 50000):
+            begin = time()
+            for i in xrange(count):
+                rawserver._add_task(func, (i * 7919) % count / 1000.0, i % 100)
+            add = time() - begin
+
+            begin = time()
+            for i in xrange(0, 100, 2):
+                rawserver.kill_tasks(i)
+            rawserver._kill_tasks()
+            kill = time() - begin
+
+            begin = time()
+            dispatched = 0
+            while rawserver.funcs:
+                func_, id = rawserver._pop_task()
+                if func_ is not None:
+                    dispatched += 1
+            dispatch = time() - begin
+
+            self.assertEquals(dispatched, count / 2)
+            if DEBUG:
+                print >>sys.stderr, "test: %d tasks: add %.0f/s kill %.4fs dispatch %.0f/s" % \
+                    (count, count / max(add, 1e-6), kill, count / max(dispatch, 1e-6))
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRawServerTasks))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -0,0 +1,142 @@
+# see LICENSE.txt for license information
+
+import sys
+import unittest
+from random import Random
+from time import time
+
+from Tribler.Core.BuddyCast.similarity import P2PSim_Full, PreferenceMatrix
+from Tribler.Core.BuddyCast.buddycast import DataHandler, PEER_SIM_POS
+
+DEBUG = False
+
+def create_preferences(num_peers, num_torrents, max_prefs, seed=0):
+    rand = Random(seed)
+    preferences = []
+    num_prefs = []
+    for peer_id in xrange(1, num_peers + 1):
+        torrent_ids = rand.sample(xrange(1, num_torrents + 1), rand.randint(1, max_prefs))
+        torrent_ids.sort()
+        preferences.extend((peer_id, torrent_id) for torrent_id in torrent_ids)
+        num_prefs.append((peer_id, len(torrent_ids)))
+    return preferences, num_prefs
+
+def overlap_rows(preferences, num_prefs, not_peer_id, myprefs):
+    # what getPeersWithOverlap returns
+    num_prefs = dict(num_prefs)
+    overlap = {}
+    for peer_id, torrent_id in preferences:
+        if torrent_id in myprefs and peer_id != not_peer_id and peer_id in num_prefs:
+            overlap[peer_id] = overlap.get(peer_id, 0) + 1
+    return [(peer_id, num_prefs[peer_id], count) for peer_id, count in overlap.iteritems()]
+
+class TestPreferenceMatrix(unittest.TestCase):
+    """ Compare the PreferenceMatrix with the per peer computation of
+    SimilarityDBHandler.getPeersWithOverlap and P2PSim_Full """
+
+    def test_matrix(self):
+        preferences = [(1, 10), (1, 11), (2, 11), (3, 12), (3, 10), (4, 10)]
+        # peer 4 is not in the Peer table
+        matrix = PreferenceMatrix(preferences, [(1, 2), (2, 1), (3, 2)])
+        self.assertEquals(len(matrix), 5)
+        self.assertEquals(list(matrix.peer_ids), [1, 2, 3])
+        self.assertEquals(list(matrix.indptr), [0, 2, 3, 5])
+        self.assertEquals(list(matrix.columns[10]), [0, 2])
+
+    def test_similarities(self):
+        preferences, num_prefs = create_preferences(500, 200, 60)
+        myprefs = range(1, 200, 7)
+        matrix = PreferenceMatrix(preferences, num_prefs)
+        expected = P2PSim_Full(overlap_rows(preferences, num_prefs, 5, myprefs), len(myprefs))
+        similarities = matrix.getPeerSimilarities(myprefs, 5)
+        self.assertEquals(sorted(similarities.keys()), sorted(expected.keys()))
+        for peer_id, sim in expected.iteritems():
+            self.assertAlmostEquals(similarities[peer_id], sim)
+        self.assertEquals(matrix.getPeerSimilarities([]), {})
+
+    def test_relevances(self):
+        preferences = [(1, 10), (1, 11), (2, 11), (3, 12)]
+        matrix = PreferenceMatrix(preferences, [(1, 2), (2, 1), (3, 1)])
+        relevances = matrix.getTorrentRelevances({1: 2.0, 2: 4.0, 3: 0.0})
+        self.assertEquals(relevances, {10: 2.0 + 1, 11: 3.0 + 2})
+
+    def test_benchmark(self):
+        preferences, num_prefs = create_preferences(2000, 1000, 50)
+        myprefs = range(1, 1000, 20)
+        begin = time()
+        matrix = PreferenceMatrix(preferences, num_prefs)
+        built = time()
+        similarities = matrix.getPeerSimilarities(myprefs)
+        relevances = matrix.getTorrentRelevances(similarities)
+        end = time()
+        self.assertEquals(len(similarities), len(overlap_rows(preferences, num_prefs, None, myprefs)))
+        self.assert_(relevances)
+        if DEBUG:
+            print >>sys.stderr, "test: %d preferences: build %.2fs, similarity and relevance %.2fs (%d peers, %d torrents)" % \
+                  (len(matrix), built - begin, end - built, len(similarities), len(relevances))
+
+class FakeSimilarityDB:
+    def __init__(self, preferences, num_prefs):
+        self.preferences = preferences
+        self.num_prefs = num_prefs
+        self.overlap_queries = 0
+
+    def getPeersWithOverlap(self, not_peer_id, myprefs):
+        self.overlap_queries += 1
+        return overlap_rows(self.preferences, self.num_prefs, not_peer_id, myprefs)
+
+    def getAllPreferences(self):
+        return iter(self.preferences)
+
+    def getAllNumPrefs(self):
+        return self.num_prefs
+
+class FakeOverlayBridge:
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, task, delay=0, id=None):
+        self.tasks.append(id)
+
+class FakeDataHandler(DataHandler):
+    def __init__(self, simi_db, num_prefs, myprefs):
+        # peer 5 is me
+        self.permid = 5
+        self.myprefs = myprefs
+        self.peers = dict((peer_id, [0, 0, None, None]) for peer_id, _ in num_prefs)
+        self.simi_db = simi_db
+        self.overlay_bridge = FakeOverlayBridge()
+        self.cached_updates = {'peer':{}, 'torrent':{}}
+
+class TestDataHandlerSimilarity(unittest.TestCase):
+    """ A change of my preferences updates the peer similarities through the
+    overlap query, with the same result as the full pass """
+
+    def test_update_my_pref_sim(self):
+        preferences, num_prefs = create_preferences(300, 100, 30)
+        myprefs = range(1, 100, 9)
+        data_handler = FakeDataHandler(FakeSimilarityDB(preferences, num_prefs), num_prefs, myprefs)
+
+        self.assert_(data_handler.updateMyPrefSim() > 0)
+        self.assertEquals(data_handler.simi_db.overlap_queries, 1)
+        self.assertEquals(data_handler.cached_updates['torrent'], {})
+        self.assertEquals(data_handler.overlay_bridge.tasks, ['writeSimUpdates'])
+
+        expected = PreferenceMatrix(preferences, num_prefs).getPeerSimilarities(myprefs, 5)
+        for peer_id, peer in data_handler.peers.iteritems():
+            self.assertAlmostEquals(peer[PEER_SIM_POS], expected.get(peer_id, 0))
+
+        # peers that no longer share a torrent with me are reset
+        data_handler.myprefs = []
+        data_handler.updateMyPrefSim()
+        self.assertEquals([peer[PEER_SIM_POS] for peer in data_handler.peers.itervalues() if peer[PEER_SIM_POS]], [])
+        self.assertEquals(data_handler.simi_db.overlap_queries, 1)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPreferenceMatrix))
+    suite.addTest(unittest.makeSuite(TestDataHandlerSimilarity))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -0,0 +1,118 @@
+# see LICENSE.txt for license information
+
+import sys
+import socket
+import unittest
+from time import time
+
+from Tribler.Core.BitTornado.SocketHandler import SocketHandler, POLLERS, POLLIN, POLLOUT, default_poller
+
+DEBUG = True
+
+# select() can not handle file descriptors above FD_SETSIZE
+SELECT_MAX_SOCKETS = 500
+
+class TestPollers(unittest.TestCase):
+    """ Test that every poll backend behaves like select.poll """
+
+    def setUp(self):
+        self.pairs = []
+
+    def tearDown(self):
+        for a, b in self.pairs:
+            a.close()
+            b.close()
+
+    def make_pairs(self, count):
+        for _ in xrange(count):
+            a, b = socket.socketpair()
+            a.setblocking(0)
+            b.setblocking(0)
+            self.pairs.append((a, b))
+        return self.pairs
+
+    def test_default(self):
+        if sys.platform.startswith("linux"):
+            self.assertEquals(default_poller(), "epoll")
+        self.assert_(default_poller() in POLLERS)
+
+    def test_events(self):
+        for name, (poll_class, timemult) in POLLERS.items():
+            self.pairs = []
+            a, b = self.make_pairs(1)[0]
+            p = poll_class()
+            p.register(a, POLLIN)
+            self.assertEquals(p.poll(0), [])
+
+            b.send("x")
+            events = p.poll(1 * timemult)
+            self.assertEquals(len(events), 1, name)
+            self.assertEquals(events[0][0], a.fileno(), name)
+            self.assert_(events[0][1] & POLLIN, name)
+
+            # registering again changes the mask
+            a.recv(1)
+            p.register(a, POLLIN | POLLOUT)
+            events = p.poll(1 * timemult)
+            self.assert_(events and events[0][1] & POLLOUT, name)
+
+            p.unregister(a)
+            self.assertEquals(p.poll(0), [])
+            a.close()
+            b.close()
+
+    def test_sockethandler(self):
+        for name in POLLERS:
+            handler = SocketHandler(300.0, False, poller = name)
+            a, b = self.make_pairs(1)[0]
+            handler.poll.register(a, POLLIN)
+            b.send("x")
+            events = handler.do_poll(1.0)
+            self.assertEquals([fd for fd, event in events], [a.fileno()], name)
+
+    def test_benchmark_idle_sockets(self):
+        """ Measure the cost of polling many idle sockets and one active one """
+        iterations = 200
+        try:
+            import resource
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if hard != resource.RLIM_INFINITY and soft < hard:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            max_fds = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        except (ImportError, ValueError):
+            max_fds = 1024
+        for count in (SELECT_MAX_SOCKETS, 1000, 5000, 10000):
+            self.tearDown()
+            if 0 <= max_fds < count * 2 + 100:
+                if DEBUG:
+                    print >>sys.stderr, "test: %5d sockets: skipped, too few file descriptors" % count
+                continue
+            self.pairs = []
+            pairs = self.make_pairs(count)
+            active_a, active_b = pairs[-1]
+            active_b.send("x")
+            for name, (poll_class, timemult) in sorted(POLLERS.items()):
+                if name == "select" and count > SELECT_MAX_SOCKETS:
+                    if DEBUG:
+                        print >>sys.stderr, "test: %5d sockets %6s: skipped, above FD_SETSIZE" % (count, name)
+                    continue
+                p = poll_class()
+                for a, b in pairs:
+                    p.register(a, POLLIN)
+                begin = time()
+                for _ in xrange(iterations):
+                    events = p.poll(0)
+                took = time() - begin
+                self.assertEquals(len(events), 1)
+                if hasattr(p, "close"):
+                    p.close()
+                if DEBUG:
+                    print >>sys.stderr, "test: %5d sockets %6s: %.1f us/poll" % (count, name, took / iterations * 1000000)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPollers))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
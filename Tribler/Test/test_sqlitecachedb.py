@@ -10,7 +10,7 @@ from random import shuffle
 import apsw
 
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DEFAULT_BUSY_TIMEOUT,CURRENT_MAIN_DB_VERSION
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, IdCache, DEFAULT_BUSY_TIMEOUT,CURRENT_MAIN_DB_VERSION
 from bak_tribler_sdb import *    
 
 CREATE_SQL_FILE = os.path.join('..',"schema_sdb_v"+str(CURRENT_MAIN_DB_VERSION)+".sql")
@@ -498,6 +498,29 @@ class TestSqliteCacheDB(unittest.TestCase):
         db.insertPeer(permid, update=True, **peer_x)
         assert db.getOne('Peer', 'port', peer_id=1) == 456
         
+    def test_peer_id_cache(self):
+        db = SQLiteCacheDB.getInstance()
+        db.createDBTable("create table Peer(peer_id integer PRIMARY KEY, permid text NOT NULL, name text);", self.db_path)
+        permids = ['fake_permid_%d' % i for i in range(10)]
+        for permid in permids:
+            db.insertPeer(permid, name=permid)
+        
+        peer_ids = db.getPeerIDS(permids + ['unknown_permid'])
+        assert peer_ids[:-1] == range(1, 11), peer_ids
+        assert peer_ids[-1] is None
+        stats = db.getIdCacheStats()['peer']
+        assert stats['size'] == 10, stats
+        
+        # served from the cache
+        assert db.getPeerID(permids[3]) == 4
+        assert db.getIdCacheStats()['peer']['hits'] == stats['hits'] + 1
+        
+        db.deletePeer(permids[3])
+        assert db.getPeerID(permids[3]) is None
+        db.deletePeer(peer_id=5)
+        assert db.getPeerID(permids[4]) is None
+        assert db.getPeerIDS(permids[5:7]) == [6, 7]
+        
 class TestThreadedSqliteCacheDB(unittest.TestCase):
     def setUp(self):
         self.db_path = 'tmp.db'
@@ -828,10 +851,208 @@ class TestThreadedSqliteCacheDB(unittest.TestCase):
         assert total_rlock == 0 and total_wlock == 0, (total_rlock, total_wlock)
         assert len(all) > 0, len(all)
         
+class TestIdCache(unittest.TestCase):
+    def test_lookup(self):
+        cache = IdCache(10)
+        cache.add('a', 1)
+        assert cache.get_id('a') == 1
+        assert cache.get_key(1) == 'a'
+        assert cache.get_id('b') is None
+        assert cache.get_key(2) is None
+        stats = cache.get_stats()
+        assert stats['hits'] == 2 and stats['misses'] == 2, stats
+        assert stats['hit_rate'] == 0.5
+        
+    def test_remove(self):
+        cache = IdCache(10)
+        cache.add('a', 1)
+        cache.add('b', 2)
+        cache.remove(id=1)
+        assert not 'a' in cache
+        cache.remove('b')
+        assert cache.get_key(2) is None
+        # the id of a deleted row is reused
+        cache.add('c', 3)
+        cache.add('d', 3)
+        assert cache.get_key(3) == 'd'
+        assert cache.get_id('c') is None
+        
+    def test_bounded(self):
+        cache = IdCache(10)
+        for i in range(100):
+            cache.add(str(i), i)
+            # keep using the first pair
+            assert cache.get_id('0') == 0
+        assert len(cache) <= 10, len(cache)
+        assert cache.get_id('99') == 99
+        assert cache.get_id('50') is None
+        
+class TestDatabaseWriter(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'tmp.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        create_sql = "create table person(lastname, firstname);"
+        tmp_sql_path = 'tmp.sql'
+        f = open(tmp_sql_path, 'w')
+        f.write(create_sql)
+        f.close()
+        db = SQLiteCacheDB.getInstance()
+        db.initDB(self.db_path, tmp_sql_path, check_version=False)
+        os.remove(tmp_sql_path)
+        db.start_writer()
+        
+    def tearDown(self):
+        db = SQLiteCacheDB.getInstance()
+        db.close(clean=True)
+        for path in (self.db_path, self.db_path + '-wal', self.db_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+                
+    def test_wal_mode(self):
+        db = SQLiteCacheDB.getInstance()
+        assert db.fetchone("PRAGMA journal_mode").lower() == 'wal'
+        
+    def test_concurrent_writers(self):
+        db = SQLiteCacheDB.getInstance()
+        errors = []
+        def write_data(name):
+            try:
+                for i in range(100):
+                    db.insert('person', lastname=name, firstname=str(i))
+                    # a thread reads its own writes
+                    assert db.size('person') >= i + 1
+                db.close()
+            except Exception, msg:
+                print_exc()
+                errors.append(msg)
+                
+        threads = [Thread(target=write_data, args=('writer%d' % i,)) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == [], errors
+        assert db.size('person') == 500, db.size('person')
+        
+    def test_read_only_connections(self):
+        db = SQLiteCacheDB.getInstance()
+        result = []
+        def write_directly():
+            try:
+                db._execute("INSERT INTO person VALUES ('a', 'b')")
+            except Exception, msg:
+                result.append(msg)
+            db.close()
+        t = Thread(target=write_directly)
+        t.start()
+        t.join()
+        assert len(result) == 1
+        assert db.size('person') == 0
+        
+    def test_async(self):
+        db = SQLiteCacheDB.getInstance()
+        called = []
+        future = db.executemany_async("INSERT INTO person VALUES (?, ?)", [(str(i), 'b') for i in range(10)],
+                                      callback=lambda future: called.append(future))
+        future.result()
+        assert future.done()
+        assert called == [future]
+        assert db.size('person') == 10
+        
+        future = db.execute_write_async("INSERT INTO no_such_table VALUES (?)", ('a',))
+        self.assertRaises(Exception, future.result)
+        assert db.size('person') == 10
+        
+    def test_execute_insert(self):
+        db = SQLiteCacheDB.getInstance()
+        result = []
+        def insert():
+            # the rowid is the one of the row this thread inserted, not of
+            # its own read-only connection
+            for i in range(10):
+                rowid = db.execute_insert("INSERT INTO person VALUES (?, ?)", ('insert', str(i)))
+                result.append((rowid, db.fetchone("SELECT firstname FROM person WHERE rowid = ?", (rowid,))))
+            db.close()
+        db.execute_write("INSERT INTO person VALUES ('a', 'b')")
+        t = Thread(target=insert)
+        t.start()
+        t.join()
+        assert result == [(i + 2, str(i)) for i in range(10)], result
+        
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'tmp.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        create_sql = "create table person(lastname, firstname);"
+        tmp_sql_path = 'tmp.sql'
+        f = open(tmp_sql_path, 'w')
+        f.write(create_sql)
+        f.close()
+        db = SQLiteCacheDB.getInstance()
+        db.initDB(self.db_path, tmp_sql_path, check_version=False)
+        os.remove(tmp_sql_path)
+        self.max_batched = Tribler.Core.CacheDB.sqlitecachedb.MAX_SQL_BATCHED_TO_TRANSACTION
+        
+    def tearDown(self):
+        Tribler.Core.CacheDB.sqlitecachedb.MAX_SQL_BATCHED_TO_TRANSACTION = self.max_batched
+        db = SQLiteCacheDB.getInstance()
+        db.close(clean=True)
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+            
+    def test_group_statements(self):
+        db = SQLiteCacheDB.getInstance()
+        insert = "INSERT INTO person VALUES (?, ?)"
+        update = "UPDATE person SET firstname = ? WHERE lastname = ?"
+        sql_queue = [(insert, ('a', '1')), (insert + '  ', ('b', '2')),
+                     ("DELETE FROM person WHERE lastname = 'c'", None), ('  ', None),
+                     (insert, ('c', '3')), (update, ('4', 'a')), (insert, ('d', '5'))]
+        groups = db._group_statements(sql_queue)
+        assert groups == [(insert, [('a', '1'), ('b', '2')]),
+                          ("DELETE FROM person WHERE lastname = 'c'", None),
+                          (insert, [('c', '3')]),
+                          (update, [('4', 'a')]),
+                          (insert, [('d', '5')])], groups
+        
+        db._transaction(groups)
+        result = db.fetchall("SELECT lastname, firstname FROM person ORDER BY lastname")
+        assert result == [('a', '4'), ('b', '2'), ('c', '3'), ('d', '5')], result
+        
+    def test_requeue_after_failure(self):
+        Tribler.Core.CacheDB.sqlitecachedb.MAX_SQL_BATCHED_TO_TRANSACTION = 3
+        db = SQLiteCacheDB.getInstance()
+        failed = []
+        def commit_retry_if_busy_or_rollback(e, tries, sql=None):
+            failed.append(sql)
+            SQLiteCacheDB.commit_retry_if_busy_or_rollback(db, e, tries, sql)
+        db.commit_retry_if_busy_or_rollback = commit_retry_if_busy_or_rollback
+        
+        insert = "INSERT INTO person VALUES (?, ?)"
+        # the second batch fails on its last statement
+        for i in range(5):
+            db.execute_write(insert, ('a', str(i)), commit=False)
+        db.execute_write("INSERT INTO no_such_table VALUES ('b')", commit=False)
+        for i in range(3):
+            db.execute_write(insert, ('c', str(i)), commit=False)
+        self.assertRaises(Exception, db.commit)
+        del db.commit_retry_if_busy_or_rollback
+        
+        # the failing statement is reported, the first batch is committed,
+        # the second is rolled back and the third is cached again
+        assert failed == ["INSERT INTO no_such_table VALUES ('b')"], failed
+        assert db.fetchall("SELECT firstname FROM person ORDER BY firstname") == [('0',), ('1',), ('2',)]
+        db.commit()
+        assert db.fetchall("SELECT lastname, firstname FROM person WHERE lastname = 'c' ORDER BY firstname") == [('c', '0'), ('c', '1'), ('c', '2')]
+        
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestSqliteCacheDB))
     suite.addTest(unittest.makeSuite(TestThreadedSqliteCacheDB))
+    suite.addTest(unittest.makeSuite(TestIdCache))
+    suite.addTest(unittest.makeSuite(TestDatabaseWriter))
+    suite.addTest(unittest.makeSuite(TestTransaction))
     suite.addTest(unittest.makeSuite(TestSQLitePerformance))
     
     return suite
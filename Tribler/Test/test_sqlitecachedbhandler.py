@@ -4,6 +4,7 @@ import unittest
 from traceback import print_exc
 from time import time
 from binascii import unhexlify
+from Tribler.Core.Utilities.Crypto import sha
 from shutil import copy as copyFile, move
 
 
@@ -1164,6 +1165,47 @@ class TestTorrentDBHandler(unittest.TestCase):
         assert old_res - res == 20
         init()
         
+    def singtest_benchmark_addTorrents(self):
+        copyFile(S_TORRENT_PATH_BACKUP, S_TORRENT_PATH)
+        db = TorrentDBHandler.getInstance()
+        tdef = TorrentDef.load(S_TORRENT_PATH)
+        old_size = db.size()
+        old_tracker_size = db._db.size('TorrentTracker')
+        
+        num_torrents = 1000
+        start = time()
+        for i in xrange(num_torrents):
+            # the same torrent under a different infohash
+            tdef.infohash = sha('benchmark %d' % i).digest()
+            db.addExternalTorrent(tdef, extra_info={'filename':S_TORRENT_PATH}, commit=False)
+        db.commit()
+        took = time() - start
+        print >>sys.stderr, "TestTorrentDBHandler: ingested %d torrents in %.2f seconds (%.0f torrents/second)" % (num_torrents, took, num_torrents / took)
+        
+        assert db.size() == old_size + num_torrents, db.size() - old_size
+        assert db._db.size('TorrentTracker') == old_tracker_size + num_torrents
+        init()
+
+    def singtest_updateTorrentChecks(self):
+        db = TorrentDBHandler.getInstance()
+        sql = "SELECT infohash, retried_times FROM Torrent T, TorrentTracker TT WHERE T.torrent_id = TT.torrent_id AND announce_tier = 1 LIMIT 2"
+        (infohash_str1, _), (infohash_str2, retried_times2) = db._db.fetchall(sql)
+        infohash1 = str2bin(infohash_str1)
+        infohash2 = str2bin(infohash_str2)
+        unknown = sha('unknown torrent').digest()
+
+        db.updateTorrentChecks([(infohash1, 10, 20, 'good', 1234, 0, 3),
+                                (infohash2, -2, -2, 'dead', 1235, 2, None),
+                                (unknown, 1, 1, 'good', 1236, 0, None)])
+
+        sql = "SELECT num_seeders, num_leechers, status_id, last_check, ignored_times, retried_times FROM Torrent T, TorrentTracker TT WHERE T.torrent_id = TT.torrent_id AND announce_tier = 1 AND infohash = ?"
+        res = db._db.fetchone(sql, (infohash_str1,))
+        assert res == (10, 20, db.status_table['good'], 1234, 0, 3), res
+        res = db._db.fetchone(sql, (infohash_str2,))
+        assert res == (-2, -2, db.status_table['dead'], 1235, 2, retried_times2), res
+        assert not db.hasTorrent(unknown)
+        init()
+
         
 class TestMyPreferenceDBHandler(unittest.TestCase):
     
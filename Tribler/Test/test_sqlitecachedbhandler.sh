@@ -47,6 +47,8 @@ python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_loadTorrents
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_add_update_delete_Torrent
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_getCollectedTorrentHashes
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_freeSpace
+python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_benchmark_addTorrents
+python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_updateTorrentChecks
 
 python test_sqlitecachedbhandler.py TestMyPreferenceDBHandler singtest_getPrefList
 python test_sqlitecachedbhandler.py TestMyPreferenceDBHandler singtest_getCreationTime
@@ -193,6 +193,118 @@ class StatusTest(unittest.TestCase):
 
         status.remove_event(event)
 
+    def testCounter(self):
+
+        status = Status.get_status_holder("UnitTest")
+        status.reset()
+        reporter = TestOnChangeStatusReporter("On change")
+        status.add_reporter(reporter)
+
+        counter = status.get_counter("TestCounter")
+        self.assertEquals(counter, status.get_counter("TestCounter"))
+        i = status.get_status_element("TestCounter")
+        self.assertEquals(i.get_value(), 0)
+
+        # Increments are not reported until the counter is flushed
+        for x in range(0, 10):
+            counter.inc(x)
+        counter.dec()
+        self.assertEquals(i.get_value(), 0)
+        self.assertEquals(reporter.value, None)
+        self.assertEquals(counter.get_value(), 44)
+
+        status.flush_counters()
+        self.assertEquals(i.get_value(), 44)
+        self.assertEquals(reporter.value, 44)
+
+        # Reporters fetching the elements see the counted values
+        counter.inc(6)
+        self.assertEquals(status.get_elements()[0].get_value(), 50)
+
+        # Clean up
+        status.remove_status_element(i)
+
+    def testCounterThreads(self):
+
+        status = Status.get_status_holder("UnitTest")
+        status.reset()
+        counter = status.get_counter("TestCounter", 100)
+
+        def count():
+            for x in xrange(10000):
+                counter.inc()
+
+        threads = [threading.Thread(target=count) for x in range(0, 4)]
+        for t in threads:
+            t.start()
+        # Flushing while the threads are counting must not lose any
+        while [t for t in threads if t.isAlive()]:
+            status.flush_counters()
+        for t in threads:
+            t.join()
+        status.flush_counters()
+
+        self.assertEquals(status.get_status_element("TestCounter").get_value(), 40100)
+        self.assertEquals(counter.get_value(), 40100)
+
+        # Clean up
+        status.remove_status_element(status.get_status_element("TestCounter"))
+
+    def testCounterFlushThread(self):
+
+        status = Status.get_status_holder("UnitTest")
+        status.reset()
+        interval = Status.COUNTER_FLUSH_INTERVAL
+        Status.COUNTER_FLUSH_INTERVAL = 0.1
+        try:
+            counter = status.get_counter("TestCounter")
+            status.get_counter("OtherCounter")
+            flush_thread = status.flush_thread
+            self.assertNotEqual(flush_thread, None)
+
+            # The counters are flushed periodically by a single thread
+            counter.inc(5)
+            time.sleep(0.5)
+            self.assertEquals(status.get_status_element("TestCounter").get_value(), 5)
+            self.assertEquals(status.flush_thread, flush_thread)
+            names = [t.getName() for t in threading.enumerate()]
+            self.assertEquals(names.count("StatusHolderFlush_UnitTest"), 1)
+
+            # Reset stops the thread
+            status.reset()
+            self.assertEquals(status.flush_thread, None)
+            flush_thread.join(1.0)
+            self.failIf(flush_thread.isAlive())
+        finally:
+            Status.COUNTER_FLUSH_INTERVAL = interval
+
+    def testCounterDeadThreads(self):
+
+        status = Status.get_status_holder("UnitTest")
+        status.reset()
+        counter = status.get_counter("TestCounter")
+
+        def count():
+            counter.inc(3)
+
+        for x in range(0, 10):
+            t = threading.Thread(target=count)
+            t.start()
+            t.join()
+        counter.inc(1)
+        self.assertEquals(len(counter.cells), 11)
+
+        # Cells of stopped threads are dropped once they are flushed
+        status.flush_counters()
+        self.assertEquals(len(counter.cells), 1)
+        self.assertEquals(counter.get_value(), 31)
+        counter.inc(1)
+        status.flush_counters()
+        self.assertEquals(status.get_status_element("TestCounter").get_value(), 32)
+
+        # Clean up
+        status.reset()
+
 class TestLivingLabPeriodicReporter(LivingLabReporter.LivingLabPeriodicReporter):
 
     def __init__(self, name, report_time):
@@ -0,0 +1,113 @@
+# see LICENSE.txt for license information
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from threading import Event
+from time import clock
+
+from Tribler.Core.defaults import dldefaults
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.piecebuffer import MMapBuffer
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.StorageWrapper import StorageWrapper
+
+DEBUG = True
+
+PIECE_SIZE = 2 ** 18
+BLOCK_SIZE = 2 ** 14
+
+class TestStorageMMap(unittest.TestCase):
+    """ Compare memory-mapped reads with normal Storage reads """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        shutil.rmtree(self.dir)
+
+    def create_wrapper(self, sizes, mmap_reads):
+        files = []
+        data = []
+        for i, size in enumerate(sizes):
+            name = os.path.join(self.dir, "file%d" % i)
+            if not os.path.exists(name):
+                f = open(name, "wb")
+                f.write(os.urandom(size))
+                f.close()
+            files.append((name, size))
+            data.append(open(name, "rb").read())
+        data = "".join(data)
+        hashes = [sha(data[i:i + PIECE_SIZE]).digest() for i in xrange(0, len(data), PIECE_SIZE)]
+
+        config = dldefaults.copy()
+        config['mmap_reads'] = mmap_reads
+        storage = Storage(files, PIECE_SIZE, Event(), config)
+        self.storages.append(storage)
+        wrapper = StorageWrapper({'live': False}, storage, BLOCK_SIZE, hashes, PIECE_SIZE, None,
+                                 lambda: None, self.fail,
+                                 backfunc = lambda func, delay = 0, id = None: None, config = config)
+        self.assert_(wrapper.old_style_init())
+        return wrapper, data
+
+    def test_views(self):
+        # the second piece spans both files
+        wrapper, data = self.create_wrapper([PIECE_SIZE + 1000, PIECE_SIZE * 2], True)
+        for index in xrange(3):
+            view, hashlist = wrapper.get_piece_view(index, 0, -1)
+            self.assert_(isinstance(view, MMapBuffer))
+            self.assertEquals(view.tostring(), data[index * PIECE_SIZE:(index + 1) * PIECE_SIZE])
+            for begin in (0, 990, 1000, PIECE_SIZE - BLOCK_SIZE):
+                piece = view[begin:begin + BLOCK_SIZE]
+                self.assertEquals(len(piece), BLOCK_SIZE)
+                self.assertEquals(piece.tostring(), data[index * PIECE_SIZE + begin:index * PIECE_SIZE + begin + BLOCK_SIZE])
+            view.release()
+        self.assertEquals(wrapper.get_piece_view(0, PIECE_SIZE - 10, 20), [None, []])
+
+    def test_fallback(self):
+        wrapper, data = self.create_wrapper([PIECE_SIZE * 2], False)
+        view, hashlist = wrapper.get_piece_view(1, 0, -1)
+        self.failIf(isinstance(view, MMapBuffer))
+        self.assertEquals(view[:].tostring(), data[PIECE_SIZE:])
+
+        # files that are open for writing are not mapped
+        wrapper, data = self.create_wrapper([PIECE_SIZE * 2], True)
+        wrapper.storage.write(0, data[:10])
+        view, hashlist = wrapper.get_piece_view(1, 0, -1)
+        self.failIf(isinstance(view, MMapBuffer))
+        wrapper.storage.sync()
+        view, hashlist = wrapper.get_piece_view(1, 0, -1)
+        self.assert_(isinstance(view, MMapBuffer))
+
+    def test_benchmark_upload(self):
+        """ Measure the CPU time per GB of uploaded blocks, read the way
+        Uploader.get_upload_chunk and Connecter.send_partial do """
+        numpieces = 64
+        rounds = 32
+        for mmap_reads in (False, True):
+            wrapper, data = self.create_wrapper([PIECE_SIZE * numpieces], mmap_reads)
+            begin = clock()
+            total = 0
+            for _ in xrange(rounds):
+                for index in xrange(numpieces):
+                    piecebuf, hashlist = wrapper.get_piece_view(index, 0, -1)
+                    assert isinstance(piecebuf, MMapBuffer) == bool(mmap_reads)
+                    for offset in xrange(0, PIECE_SIZE, BLOCK_SIZE):
+                        total += len(piecebuf[offset:offset + BLOCK_SIZE].tostring())
+                    piecebuf.release()
+            took = clock() - begin
+            if DEBUG:
+                print >>sys.stderr, "test: mmap_reads %d: %.2f CPU seconds per GB" % (mmap_reads, took * 1024 ** 3 / total)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestStorageMMap))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
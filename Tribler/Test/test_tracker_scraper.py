@@ -0,0 +1,166 @@
+# see LICENSE.txt for license information
+
+import os
+import sys
+import socket
+import shutil
+import tempfile
+import unittest
+from select import select
+from struct import pack, unpack
+from threading import Event, Thread
+from time import time
+
+from Tribler.Core.defaults import trackerdefaults
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.RawServer import RawServer
+from Tribler.Core.BitTornado.HTTPHandler import HTTPHandler
+from Tribler.Core.BitTornado.BT1.track import Tracker
+from Tribler.TrackerChecking.TrackerScraper import TrackerScraper, MAX_INFOHASHES_PER_SCRAPE, \
+     UDP_PROTOCOL_ID, UDP_ACTION_CONNECT, UDP_ACTION_SCRAPE
+
+DEBUG = True
+
+class UDPTrackerFrontend(Thread):
+    """ Answers BEP 15 connect and scrape requests using the scrape data of a
+    BitTornado tracker """
+    def __init__(self, tracker):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.tracker = tracker
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.connection_id = 0x1234567890
+        self.doneflag = Event()
+        self.received = 0
+
+    def run(self):
+        while not self.doneflag.isSet():
+            if not select([self.sock], [], [], 0.1)[0]:
+                continue
+            data, address = self.sock.recvfrom(65536)
+            self.received += 1
+            connection_id, action, transaction_id = unpack("!QII", data[:16])
+            if action == UDP_ACTION_CONNECT and connection_id == UDP_PROTOCOL_ID:
+                self.sock.sendto(pack("!IIQ", UDP_ACTION_CONNECT, transaction_id, self.connection_id), address)
+            elif action == UDP_ACTION_SCRAPE and connection_id == self.connection_id:
+                response = [pack("!II", UDP_ACTION_SCRAPE, transaction_id)]
+                for i in xrange(16, len(data), 20):
+                    infohash = data[i:i + 20]
+                    if infohash in self.tracker.downloads:
+                        f = self.tracker.scrapedata(infohash, False)
+                        response.append(pack("!III", f['complete'], f['downloaded'], f['incomplete']))
+                    else:
+                        response.append(pack("!III", 0, 0, 0))
+                self.sock.sendto("".join(response), address)
+
+    def shutdown(self):
+        self.doneflag.set()
+        self.join()
+        self.sock.close()
+
+class TestTrackerScraper(unittest.TestCase):
+    """ Scrape a local BitTornado tracker over HTTP and UDP """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        config = trackerdefaults.copy()
+        config['tracker_dfile'] = os.path.join(self.dir, 'tracker.state')
+        self.doneflag = Event()
+        self.rawserver = RawServer(self.doneflag, 60.0, 300.0, ipv6_enable = False)
+        self.tracker = Tracker(config, self.rawserver)
+
+        self.rawserver.bind(0, ['127.0.0.1'], reuse = True, ipv6_socket_style = 0)
+        self.http_port = self.rawserver.sockethandler.servers.values()[0].getsockname()[1]
+        thread = Thread(target = self.rawserver.listen_forever, args = (HTTPHandler(self.tracker.get, 60),))
+        thread.setDaemon(True)
+        thread.start()
+
+        self.udp = UDPTrackerFrontend(self.tracker)
+        self.udp.start()
+
+        self.http_url = "http://127.0.0.1:%d/announce" % self.http_port
+        self.udp_url = "udp://127.0.0.1:%d" % self.udp.port
+
+        # infohash i has i % 7 seeders and i % 5 leechers
+        self.infohashes = [sha("scrape %d" % i).digest() for i in xrange(200)]
+        for i, infohash in enumerate(self.infohashes):
+            peers = {}
+            for j in xrange(i % 7 + i % 5):
+                peers["peer%d" % j] = {'ip': '10.0.0.1', 'port': 1000 + j, 'left': j >= i % 7 and 1 or 0}
+            self.tracker.downloads[infohash] = peers
+            self.tracker.seedcount[infohash] = i % 7
+            self.tracker.completed[infohash] = i
+
+    def tearDown(self):
+        self.udp.shutdown()
+        self.doneflag.set()
+        self.rawserver.add_task(lambda: None)
+        self.rawserver.shutdown()
+        shutil.rmtree(self.dir)
+
+    def expected(self, infohashes):
+        return dict((infohash, (self.infohashes.index(infohash) % 7, self.infohashes.index(infohash) % 5)) for infohash in infohashes)
+
+    def test_http_scrape(self):
+        unknown = sha("unknown").digest()
+        results = TrackerScraper().scrape({self.http_url: self.infohashes[:10] + [unknown]})
+        self.assertEquals(results.keys(), [self.http_url])
+        # the tracker leaves out infohashes it does not know
+        self.assertEquals(results[self.http_url], self.expected(self.infohashes[:10]))
+
+    def test_udp_scrape(self):
+        unknown = sha("unknown").digest()
+        results = TrackerScraper().scrape({self.udp_url: self.infohashes[:10] + [unknown]})
+        expected = self.expected(self.infohashes[:10])
+        expected[unknown] = (0, 0)
+        self.assertEquals(results, {self.udp_url: expected})
+
+    def test_batches(self):
+        scraper = TrackerScraper(max_connections = 3)
+        results = scraper.scrape({self.http_url: self.infohashes, self.udp_url: self.infohashes})
+        expected = self.expected(self.infohashes)
+        self.assertEquals(results, {self.http_url: expected, self.udp_url: expected})
+        scrapes = 2 * ((len(self.infohashes) + MAX_INFOHASHES_PER_SCRAPE - 1) / MAX_INFOHASHES_PER_SCRAPE)
+        self.assertEquals(scraper.get_stats(), {'scrapes': scrapes, 'failed': 0, 'infohashes': 2 * len(self.infohashes)})
+
+    def test_unreachable(self):
+        # nothing is listening on these ports
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        http_url = "http://127.0.0.1:%d/announce" % port
+        udp_url = "udp://127.0.0.1:%d/announce" % port
+        unsupported_url = "https://127.0.0.1:%d/announce" % port
+
+        scraper = TrackerScraper(timeout = 2)
+        begin = time()
+        results = scraper.scrape({http_url: self.infohashes[:2], udp_url: self.infohashes[:2], unsupported_url: self.infohashes[:2], self.http_url: self.infohashes[:2]})
+        self.assert_(time() - begin < 3, time() - begin)
+        failed = dict((infohash, (-1, -1)) for infohash in self.infohashes[:2])
+        self.assertEquals(results, {http_url: failed, udp_url: failed, self.http_url: self.expected(self.infohashes[:2])})
+        self.assertEquals(scraper.get_stats()['failed'], 2)
+
+    def test_benchmark_scrape(self):
+        """ Measure the number of infohashes scraped per second """
+        scraper = TrackerScraper()
+        # the tracker does not know most of these
+        infohashes = self.infohashes + [sha("benchmark %d" % i).digest() for i in xrange(5000)]
+        begin = time()
+        results = scraper.scrape({self.http_url: infohashes, self.udp_url: infohashes})
+        took = time() - begin
+        self.assertEquals(len(results[self.udp_url]), len(infohashes))
+        self.assertEquals(scraper.get_stats()['failed'], 0)
+        if DEBUG:
+            print >>sys.stderr, "test: scraped %d infohashes in %.2f seconds (%.0f infohashes/second)" % \
+                  (scraper.get_stats()['infohashes'], took, scraper.get_stats()['infohashes'] / took)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTrackerScraper))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
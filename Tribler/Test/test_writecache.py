@@ -0,0 +1,219 @@
+# see LICENSE.txt for license information
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from threading import Event
+from time import clock
+
+from Tribler.Core.defaults import dldefaults
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.StorageWrapper import StorageWrapper
+from Tribler.Core.BitTornado.BT1.WriteCache import WriteCache
+
+DEBUG = True
+
+PIECE_SIZE = 2 ** 18
+BLOCK_SIZE = 2 ** 14
+
+class CountingStorage(Storage):
+    """ Storage that counts the writes it gets """
+    def __init__(self, *args, **kw):
+        Storage.__init__(self, *args, **kw)
+        self.writes = 0
+
+    def write(self, pos, s):
+        self.writes += 1
+        return Storage.write(self, pos, s)
+
+class TestWriteCache(unittest.TestCase):
+    """ Download pieces through the StorageWrapper write buffer """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.storages = []
+        WriteCache.delInstance()
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        shutil.rmtree(self.dir)
+        WriteCache.delInstance()
+
+    def create_wrapper(self, numpieces, write_buffer_size, name = "file"):
+        name = os.path.join(self.dir, name)
+        size = PIECE_SIZE * numpieces
+        data = os.urandom(size)
+        f = open(name, "wb")
+        f.truncate(size)
+        f.close()
+        hashes = [sha(data[i:i + PIECE_SIZE]).digest() for i in xrange(0, size, PIECE_SIZE)]
+
+        config = dldefaults.copy()
+        config['write_buffer_size'] = write_buffer_size
+        storage = CountingStorage([(name, size)], PIECE_SIZE, Event(), config)
+        self.storages.append(storage)
+        self.failure = None
+        wrapper = StorageWrapper({'live': False}, storage, BLOCK_SIZE, hashes, PIECE_SIZE, None,
+                                 lambda: None, self.failed_callback,
+                                 data_flunked = lambda length, index: None,
+                                 backfunc = lambda func, delay = 0, id = None: None, config = config)
+        self.assert_(wrapper.old_style_init())
+        self.assertEquals(wrapper.get_amount_left(), size)
+        return wrapper, name, data
+
+    def failed_callback(self, msg):
+        self.failure = msg
+
+    def download(self, wrapper, data, pieces, shuffle = False):
+        requests = []
+        for index in pieces:
+            while wrapper.do_I_have_requests(index):
+                begin, length = wrapper.new_request(index)
+                requests.append((index, begin, length))
+        if shuffle:
+            # blocks of different pieces arrive interleaved
+            requests.sort(key = lambda r: (r[1], r[0]))
+        for index, begin, length in requests:
+            pos = index * PIECE_SIZE + begin
+            self.assert_(wrapper.piece_came_in(index, begin, [], data[pos:pos + length], None))
+        self.assertEquals(self.failure, None)
+
+    def test_complete_pieces(self):
+        wrapper, name, data = self.create_wrapper(8, 4)
+        self.download(wrapper, data, range(8))
+        self.assert_(wrapper.have.complete())
+        stats = wrapper.get_write_cache_stats()
+        self.assertEquals(stats['hits'], 8)
+        self.assertEquals(stats['misses'], 0)
+        self.assertEquals(stats['blocks'], 8 * PIECE_SIZE / BLOCK_SIZE)
+        # each piece is written at once
+        self.assertEquals(stats['writes'], 8)
+        self.assertEquals(stats['buffered'], 0)
+        wrapper.sync()
+        self.assertEquals(open(name, "rb").read(), data)
+
+    def test_corrupt_piece(self):
+        wrapper, name, data = self.create_wrapper(2, 4)
+        bad = data[:100] + "x" + data[101:]
+        requests = []
+        while wrapper.do_I_have_requests(0):
+            requests.append(wrapper.new_request(0))
+        result = [wrapper.piece_came_in(0, begin, [], bad[begin:begin + length], None)
+                  for begin, length in requests]
+        # the completed piece fails the hash check
+        self.assertEquals(result, [True] * (len(result) - 1) + [False])
+        self.failIf(wrapper.have[0])
+        self.assertEquals(wrapper.get_write_cache_stats()['hits'], 1)
+        self.download(wrapper, data, [0, 1])
+        self.assert_(wrapper.have.complete())
+
+    def test_pressure(self):
+        # the buffer holds less than a piece, so blocks are flushed before
+        # the pieces complete and have to be read back from disk
+        wrapper, name, data = self.create_wrapper(4, 0.1)
+        self.download(wrapper, data, range(4), shuffle = True)
+        self.assert_(wrapper.have.complete())
+        stats = wrapper.get_write_cache_stats()
+        self.assert_(stats['flushes']['pressure'] > 0)
+        self.assert_(stats['misses'] > 0)
+        self.assert_(wrapper.write_buf_size <= wrapper.write_buf_max)
+        wrapper.sync()
+        self.assertEquals(open(name, "rb").read(), data)
+
+    def test_global_limit(self):
+        WriteCache.getInstance().set_max_size(PIECE_SIZE)
+        wrapper1, name1, data1 = self.create_wrapper(4, 4, "file1")
+        wrapper2, name2, data2 = self.create_wrapper(4, 4, "file2")
+        requests = []
+        for wrapper, data in ((wrapper1, data1), (wrapper2, data2)):
+            for index in xrange(4):
+                begin, length = wrapper.new_request(index)
+                pos = index * PIECE_SIZE + begin
+                wrapper.piece_came_in(index, begin, [], data[pos:pos + length], None)
+                self.assert_(WriteCache.getInstance().get_size() <= PIECE_SIZE)
+        self.assertEquals(WriteCache.getInstance().get_size(),
+                          wrapper1.write_buf_size + wrapper2.write_buf_size)
+        wrapper1.sync()
+        wrapper2.sync()
+        self.assertEquals(WriteCache.getInstance().get_size(), 0)
+
+    def test_failed_flush(self):
+        write_cache = WriteCache.getInstance()
+        write_cache.set_max_size(BLOCK_SIZE)
+        wrapper1, name1, data1 = self.create_wrapper(4, 4, "file1")
+        wrapper2, name2, data2 = self.create_wrapper(4, 4, "file2")
+        # wrapper1 can not flush, its data stays buffered and counted
+        wrapper1.flush_oldest_buffer = lambda: False
+        for wrapper, data in ((wrapper1, data1), (wrapper2, data2)):
+            for index in xrange(4):
+                begin, length = wrapper.new_request(index)
+                pos = index * PIECE_SIZE + begin
+                wrapper.piece_came_in(index, begin, [], data[pos:pos + length], None)
+        self.assert_(wrapper1 in write_cache.wrappers)
+        self.assertEquals(wrapper1.write_buf_size, 4 * BLOCK_SIZE)
+        self.assertEquals(wrapper2.write_buf_size, 0)
+        self.assertEquals(write_cache.get_size(), wrapper1.write_buf_size)
+        wrapper1.close()
+        self.assertEquals(write_cache.get_size(), 0)
+
+    def test_close(self):
+        wrapper1, name1, data1 = self.create_wrapper(4, 4, "file1")
+        wrapper2, name2, data2 = self.create_wrapper(4, 4, "file2")
+        for wrapper, data in ((wrapper1, data1), (wrapper2, data2)):
+            begin, length = wrapper.new_request(0)
+            wrapper.piece_came_in(0, begin, [], data[begin:begin + length], None)
+        write_cache = WriteCache.getInstance()
+        self.assertEquals(len(write_cache.wrappers), 2)
+        # a wrapper closed with data in its buffer is forgotten as well
+        wrapper1.close()
+        self.assertEquals(write_cache.wrappers.keys(), [wrapper2])
+        self.assertEquals(write_cache.get_size(), wrapper2.write_buf_size)
+        wrapper2.sync()
+        wrapper2.close()
+        self.assertEquals(write_cache.wrappers, {})
+        self.assertEquals(write_cache.get_size(), 0)
+
+    def test_coalesced_sync(self):
+        wrapper, name, data = self.create_wrapper(4, 4)
+        # receive all but the last block of every piece
+        for index in xrange(4):
+            while wrapper.do_I_have_requests(index):
+                begin, length = wrapper.new_request(index)
+                if begin + length < PIECE_SIZE:
+                    pos = index * PIECE_SIZE + begin
+                    wrapper.piece_came_in(index, begin, [], data[pos:pos + length], None)
+        writes = wrapper.storage.writes
+        wrapper.sync()
+        # 4 runs, interrupted by the missing blocks
+        self.assertEquals(wrapper.storage.writes - writes, 4)
+        self.assertEquals(wrapper.get_write_cache_stats()['flushes']['sync'], 4)
+
+    def test_benchmark_writes(self):
+        """ Measure the CPU time and number of disk writes per GB downloaded
+        without and with the write buffer """
+        numpieces = 64
+        for size in (0, 4):
+            wrapper, name, data = self.create_wrapper(numpieces, size, "bench%d" % size)
+            begin = clock()
+            # a few pieces are in progress at the same time
+            for first in xrange(0, numpieces, 8):
+                self.download(wrapper, data, range(first, first + 8), shuffle = True)
+            wrapper.sync()
+            took = clock() - begin
+            self.assert_(wrapper.have.complete())
+            stats = wrapper.get_write_cache_stats()
+            if DEBUG:
+                print >>sys.stderr, "test: write_buffer_size %d: %.2f CPU seconds per GB, %d writes, %d hits, %d misses" % \
+                      (size, took * 1024 ** 3 / len(data), wrapper.storage.writes, stats['hits'], stats['misses'])
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestWriteCache))
+    return suite
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="test_suite")
@@ -18,6 +18,11 @@
 #   Select the non-dead most popular (3*num_seeders+num_leechers) one which has not been checked in last N seconds
 #   (The default N = 4 hours, so at most 4h/torrentchecking_interval popular peers)
 #
+# Every round all queued torrents, or a few torrents selected using these
+# policies, are checked at once. The TrackerScraper scrapes their trackers
+# concurrently, together with other infohashes of the same trackers, and the
+# results are stored using a single bulk update.
+#
 #===============================================================================
 
 import sys
@@ -29,8 +34,10 @@ from os import path
 import Queue
 
 from Tribler.Core.BitTornado.bencode import bdecode
-from Tribler.TrackerChecking.TrackerChecking import trackerChecking,\
-    multiTrackerChecking
+from Tribler.TrackerChecking.TrackerChecking import getTrackers, mergeStatus,\
+    setTorrentStatus
+from Tribler.TrackerChecking.TrackerScraper import TrackerScraper,\
+    MAX_INFOHASHES_PER_SCRAPE
 
 from Tribler.Core.CacheDB.CacheDBHandler import TorrentDBHandler
 from Tribler.Core.DecentralizedTracking.mainlineDHTChecker import mainlineDHTChecker
@@ -64,6 +71,9 @@ class TorrentChecking(Thread):
         self.gnThreashold = 0.9
         self.interval = interval
         self.queue = Queue.Queue()
+        self.maxTorrentsPerRound = 50
+        self.policyTorrentsPerRound = 5
+        self.scraper = TrackerScraper()
         
         
         self.mldhtchecker = mainlineDHTChecker.getInstance()
@@ -166,112 +176,150 @@ class TorrentChecking(Thread):
         self.sleepEvent.set()
             
     def run(self):
-        """ Gets one torrent from good or unknown list and checks it """
-        #request new infohash from queue
+        """ Gets a batch of torrents from the queue or the database and
+        checks them """
         while True:
             start = time()
             self.sleepEvent.clear()
             
-            fromQueue = False
+            torrents, queued = self.selectTorrents()
+            
             didTrackerCheck = False
+            try:
+                if torrents:
+                    didTrackerCheck = self.checkTorrents(torrents, queued)
+            except:
+                print_exc()
             
+            for _ in queued:
+                self.queue.task_done()
+            
+            # schedule sleep time, only if a tracker was consulted (or there
+            # was nothing to check) and we do not have any infohashes scheduled
+            if (didTrackerCheck or not torrents) and self.queue.qsize() == 0:
+                diff = time() - start
+                remaining = int(self.interval - diff)
+                if remaining > 0:
+                    self.sleepEvent.wait(remaining)
+    
+    def selectTorrents(self):
+        """ Returns the torrents to check in this round and the infohashes
+        that were taken from the queue """
+        torrents = {}
+        queued = []
+        while len(torrents) < self.maxTorrentsPerRound:
             try:
                 infohash = self.queue.get_nowait()
-                fromQueue = True
-                
-                torrent = self.torrentdb.selectTorrentToCheck(infohash=infohash)
-                
-                diff = time() - (torrent['last_check'] or 0)
-                if diff < 1800:
-                    if DEBUG:
-                        print >> sys.stderr, "Torrent Checking: checking too soon:", torrent
-                    continue    
-                
+            except Queue.Empty:
+                break
+            
+            queued.append(infohash)
+            torrent = self.torrentdb.selectTorrentToCheck(infohash=infohash)
+            if not torrent:
+                continue
+            
+            diff = time() - (torrent['last_check'] or 0)
+            if diff < 1800:
                 if DEBUG:
-                    print >> sys.stderr, "Torrent Checking: get value from QUEUE:", torrent
+                    print >> sys.stderr, "Torrent Checking: checking too soon:", torrent
+                continue
             
-            except:
+            if DEBUG:
+                print >> sys.stderr, "Torrent Checking: get value from QUEUE:", torrent
+            torrents[infohash] = torrent
+        
+        if not queued:
+            for _ in xrange(self.policyTorrentsPerRound):
                 policy = self.selectPolicy()
                 torrent = self.torrentdb.selectTorrentToCheck(policy=policy)
-                
+                if torrent:
+                    if DEBUG:
+                        print >> sys.stderr, "Torrent Checking: get value from DB:", torrent
+                    torrents[torrent['infohash']] = torrent
+        
+        return torrents.values(), queued
+    
+    def checkTorrents(self, torrents, queued):
+        """ Scrapes the trackers of all torrents at once, together with other
+        infohashes of the same trackers, and stores the results in bulk.
+        Returns True when a tracker was consulted """
+        requests = {} # tracker: [infohash, ...]
+        checked = []
+        for torrent in torrents:
+            if torrent['infohash'] in queued and torrent['ignored_times'] > 0:
+                #ignoring this torrent
                 if DEBUG:
-                    print >> sys.stderr, "Torrent Checking: get value from DB:", torrent
-                
-            if torrent:
-                notify = []
+                    print >> sys.stderr, 'Torrent Checking: ignoring torrent:', torrent
                 
-                if fromQueue and torrent['ignored_times'] > 0:
-                    #ignoring this torrent
-                    if DEBUG:
-                        print >> sys.stderr, 'Torrent Checking: ignoring torrent:', torrent
-                        
-                    kw = { 'ignored_times': torrent['ignored_times'] -1 }
-                    
-                else:
-                    
-                    # read the torrent from disk / use other sources to specify trackers
-                    torrent = self.readTrackers(torrent)
-                    if self.hasTrackers(torrent):
-                        if DEBUG:
-                            print >> sys.stderr, "Torrent Checking: tracker checking", torrent["info"].get("announce", "") ,torrent["info"].get("announce-list", "")
-                            trackerStart = time()
-                               
-                        multidict = multiTrackerChecking(torrent, self.GetInfoHashesForTracker)
-                        didTrackerCheck = True
-                        if DEBUG:
-                            print >> sys.stderr, "Torrent Checking: tracker checking took ", time() - trackerStart, torrent["info"].get("announce", "") ,torrent["info"].get("announce-list", "")
-                        
-                        for key, values in multidict.iteritems():
-                            if key != torrent['infohash']:
-                                seeder, leecher = values
-                                
-                                if seeder > 0 or leecher > 0:
-                                    #store result
-                                    curkw = {'seeder':seeder, 'leecher':leecher, 'ignored_times': 0, 'last_check_time': long(time()), 'status':'good'}
-                                    self.torrentdb.updateTorrent(key, commit = False, **curkw)
-                                    notify.append(key)
-                    
-                    if not didTrackerCheck:
-                        torrent["seeder"] = -2
-                        torrent["leecher"] = -2
-                        
-                    # Update torrent with new status
-                    self.updateTorrentInfo(torrent)
-
-                    # Save in DB                    
-                    kw = {
-                        'last_check_time': int(time()),
-                        'seeder': torrent['seeder'],
-                        'leecher': torrent['leecher'],
-                        'status': torrent['status'],
-                        'ignored_times': torrent['ignored_times'],
-                        'retried_times': torrent['retried_times']
-                    }
-                    
-                # Must come after tracker check, such that if tracker dead and DHT still alive, the
-                # status is still set to good
                 if torrent['status'] == 'dead':
                     self.mldhtchecker.lookup(torrent['infohash'])
+                self.torrentdb.updateTorrent(torrent['infohash'], ignored_times = torrent['ignored_times'] - 1)
+                continue
             
-                if DEBUG:
-                    print >> sys.stderr, "Torrent Checking: new status:", kw
+            # read the torrent from disk / use other sources to specify trackers
+            torrent = self.readTrackers(torrent)
+            torrent['trackers'] = []
+            if self.hasTrackers(torrent):
+                torrent['trackers'] = [tracker for tracker in getTrackers(torrent) if self.scraper.supports(tracker)]
+                for tracker in torrent['trackers']:
+                    infohashes = requests.setdefault(tracker, [])
+                    if torrent['infohash'] not in infohashes:
+                        infohashes.append(torrent['infohash'])
+            checked.append(torrent)
+        
+        for tracker, infohashes in requests.iteritems():
+            for infohash in self.GetInfoHashesForTracker(tracker):
+                if infohash not in infohashes:
+                    infohashes.append(infohash)
+        
+        if DEBUG:
+            print >> sys.stderr, "Torrent Checking: scraping", len(requests), "trackers for", len(checked), "torrents"
+            trackerStart = time()
+        
+        multidict = {}
+        for announce_dict in self.scraper.scrape(requests).itervalues():
+            mergeStatus(multidict, announce_dict)
+        
+        if DEBUG:
+            print >> sys.stderr, "Torrent Checking: scraping took", time() - trackerStart, self.scraper.get_stats()
+        
+        now = long(time())
+        checks = []
+        for torrent in checked:
+            infohash = torrent['infohash']
+            if torrent['trackers']:
+                seeder, leecher = multidict.get(infohash, (-2, -2))
+                setTorrentStatus(torrent, seeder, leecher)
+            else:
+                torrent["seeder"] = -2
+                torrent["leecher"] = -2
             
-                self.torrentdb.updateTorrent(torrent['infohash'], **kw)
-                
-                #notify after commit
-                for infohash in notify:
-                    self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
+            # Update torrent with new status
+            self.updateTorrentInfo(torrent)
             
-            if fromQueue:
-                self.queue.task_done()
+            # Must come after tracker check, such that if tracker dead and DHT still alive, the
+            # status is still set to good
+            if torrent['status'] == 'dead':
+                self.mldhtchecker.lookup(infohash)
             
-            # schedule sleep time, only if a tracker was consulted and 
-            # we do not have any infohashes scheduled
-            if didTrackerCheck and self.queue.qsize() == 0:
-                diff = time() - start
-                remaining = int(self.interval - diff)
-                if remaining > 0:
-                    self.sleepEvent.wait(remaining)
+            if DEBUG:
+                print >> sys.stderr, "Torrent Checking: new status:", torrent
+            
+            checks.append((infohash, torrent['seeder'], torrent['leecher'], torrent['status'], now, torrent['ignored_times'], torrent['retried_times']))
+        
+        checked_infohashes = set(torrent['infohash'] for torrent in checked)
+        for infohash, (seeder, leecher) in multidict.iteritems():
+            if infohash not in checked_infohashes and (seeder > 0 or leecher > 0):
+                checks.append((infohash, seeder, leecher, 'good', now, 0, None))
+        
+        if checks:
+            self.torrentdb.updateTorrentChecks(checks)
+            
+            #notify after commit
+            for check in checks:
+                self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, check[0])
+        
+        return len(requests) > 0
             
 #===============================================================================
 #    def tooFast(self, torrent):
@@ -313,7 +361,7 @@ class TorrentChecking(Thread):
     def GetInfoHashesForTracker(self, tracker):
         try:
             max_last_check = int(time()) - 4*60*60
-            return self.torrentdb.getTorrentsFromTracker(tracker, max_last_check, 10)
+            return self.torrentdb.getTorrentsFromTracker(tracker, max_last_check, MAX_INFOHASHES_PER_SCRAPE - 1)
         
         except UnicodeDecodeError:
             return []
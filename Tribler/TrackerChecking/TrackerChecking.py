@@ -25,7 +25,24 @@ def single_no_thread(torrent, multiscrapeCallback = None):
     multi_announce_dict = {} 
     multi_announce_dict[torrent['infohash']] = (-2, -2)
     
-    #determine trackers
+    trackers = [tracker for tracker in getTrackers(torrent) if tracker.startswith('http')]
+    for announce in trackers:
+        announce_dict = singleTrackerStatus(torrent, announce, multiscrapeCallback)
+        mergeStatus(multi_announce_dict, announce_dict)
+                
+        (seeder, _) = multi_announce_dict[torrent["infohash"]]
+        if seeder > 0:
+            break
+    
+    #modify original torrent
+    (seeder, leecher) = multi_announce_dict[torrent["infohash"]]
+    setTorrentStatus(torrent, seeder, leecher)
+    
+    return multi_announce_dict
+
+def getTrackers(torrent):
+    """ Returns the announce urls of a torrent, at most 10 per tier of the
+    announce-list """
     trackers = []
     if (torrent["info"].get("announce-list", "")==""):  # no announce-list
         trackers.append(torrent["info"]["announce"])
@@ -39,34 +56,25 @@ def single_no_thread(torrent, multiscrapeCallback = None):
                 trackers.append(announces[0])
                 
             else:                                       # length > 1
-                aindex = torrent["info"]["announce-list"].index(announces)                                    
                 shuffle(announces)
                 
                 # Arno: protect against DoS torrents with many trackers in announce list. 
                 trackers.extend(announces[:10])
-    
+    return trackers
 
-    trackers = [tracker for tracker in trackers if tracker.startswith('http')]
-    for announce in trackers:
-        announce_dict = singleTrackerStatus(torrent, announce, multiscrapeCallback)
-        
-        for key, values in announce_dict.iteritems():
-            
-            #merge results
-            if key in multi_announce_dict:
-                cur_values = list(multi_announce_dict[key])
-                cur_values[0] = max(values[0], cur_values[0])
-                cur_values[1] = max(values[1], cur_values[1])
-                multi_announce_dict[key] = cur_values
-            else:
-                multi_announce_dict[key] = values
-                
-        (seeder, _) = multi_announce_dict[torrent["infohash"]]
-        if seeder > 0:
-            break
-    
-    #modify original torrent
-    (seeder, leecher) = multi_announce_dict[torrent["infohash"]]
+def mergeStatus(multi_announce_dict, announce_dict):
+    """ Merges the (seeder, leecher) results of one tracker into those of
+    the previous trackers """
+    for key, values in announce_dict.iteritems():
+        if key in multi_announce_dict:
+            cur_values = multi_announce_dict[key]
+            multi_announce_dict[key] = (max(values[0], cur_values[0]), max(values[1], cur_values[1]))
+        else:
+            multi_announce_dict[key] = values
+
+def setTorrentStatus(torrent, seeder, leecher):
+    """ Sets the seeder, leecher, status and last_check_time of a checked
+    torrent """
     if (seeder == -3 and leecher == -3):
         pass        # if interval problem, just keep the last status
     else:
@@ -87,8 +95,6 @@ def single_no_thread(torrent, multiscrapeCallback = None):
             torrent["leecher"] = -2
             
     torrent["last_check_time"] = long(time())
-    
-    return multi_announce_dict
 
 def singleTrackerStatus(torrent, announce, multiscrapeCallback):
     # return (-1, -1) means the status of torrent is unknown
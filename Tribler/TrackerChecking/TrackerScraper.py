@@ -0,0 +1,350 @@
+# see LICENSE.txt for license information
+#
+# Asynchronous batched tracker scraping
+# =====================================
+#
+# The TrackerScraper scrapes the number of seeders and leechers of many
+# infohashes at many trackers at once. The infohashes of a tracker are split
+# into scrapes of at most MAX_INFOHASHES_PER_SCRAPE infohashes, and at most
+# max_connections scrapes are in progress at the same time. All scrapes run on
+# non-blocking sockets from a single select loop on the calling thread.
+#
+# Both HTTP scrape (the /scrape convention) and UDP scrape (BEP 15) are
+# supported. Host names are resolved with a blocking lookup, the results are
+# cached for DNS_CACHE_TIME seconds.
+#
+# The results use the same values as TrackerChecking:
+#   (seeder, leecher) the status of the infohash at the tracker
+#   (-1, -1)          the tracker could not be reached
+#   (-3, -3)          the tracker asks us to scrape less often
+# Infohashes the tracker does not know are left out.
+
+import sys
+import socket
+import errno
+from select import select
+from select import error as select_error
+from struct import pack, unpack
+from random import randint
+from time import time
+from urlparse import urlparse
+from traceback import print_exc
+
+from Tribler.Core.BitTornado.bencode import bdecode
+from Tribler.TrackerChecking.TrackerChecking import getUrl
+
+DEBUG = False
+
+MAX_INFOHASHES_PER_SCRAPE = 50
+MAX_CONNECTIONS = 50
+SCRAPE_TIMEOUT = 30 # seconds
+UDP_RETRY_INTERVAL = 5 # seconds
+DNS_CACHE_TIME = 30 * 60 # seconds
+MAX_RESPONSE_SIZE = 1024 * 1024
+
+UDP_PROTOCOL_ID = 0x41727101980
+UDP_ACTION_CONNECT = 0
+UDP_ACTION_SCRAPE = 2
+UDP_ACTION_ERROR = 3
+
+class Scrape:
+    """ A scrape of a list of infohashes at a single tracker """
+
+    def __init__(self, tracker, infohashes, deadline):
+        self.tracker = tracker
+        self.infohashes = infohashes
+        self.deadline = deadline
+        self.sock = None
+        self.result = None
+        self.error = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def is_done(self):
+        return self.result is not None
+
+    def wants_write(self):
+        return False
+
+    def next_timeout(self):
+        return self.deadline
+
+    def check_timeout(self, now):
+        if now >= self.deadline:
+            if DEBUG:
+                print >>sys.stderr, "TrackerScraper: timeout", self.tracker
+            self.failed()
+
+    def failed(self):
+        self.error = True
+        self.result = dict((infohash, (-1, -1)) for infohash in self.infohashes)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+class HTTPScrape(Scrape):
+    def __init__(self, tracker, infohashes, deadline, address, host, path):
+        Scrape.__init__(self, tracker, infohashes, deadline)
+        self.connected = False
+        self.outbuf = "GET %s HTTP/1.0\r\nHost: %s\r\nUser-Agent: Tribler\r\nConnection: close\r\n\r\n" % (path, host)
+        self.inbuf = []
+        self.insize = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        err = self.sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self.failed()
+
+    def wants_write(self):
+        return bool(self.outbuf)
+
+    def handle_write(self):
+        try:
+            if not self.connected:
+                err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    self.failed()
+                    return
+                self.connected = True
+
+            sent = self.sock.send(self.outbuf)
+            self.outbuf = self.outbuf[sent:]
+        except socket.error:
+            self.failed()
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, e:
+            if e[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.failed()
+            return
+
+        if data:
+            self.inbuf.append(data)
+            self.insize += len(data)
+            if self.insize > MAX_RESPONSE_SIZE:
+                self.failed()
+        else:
+            self.parse_response("".join(self.inbuf))
+
+    def parse_response(self, response):
+        header, _, body = response.partition("\r\n\r\n")
+        status = header.split("\r\n", 1)[0].split()
+        if len(status) < 2 or status[1] != "200":
+            if DEBUG:
+                print >>sys.stderr, "TrackerScraper: bad HTTP status", self.tracker, status
+            self.failed()
+            return
+
+        result = {}
+        try:
+            response_dict = bdecode(body)
+            if "files" in response_dict:
+                for infohash, status in response_dict["files"].iteritems():
+                    result[infohash] = (max(0, status["complete"]), max(0, status["incomplete"]))
+
+            elif "min_request_interval" in response_dict.get("flags", {}):
+                # may be interval problem
+                for infohash in self.infohashes:
+                    result[infohash] = (-3, -3)
+        except:
+            if DEBUG:
+                print_exc()
+        self.result = result
+
+class UDPScrape(Scrape):
+    def __init__(self, tracker, infohashes, deadline, address):
+        Scrape.__init__(self, tracker, infohashes, deadline)
+        self.connection_id = None
+        self.transaction_id = None
+        self.packet = None
+        self.next_send = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(0)
+        try:
+            self.sock.connect(address)
+            self.send(pack("!QII", UDP_PROTOCOL_ID, UDP_ACTION_CONNECT, self.new_transaction()))
+        except socket.error:
+            self.failed()
+
+    def new_transaction(self):
+        self.transaction_id = randint(0, 2**31-1)
+        return self.transaction_id
+
+    def send(self, packet):
+        self.packet = packet
+        self.next_send = time() + UDP_RETRY_INTERVAL
+        self.sock.send(packet)
+
+    def next_timeout(self):
+        return min(self.deadline, self.next_send)
+
+    def check_timeout(self, now):
+        Scrape.check_timeout(self, now)
+        if not self.is_done() and now >= self.next_send:
+            # retransmit the last request
+            try:
+                self.send(self.packet)
+            except socket.error:
+                self.failed()
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, e:
+            if e[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.failed()
+            return
+
+        if len(data) < 8:
+            return
+        action, transaction_id = unpack("!II", data[:8])
+        if transaction_id != self.transaction_id:
+            return
+
+        if action == UDP_ACTION_CONNECT and self.connection_id is None and len(data) >= 16:
+            self.connection_id, = unpack("!Q", data[8:16])
+            try:
+                self.send(pack("!QII", self.connection_id, UDP_ACTION_SCRAPE, self.new_transaction()) + "".join(self.infohashes))
+            except socket.error:
+                self.failed()
+
+        elif action == UDP_ACTION_SCRAPE and self.connection_id is not None:
+            result = {}
+            for index, infohash in enumerate(self.infohashes):
+                offset = 8 + 12 * index
+                if offset + 12 > len(data):
+                    break
+                seeders, _, leechers = unpack("!III", data[offset:offset + 12])
+                result[infohash] = (seeders, leechers)
+            self.result = result
+
+        elif action == UDP_ACTION_ERROR:
+            if DEBUG:
+                print >>sys.stderr, "TrackerScraper: error from", self.tracker, data[8:]
+            self.failed()
+
+class TrackerScraper:
+    """ Scrapes many infohashes at many trackers concurrently """
+
+    def __init__(self, max_connections = MAX_CONNECTIONS, timeout = SCRAPE_TIMEOUT):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.dns_cache = {} # host: (ip, expires), ip is None when it could not be resolved
+
+        self.num_scrapes = 0
+        self.num_failed = 0
+        self.num_infohashes = 0
+
+    def supports(self, tracker):
+        return tracker.startswith('http://') or tracker.startswith('udp://')
+
+    def scrape(self, trackers):
+        """ Scrapes the infohashes in trackers, a dictionary with a list of
+        infohashes per announce url. Returns a dictionary with a dictionary
+        infohash: (seeder, leecher) per announce url """
+        pending = []
+        for tracker, infohashes in trackers.iteritems():
+            if self.supports(tracker):
+                for i in xrange(0, len(infohashes), MAX_INFOHASHES_PER_SCRAPE):
+                    pending.append((tracker, infohashes[i:i+MAX_INFOHASHES_PER_SCRAPE]))
+        pending.reverse()
+
+        results = {}
+        active = []
+        while pending or active:
+            while pending and len(active) < self.max_connections:
+                tracker, infohashes = pending.pop()
+                active.append(self.create_scrape(tracker, infohashes))
+
+            waiting = [scrape for scrape in active if not scrape.is_done()]
+            if waiting:
+                now = time()
+                timeout = max(0, min(scrape.next_timeout() for scrape in waiting) - now)
+                try:
+                    readable, writable, _ = select(waiting, [scrape for scrape in waiting if scrape.wants_write()], [], timeout)
+                except select_error, e:
+                    if e[0] == errno.EINTR:
+                        continue
+                    raise
+
+                for scrape in writable:
+                    scrape.handle_write()
+                for scrape in readable:
+                    if not scrape.is_done():
+                        scrape.handle_read()
+
+                now = time()
+                for scrape in waiting:
+                    if not scrape.is_done():
+                        scrape.check_timeout(now)
+
+            still_active = []
+            for scrape in active:
+                if scrape.is_done():
+                    scrape.close()
+                    if scrape.error:
+                        self.num_failed += 1
+                    results.setdefault(scrape.tracker, {}).update(scrape.result)
+                else:
+                    still_active.append(scrape)
+            active = still_active
+        return results
+
+    def create_scrape(self, tracker, infohashes):
+        self.num_scrapes += 1
+        self.num_infohashes += len(infohashes)
+        deadline = time() + self.timeout
+
+        scrape = None
+        try:
+            _, netloc, path, _, query, _ = urlparse(tracker)
+            host, _, port = netloc.rpartition('@')[2].partition(':')
+            ip = self.resolve(host)
+            if ip:
+                if tracker.startswith('udp://'):
+                    scrape = UDPScrape(tracker, infohashes, deadline, (ip, int(port)))
+                else:
+                    url = getUrl(tracker, infohashes)
+                    _, _, path, params, query, _ = urlparse(url)
+                    if params:
+                        path += ';' + params
+                    scrape = HTTPScrape(tracker, infohashes, deadline, (ip, int(port or 80)), netloc, (path or '/') + '?' + query)
+        except:
+            if DEBUG:
+                print_exc()
+
+        if scrape is None:
+            scrape = Scrape(tracker, infohashes, deadline)
+            scrape.failed()
+
+        if DEBUG:
+            print >>sys.stderr, "TrackerScraper: scraping", len(infohashes), "infohashes at", tracker
+        return scrape
+
+    def resolve(self, host):
+        now = time()
+        ip, expires = self.dns_cache.get(host, (None, 0))
+        if expires < now:
+            try:
+                ip = socket.gethostbyname(host)
+            except socket.error:
+                if DEBUG:
+                    print >>sys.stderr, "TrackerScraper: could not resolve", host
+                ip = None
+            self.dns_cache[host] = (ip, now + DNS_CACHE_TIME)
+        return ip
+
+    def get_stats(self):
+        return {'scrapes': self.num_scrapes, 'failed': self.num_failed, 'infohashes': self.num_infohashes}
@@ -24,4 +24,10 @@ def start():
     run_bgapp("SwarmPlayer","2.0.0",I2I_LISTENPORT,BG_LISTENPORT,VIDEOHTTP_LISTENPORT,killonidle=True)
 
 if __name__ == '__main__':
+    # worker processes of the frozen build start this executable again
+    try:
+        from multiprocessing import freeze_support
+        freeze_support()
+    except ImportError:
+        pass
     start()
@@ -108,6 +108,6 @@ class AllChannelConversion(BinaryConversion):
 
     #     return offset, placeholder.meta.payload.implement(infohash)
 
-    def decode_message(self, address, data):
+    def decode_message(self, address, data, verified=False):
         self._address = address
-        return super(AllChannelConversion, self).decode_message(address, data)
+        return super(AllChannelConversion, self).decode_message(address, data, verified)
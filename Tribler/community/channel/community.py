@@ -16,6 +16,7 @@ from Tribler.Core.dispersy.distribution import FullSyncDistribution, DirectDistr
 from Tribler.Core.dispersy.destination import CandidateDestination, CommunityDestination
 
 from message import DelayMessageReqChannelMessage
+from messagecache import DecodedMessageCache
 from threading import currentThread, Event
 from traceback import print_stack
 import sys
@@ -89,6 +90,8 @@ class ChannelCommunity(Community):
         self.integrate_with_tribler = integrate_with_tribler
         
         self._channel_id = None
+        # sync id:Message.Implementation pairs, see _get_message_from_dispersy_id
+        self._decoded_messages = DecodedMessageCache()
         # self._last_sync_range = None
         # self._last_sync_space_remaining = 0
         
@@ -185,6 +188,15 @@ class ChannelCommunity(Community):
             disp_undo_moderation = dummy_function
             disp_undo_mark_torrent = dummy_function
 
+        # undone messages must be decoded again when they are requested
+        disp_undo_torrent = self._forget_undone(disp_undo_torrent)
+        disp_undo_playlist = self._forget_undone(disp_undo_playlist)
+        disp_undo_comment = self._forget_undone(disp_undo_comment)
+        disp_undo_modification = self._forget_undone(disp_undo_modification)
+        disp_undo_playlist_torrent = self._forget_undone(disp_undo_playlist_torrent)
+        disp_undo_moderation = self._forget_undone(disp_undo_moderation)
+        disp_undo_mark_torrent = self._forget_undone(disp_undo_mark_torrent)
+
         # 30/11/11 Boudewijn: we frequently see dropped packets when joining a channel.  this can be
         # caused when a sync results in both torrent and modification messages.  when the
         # modification messages are processed first they will all cause the associated torrent
@@ -987,6 +999,11 @@ class ChannelCommunity(Community):
         if self._channel_id:
             self._channelcast_db.on_dynamic_settings(self._channel_id)
     
+    def dispersy_malicious_member_detected(self, member, packets):
+        Community.dispersy_malicious_member_detected(self, member, packets)
+        # all messages created by the malicious member are removed from the sync table
+        self._decoded_messages.clear()
+    
     #helper functions
     @forceAndReturnDispersyThread
     def _get_latest_channel_message(self):
@@ -995,14 +1012,13 @@ class ChannelCommunity(Community):
         # 1. get the packet
         try:
             packet, packet_id = self._dispersy.database.execute(u"SELECT packet, id FROM sync WHERE meta_message = ? ORDER BY global_time DESC LIMIT 1",
-                                                                (channel_meta.database_id,)).next()
+                                                                           (channel_meta.database_id,)).next()
         except StopIteration:
             raise RuntimeError("Could not find requested packet")
 
-        message = self._dispersy.convert_packet_to_message(str(packet))
+        message = self._decoded_messages.get(packet_id) or self._decode_stored_packet(packet, packet_id)
         if message:
             assert message.name == u"channel", "Expecting a 'channel' message"
-            message.packet_id = packet_id
         else:
             raise RuntimeError("unable to convert packet")
 
@@ -1085,7 +1101,6 @@ class ChannelCommunity(Community):
                 if prev_global_time >= max_global_time:
                     message = self._get_message_from_dispersy_id(dispersy_id, 'modification')
                     if message:
-                        message = message.load_message()
                         conflicting_messages.append(message)
                     
                         max_global_time = prev_global_time
@@ -1113,22 +1128,42 @@ class ChannelCommunity(Community):
     
     @forceAndReturnDispersyThread
     def _get_message_from_dispersy_id(self, dispersy_id, messagename):
-        # 1. get the packet
-        try:
-            packet, packet_id = self._dispersy.database.execute(u"SELECT packet, id FROM sync WHERE id = ?", (dispersy_id,)).next()
-        except StopIteration:
-            raise RuntimeError("Unknown dispersy_id %d" % dispersy_id)
+        message = self._decoded_messages.get(dispersy_id)
+        if not message:
+            # 1. get the packet
+            try:
+                packet, = self._dispersy.database.execute(u"SELECT packet FROM sync WHERE id = ?", (dispersy_id,)).next()
+            except StopIteration:
+                raise RuntimeError("Unknown dispersy_id %d" % dispersy_id)
 
-        message = self._dispersy.convert_packet_to_message(str(packet))
-        if message:
-            assert not messagename or message.name == messagename, [dispersy_id, messagename, message.name]
-            message.packet_id = packet_id
-        else:
-            raise RuntimeError("unable to convert packet with dispersy_id %d" % dispersy_id)
-        
+            message = self._decode_stored_packet(packet, dispersy_id)
+            if not message:
+                raise RuntimeError("unable to convert packet with dispersy_id %d" % dispersy_id)
+
+        assert not messagename or message.name == messagename, [dispersy_id, messagename, message.name]
         if not messagename or message.name == messagename:
             return message
     
+    def _decode_stored_packet(self, packet, packet_id):
+        """
+        Returns the message for PACKET, stored in the sync table with PACKET_ID, or None when it
+        can not be decoded.  The message is cached.
+        """
+        # the signature was verified before the packet was stored
+        message = self._dispersy.convert_packet_to_message(str(packet), verified=True)
+        if message:
+            message.packet_id = packet_id
+            self._decoded_messages.add(message)
+        return message
+    
+    def _forget_undone(self, undo_callback):
+        def forget_undone(descriptors):
+            for _, _, packet in descriptors:
+                self._decoded_messages.remove(packet.packet_id)
+            return undo_callback(descriptors)
+        forget_undone.__name__ = undo_callback.__name__
+        return forget_undone
+    
     @forceAndReturnDispersyThread
     def _get_packet_id(self, global_time, mid):
         if global_time and mid:
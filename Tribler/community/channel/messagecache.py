@@ -0,0 +1,111 @@
+"""
+The messagecache module keeps recently decoded ChannelCommunity messages.
+
+ChannelCommunity resolves playlists, torrents, comments, and modifications to the dispersy message
+that created them by reading the packet from the sync table and decoding it.  Rendering or
+syncing a large channel resolves the same packets many times.  The DecodedMessageCache keeps the
+decoded Message.Implementation instances by their sync table id, hence a packet is only decoded
+again after it was evicted, undone, or deleted.
+"""
+
+class DecodedMessageCache(object):
+    """
+    Remembers packet_id:Message.Implementation pairs for at most MAX_ENTRIES packets.
+
+    The entries are kept in two generations.  Lookups move an entry to the new generation, when
+    the new generation is full the old generation is discarded.  This approximates a least recently
+    used policy at a constant cost per operation.
+    """
+    def __init__(self, max_entries=5000):
+        assert isinstance(max_entries, int)
+        assert max_entries >= 2
+        self._max_generation = max_entries // 2
+        self._new = {}
+        self._old = {}
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._new) + len(self._old)
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def _add(self, packet_id, message):
+        if len(self._new) >= self._max_generation:
+            self._old = self._new
+            self._new = {}
+        self._new[packet_id] = message
+
+    def add(self, message):
+        """
+        Remember MESSAGE, its packet_id must be set.
+        """
+        assert message.packet_id
+        self._old.pop(message.packet_id, None)
+        self._add(message.packet_id, message)
+
+    def get(self, packet_id):
+        """
+        Returns the message with PACKET_ID or None when it is not cached.
+        """
+        message = self._new.get(packet_id)
+        if message is None:
+            message = self._old.pop(packet_id, None)
+            if message is None:
+                self._misses += 1
+                return None
+            self._add(packet_id, message)
+        self._hits += 1
+        return message
+
+    def remove(self, packet_id):
+        """
+        Forget the message with PACKET_ID, used when it is undone or deleted.
+        """
+        self._new.pop(packet_id, None)
+        self._old.pop(packet_id, None)
+
+    def clear(self):
+        self._new.clear()
+        self._old.clear()
+
+    def info(self):
+        """
+        Returns a dictionary with the number of cached messages, hits, and misses.
+        """
+        return {"size":len(self), "hits":self._hits, "misses":self._misses}
+
+if __debug__:
+    if __name__ == "__main__":
+        class Message(object):
+            def __init__(self, packet_id):
+                self.packet_id = packet_id
+
+        cache = DecodedMessageCache(4)
+        messages = [Message(packet_id) for packet_id in xrange(1, 7)]
+        for message in messages[:3]:
+            cache.add(message)
+        assert all(cache.get(message.packet_id) is message for message in messages[:3])
+        assert cache.get(99) is None
+        assert cache.hits == 3 and cache.misses == 1
+
+        # adding more than MAX_ENTRIES evicts the least recently used messages
+        cache.add(messages[3])
+        cache.add(messages[4])
+        cache.add(messages[5])
+        assert len(cache) <= 4
+        assert cache.get(messages[5].packet_id) is messages[5]
+
+        # undone or deleted messages are removed
+        cache.remove(messages[5].packet_id)
+        assert cache.get(messages[5].packet_id) is None
+        cache.clear()
+        assert len(cache) == 0
+
+        print "DecodedMessageCache tests passed"
@@ -1,9 +1,12 @@
+from time import time
+
 from community import ChannelCommunity
 
 from Tribler.Core.dispersy.crypto import ec_generate_key, ec_to_public_bin, ec_to_private_bin
 from Tribler.Core.dispersy.member import Member
 from Tribler.Core.dispersy.script import ScriptBase
 from Tribler.Core.dispersy.debug import Node
+from Tribler.Core.dispersy.dprint import dprint
 
 class ChannelNode(Node):
     def create_channel(self, name, description, global_time):
@@ -19,6 +22,7 @@ class ChannelScript(ScriptBase):
 
         self.caller(self.test_incoming_channel)
         self.caller(self.test_outgoing_channel)
+        self.caller(self.test_decoded_message_cache)
 
     def test_incoming_channel(self):
         """
@@ -66,3 +70,37 @@ class ChannelScript(ScriptBase):
 
         # cleanup
         community.create_dispersy_destroy_community(u"hard-kill")
+
+    def test_decoded_message_cache(self):
+        """
+        SELF resolves its own 'torrent' messages by their dispersy id, the second time from the
+        decoded message cache.
+        """
+        community = ChannelCommunity.create_community(self._my_member, integrate_with_tribler=False)
+        community.create_channel(u"cache channel name", u"cache channel description")
+        yield 0.1
+
+        torrents = [(str(i).zfill(20), 1000 + i, u"torrent #%d" % i, ((u"file #%d" % i, 1024),), ()) for i in xrange(500)]
+        messages = community._disp_create_torrents(torrents, update=False, forward=False)
+        dispersy_ids = [message.packet_id for message in messages]
+        yield 0.1
+
+        begin = time()
+        decoded = [community._get_message_from_dispersy_id(dispersy_id, u"torrent") for dispersy_id in dispersy_ids]
+        decode_time = time() - begin
+        assert [message.payload.name for message in decoded] == [name for _, _, name, _, _ in torrents]
+
+        begin = time()
+        cached = [community._get_message_from_dispersy_id(dispersy_id, u"torrent") for dispersy_id in dispersy_ids]
+        cache_time = time() - begin
+        assert all(a is b for a, b in zip(decoded, cached))
+        dprint("resolved ", len(dispersy_ids), " torrents in ", "%.3f" % decode_time, "s when decoding and in ", "%.3f" % cache_time, "s from the cache", force=True)
+
+        # an undone message is decoded again
+        community.remove_torrents(dispersy_ids[:1])
+        yield 0.1
+        assert community._get_message_from_dispersy_id(dispersy_ids[0], u"torrent") is not decoded[0]
+        assert community._get_message_from_dispersy_id(dispersy_ids[1], u"torrent") is decoded[1]
+
+        # cleanup
+        community.create_dispersy_destroy_community(u"hard-kill")
@@ -608,6 +608,7 @@ CREATE VIEW TorrentMarkings AS SELECT * FROM _TorrentMarkings WHERE deleted_at I
 CREATE INDEX IF NOT EXISTS TorMarkIndex ON _TorrentMarkings(channeltorrent_id);
 
 CREATE VIRTUAL TABLE FullTextIndex USING fts3(swarmname, filenames, fileextensions);
+CREATE VIRTUAL TABLE ChannelFullTextIndex USING fts3(name);
 
 -------------------------------------
 
@@ -633,7 +634,7 @@ INSERT INTO TorrentStatus VALUES (2, 'dead', NULL);
 INSERT INTO TorrentSource VALUES (0, '', 'Unknown');
 INSERT INTO TorrentSource VALUES (1, 'BC', 'Received from other user');
 
-INSERT INTO MyInfo VALUES ('version', 11);
+INSERT INTO MyInfo VALUES ('version', 12);
 
 INSERT INTO MetaDataTypes ('name') VALUES ('name');
 INSERT INTO MetaDataTypes ('name') VALUES ('description');